@@ -37,10 +37,28 @@ def run_server():
     sys.path.append(backend_dir)
     
     port = int(os.environ.get("PORT", 10000))
-    logger.info(f"Starting Backend Server at http://0.0.0.0:{port}")
+    # Production defaults: no reloader; WORKERS processes share caches and the
+    # index through the files under backend/data (see SHARED_STATE_PATH)
+    workers = int(os.environ.get("WORKERS", os.environ.get("WEB_CONCURRENCY", "1")))
+    reload = os.environ.get("RELOAD", "0") == "1"
+    if reload and workers > 1:
+        logger.warning("RELOAD=1 only supports a single worker; ignoring WORKERS.")
+        workers = 1
+    logger.info(f"Starting Backend Server at http://0.0.0.0:{port} ({workers} worker(s){', reload' if reload else ''})")
+    # Workers inherit PROMETHEUS_MULTIPROC_DIR, so /metrics covers all of them
+    from telemetry import prepare_multiprocess_metrics
+    prepare_multiprocess_metrics(workers, os.path.join(backend_dir, "data", "prometheus"))
     
     try:
-        uvicorn.run("backend.main:app", host="0.0.0.0", port=port, reload=True)
+        uvicorn.run(
+            "backend.main:app",
+            host="0.0.0.0",
+            port=port,
+            workers=workers,
+            reload=reload,
+            # On SIGTERM, in-flight requests get this long to finish
+            timeout_graceful_shutdown=int(os.environ.get("GRACEFUL_SHUTDOWN_TIMEOUT", "30"))
+        )
     except KeyboardInterrupt:
         logger.info("Server stopped by user.")
     except Exception as e:
@@ -0,0 +1,268 @@
+import os
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+# Joins scope and normalised query in cache keys
+SCOPE_SEPARATOR = "\x1f"
+
+
+class AnswerCache:
+    """Caches generated answers for repeated and near-duplicate questions.
+
+    Lookups first try the normalised query text, then the cosine similarity
+    of the query embedding against every cached question. Entries expire
+    after ttl_seconds, the least recently used entry is evicted when full,
+    and everything is dropped when the corpus version changes so that newly
+    ingested documents are never hidden behind a stale answer.
+
+    With a path, answers are also written to a SQLite table that worker
+    processes share: before each lookup, answers other workers stored for
+    the current version since the last lookup are loaded into memory.
+
+    A scope (e.g. the collection and filter a question was asked with)
+    partitions the cache: answers are only served to lookups of the same scope.
+    Shared answers are tagged with embedding_space (the embedding provider,
+    model and dimension), so a restart with another embedding model never
+    loads question vectors from a different space.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600, similarity_threshold: float = 0.95,
+                 path: Optional[str] = None, embedding_space: str = ""):
+        self.max_entries = max_entries
+        self.embedding_space = embedding_space
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+
+        self._lock = threading.Lock()
+        self._version = None
+        # normalised query -> (slot, created_at, result)
+        self._entries: "OrderedDict[str, Tuple[int, float, Dict[str, Any]]]" = OrderedDict()
+        # Embedding matrix with one row per slot; _slot_keys maps rows back to entries
+        self._matrix: Optional[np.ndarray] = None
+        self._slot_keys: List[Optional[str]] = [None] * max_entries
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        self._db = None
+        # Highest shared row already loaded
+        self._synced_seq = 0
+        if path and max_entries > 0:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            # Autocommit; writes take the lock up front with BEGIN IMMEDIATE
+            self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, seq INTEGER NOT NULL, version INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, embedding BLOB NOT NULL, result TEXT NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS answers_seq ON answers (seq)")
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(answers)")}
+            if "space" not in columns:
+                # Tables from before embedding spaces; their rows never match a space
+                self._db.execute("ALTER TABLE answers ADD COLUMN space TEXT NOT NULL DEFAULT ''")
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        query = re.sub(r"\s+", " ", query.strip().lower())
+        return query.rstrip("?!. ")
+
+    @classmethod
+    def _key(cls, query: str, scope: str) -> str:
+        # normalize() turns the separator (whitespace to `re`) into a space and
+        # scopes are JSON, which escapes it, so it only appears between the two
+        return f"{scope}{SCOPE_SEPARATOR}{cls.normalize(query)}" if scope else cls.normalize(query)
+
+    @staticmethod
+    def _scope_of(key: str) -> str:
+        return key.split(SCOPE_SEPARATOR, 1)[0] if SCOPE_SEPARATOR in key else ""
+
+    def get_exact(self, query: str, version: int, scope: str = "") -> Optional[Dict[str, Any]]:
+        """Returns the result cached for exactly this (normalised) query, without
+        needing its embedding. A miss isn't counted: callers follow up with get()."""
+        if self.max_entries <= 0:
+            return None
+        key = self._key(query, scope)
+
+        with self._lock:
+            if not self._check_version(version):
+                return None
+            self._sync(version)
+            entry = self._fresh_entry(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry[2]
+
+    def get(self, query: str, embedding: List[float], version: int, scope: str = "") -> Optional[Dict[str, Any]]:
+        """Returns the cached result for query (or a near-duplicate of it asked
+        in the same scope), if any."""
+        if self.max_entries <= 0:
+            return None
+        key = self._key(query, scope)
+
+        with self._lock:
+            if not self._check_version(version):
+                self.misses += 1
+                return None
+            self._sync(version)
+
+            entry = self._fresh_entry(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry[2]
+
+            if self._matrix is not None and self._entries and len(embedding) == self._matrix.shape[1]:
+                q = np.asarray(embedding, dtype=np.float32)
+                q = q / max(float(np.linalg.norm(q)), 1e-12)
+                scores = self._matrix @ q
+                # Rows of free slots are zeroed, so they never pass the threshold
+                for slot in np.argsort(-scores):
+                    if scores[slot] < self.similarity_threshold:
+                        break
+                    match = self._slot_keys[slot]
+                    if match is None or self._scope_of(match) != scope:
+                        continue
+                    entry = self._fresh_entry(match)
+                    if entry is not None:
+                        self._entries.move_to_end(match)
+                        self.semantic_hits += 1
+                        return entry[2]
+
+            self.misses += 1
+            return None
+
+    def put(self, query: str, embedding: List[float], version: int, result: Dict[str, Any], scope: str = ""):
+        if self.max_entries <= 0:
+            return
+        key = self._key(query, scope)
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+        with self._lock:
+            if not self._check_version(version):
+                return  # computed against an older corpus
+            created_at = time.time()
+            self._store(key, vector, created_at, result)
+            if self._db is not None:
+                self._share(key, version, vector, created_at, result)
+
+    # Async variants run lookups and writes that touch the shared table on a
+    # worker thread so the event loop stays free; a local-only cache is
+    # answered inline.
+
+    async def aget_exact(self, query: str, version: int, scope: str = "") -> Optional[Dict[str, Any]]:
+        if self._db is None:
+            return self.get_exact(query, version, scope)
+        return await asyncio.to_thread(self.get_exact, query, version, scope)
+
+    async def aget(self, query: str, embedding: List[float], version: int, scope: str = "") -> Optional[Dict[str, Any]]:
+        if self._db is None:
+            return self.get(query, embedding, version, scope)
+        return await asyncio.to_thread(self.get, query, embedding, version, scope)
+
+    async def aput(self, query: str, embedding: List[float], version: int, result: Dict[str, Any], scope: str = ""):
+        if self._db is None:
+            return self.put(query, embedding, version, result, scope)
+        return await asyncio.to_thread(self.put, query, embedding, version, result, scope)
+
+    def _store(self, key: str, vector: np.ndarray, created_at: float, result: Dict[str, Any]):
+        if self._matrix is None:
+            self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+        elif vector.shape[0] != self._matrix.shape[1]:
+            return  # a question embedded at another dimension can't be compared
+
+        if key in self._entries:
+            self._remove(key)
+        if not self._free_slots:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+        slot = self._free_slots.pop()
+        self._matrix[slot] = vector
+        self._slot_keys[slot] = key
+        self._entries[key] = (slot, created_at, result)
+
+    def _share(self, key: str, version: int, vector: np.ndarray, created_at: float, result: Dict[str, Any]):
+        """Writes an answer to the shared table, trimming it to max_entries rows
+        of the current version."""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            # Taken under the write lock, so seq grows in commit order
+            seq = self._db.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM answers").fetchone()[0]
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers (key, seq, version, space, created_at, embedding, result) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, seq, version, self.embedding_space, created_at, vector.tobytes(), json.dumps(result))
+            )
+            self._db.execute("DELETE FROM answers WHERE version < ? OR seq <= ?", (version, seq - self.max_entries))
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def _sync(self, version: int):
+        """Loads answers other workers shared since the last lookup."""
+        if self._db is None:
+            return
+        rows = self._db.execute(
+            "SELECT key, seq, created_at, embedding, result FROM answers WHERE seq > ? AND version = ? AND space = ? ORDER BY seq",
+            (self._synced_seq, version, self.embedding_space)
+        ).fetchall()
+        for key, seq, created_at, embedding, result in rows:
+            self._store(key, np.frombuffer(embedding, dtype=np.float32), created_at, json.loads(result))
+            self._synced_seq = seq
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+    def _check_version(self, version: int) -> bool:
+        """Drops all entries when the corpus moved on; False if version is already stale."""
+        if self._version is not None and version < self._version:
+            return False
+        if version != self._version:
+            for key in list(self._entries):
+                self._remove(key)
+            self._version = version
+            self._synced_seq = 0
+        return True
+
+    def _fresh_entry(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[1] > self.ttl_seconds:
+            self._remove(key)
+            return None
+        return entry
+
+    def _remove(self, key: str):
+        slot, _, _ = self._entries.pop(key)
+        self._matrix[slot] = 0
+        self._slot_keys[slot] = None
+        self._free_slots.append(slot)
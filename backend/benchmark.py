@@ -0,0 +1,219 @@
+"""Offline load benchmark for the API.
+
+Runs the FastAPI app in-process against the deterministic fakes in
+fake_providers (hash embeddings, in-memory vector index, echo LLM), so the
+numbers measure this codebase rather than provider latency or quota:
+
+    python benchmark.py --docs 200 --queries 2000 --concurrency 32
+    python benchmark.py --latency-ms 50 --json > baseline.json
+    python benchmark.py --max-p95-ms 40   # exits 1 on a latency regression
+
+Provider latency can be simulated with --latency-ms (per embedding / LLM
+request) and --token-latency-ms (between streamed tokens).
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import tracemalloc
+from typing import List, Dict
+
+WORDS = (
+    "vector index query chunk embedding answer document retrieval latency cache token budget "
+    "model provider stream batch rerank citation context search score memory throughput "
+    "ingest page source title network request response worker queue shard replica"
+).split()
+
+
+def make_document(rng: random.Random, chars: int) -> str:
+    sentences = []
+    size = 0
+    while size < chars:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "."
+        sentences.append(sentence)
+        size += len(sentence) + 1
+    # Blank lines every few sentences so the splitter sees paragraphs
+    return "\n\n".join(" ".join(sentences[i:i+5]) for i in range(0, len(sentences), 5))
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+async def run_concurrently(count: int, concurrency: int, call) -> List[float]:
+    """Runs call(i) for i in range(count) with at most `concurrency` in flight;
+    returns the latency of each successful call in seconds."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await call(i)
+            latencies.append(time.perf_counter() - start)
+
+    results = await asyncio.gather(*(one(i) for i in range(count)), return_exceptions=True)
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        print(f"Warning: {len(errors)} of {count} requests failed, e.g. {errors[0]!r}", file=sys.stderr)
+    return latencies
+
+
+async def benchmark(args) -> Dict:
+    import httpx
+    import main
+
+    rng = random.Random(args.seed)
+    documents = [make_document(rng, args.doc_chars) for _ in range(args.docs)]
+    queries = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 8))) + "?" for _ in range(args.queries)]
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            chunks = 0
+            stage_totals: Dict[str, List[float]] = {}
+
+            async def ingest(i):
+                nonlocal chunks
+                response = await client.post("/ingest", json={"text": documents[i], "title": f"Doc {i}", "doc_key": f"bench-{i}"})
+                response.raise_for_status()
+                body = response.json()
+                chunks += body["chunks_added"] + body["chunks_unchanged"]
+
+            start = time.perf_counter()
+            ingest_latencies = await run_concurrently(args.docs, args.concurrency, ingest)
+            ingest_seconds = time.perf_counter() - start
+
+            async def query(i):
+                response = await client.post("/query", json={"query": queries[i], "reranker": args.reranker})
+                response.raise_for_status()
+                for stage, seconds in response.json()["timings"].items():
+                    stage_totals.setdefault(stage, []).append(seconds)
+
+            start = time.perf_counter()
+            query_latencies = await run_concurrently(args.queries, args.concurrency, query)
+            query_seconds = time.perf_counter() - start
+            resilience = main.rag_engine.resilience_stats()
+
+    traced_peak = None
+    if args.tracemalloc:
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    def ms(seconds):
+        return round(seconds * 1000, 2)
+
+    return {
+        "config": {
+            "docs": args.docs, "doc_chars": args.doc_chars, "queries": args.queries,
+            "concurrency": args.concurrency, "reranker": args.reranker,
+            "latency_ms": args.latency_ms, "token_latency_ms": args.token_latency_ms
+        },
+        "ingest": {
+            "documents": len(ingest_latencies),
+            "errors": args.docs - len(ingest_latencies),
+            "chunks": chunks,
+            "seconds": round(ingest_seconds, 3),
+            "chunks_per_sec": round(chunks / ingest_seconds, 1) if ingest_seconds else 0.0,
+            "p50_ms": ms(percentile(ingest_latencies, 50)),
+            "p95_ms": ms(percentile(ingest_latencies, 95))
+        },
+        "query": {
+            "requests": len(query_latencies),
+            "errors": args.queries - len(query_latencies),
+            "qps": round(len(query_latencies) / query_seconds, 1) if query_seconds else 0.0,
+            "p50_ms": ms(percentile(query_latencies, 50)),
+            "p95_ms": ms(percentile(query_latencies, 95)),
+            "p99_ms": ms(percentile(query_latencies, 99)),
+            "stage_p50_ms": {stage: ms(percentile(values, 50)) for stage, values in sorted(stage_totals.items())}
+        },
+        "resilience": {"coalesced": resilience["coalesced"], "hedged": resilience["hedged"]},
+        "memory": {
+            "max_rss_mb": round(max_rss_mb(), 1),
+            "python_peak_mb": round(traced_peak / (1024 * 1024), 1) if traced_peak is not None else None
+        }
+    }
+
+
+def print_report(report: Dict):
+    config, ingest, query, memory = report["config"], report["ingest"], report["query"], report["memory"]
+    print(f"Config:  {config['docs']} docs x {config['doc_chars']} chars, {config['queries']} queries, "
+          f"concurrency {config['concurrency']}, reranker {config['reranker']}, "
+          f"provider latency {config['latency_ms']} ms")
+    print(f"Ingest:  {ingest['chunks']} chunks in {ingest['seconds']} s = {ingest['chunks_per_sec']} chunks/s "
+          f"(per doc p50 {ingest['p50_ms']} ms, p95 {ingest['p95_ms']} ms, {ingest['errors']} errors)")
+    print(f"Query:   {query['qps']} req/s, p50 {query['p50_ms']} ms, p95 {query['p95_ms']} ms, "
+          f"p99 {query['p99_ms']} ms ({query['errors']} errors)")
+    print("Stages:  " + ", ".join(f"{stage} {value} ms" for stage, value in query["stage_p50_ms"].items()))
+    resilience = report["resilience"]
+    if resilience["coalesced"] or resilience["hedged"]:
+        print("Shared:  " + ", ".join([f"{stage} {count} coalesced" for stage, count in resilience["coalesced"].items()] +
+                                      [f"{stage} {count} hedged" for stage, count in resilience["hedged"].items()]))
+    line = f"Memory:  max RSS {memory['max_rss_mb']} MB"
+    if memory["python_peak_mb"] is not None:
+        line += f", Python peak {memory['python_peak_mb']} MB"
+    print(line)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Offline ingest/query benchmark with fake providers.")
+    parser.add_argument("--docs", type=int, default=100, help="documents to ingest")
+    parser.add_argument("--doc-chars", type=int, default=5000, help="approximate characters per document")
+    parser.add_argument("--queries", type=int, default=1000, help="queries to run after ingestion")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight")
+    parser.add_argument("--reranker", default="local", choices=["auto", "local", "none"])
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated latency per provider request")
+    parser.add_argument("--token-latency-ms", type=float, default=0.0, help="simulated delay between streamed tokens")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="also report peak Python allocations (slows the run down noticeably)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--max-p95-ms", type=float, help="exit with status 1 if query p95 exceeds this")
+    args = parser.parse_args()
+
+    # Must be set before main / rag_core are imported; explicit env vars still win
+    data_dir = tempfile.mkdtemp(prefix="minirag-bench-")
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["FAKE_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["FAKE_TOKEN_LATENCY_MS"] = str(args.token_latency_ms)
+    os.environ.setdefault("VECTOR_STORE", "memory")
+    os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+    os.environ.setdefault("LEXICAL_INDEX_PATH", "")
+    os.environ.setdefault("CHUNK_STORE_PATH", os.path.join(data_dir, "chunks.sqlite3"))
+    os.environ.setdefault("SHARED_STATE_PATH", os.path.join(data_dir, "state.sqlite3"))
+    # Repeated benchmark queries would otherwise be answered from the cache
+    os.environ.setdefault("ANSWER_CACHE_SIZE", "0")
+
+    # One log line per request would dominate the output
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    report = asyncio.run(benchmark(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    if args.max_p95_ms is not None and report["query"]["p95_ms"] > args.max_p95_ms:
+        print(f"Query p95 {report['query']['p95_ms']} ms exceeds --max-p95-ms {args.max_p95_ms}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
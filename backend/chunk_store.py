@@ -0,0 +1,99 @@
+import os
+import json
+import sqlite3
+import threading
+from typing import List, Dict, Any, Tuple
+
+
+class ChunkStore:
+    """SQLite store for chunk text and document-level metadata.
+
+    Vectors only carry ids and a few small filterable fields; the chunk text
+    and the full document metadata live here once and are looked up in bulk
+    for the candidates that are actually reranked or returned.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS documents (doc_id TEXT PRIMARY KEY, metadata TEXT NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, doc_id TEXT NOT NULL, text TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_doc_id ON chunks (doc_id)")
+        self._db.commit()
+
+    def put_document(self, doc_id: str, metadata: Dict[str, Any]):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO documents (doc_id, metadata) VALUES (?, ?)",
+                (doc_id, json.dumps(metadata))
+            )
+            self._db.commit()
+
+    def put_chunks(self, chunks: List[Tuple[str, str, str]]):
+        """Stores (chunk_id, doc_id, text) rows."""
+        if not chunks:
+            return
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO chunks (id, doc_id, text) VALUES (?, ?, ?)", chunks)
+            self._db.commit()
+
+    def get_chunks(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Returns {chunk_id: {"text", "document"}} for the ids that exist,
+        where "document" is the metadata stored for the chunk's document."""
+        rows = []
+        with self._lock:
+            for batch in self._batches(list(dict.fromkeys(ids))):
+                placeholders = ",".join("?" * len(batch))
+                rows.extend(self._db.execute(
+                    f"SELECT c.id, c.doc_id, c.text, d.metadata FROM chunks c LEFT JOIN documents d ON d.doc_id = c.doc_id "
+                    f"WHERE c.id IN ({placeholders})", batch
+                ).fetchall())
+
+        documents: Dict[str, Dict[str, Any]] = {}
+        found = {}
+        for chunk_id, doc_id, text, metadata in rows:
+            if doc_id not in documents:
+                documents[doc_id] = json.loads(metadata) if metadata else {}
+            found[chunk_id] = {"text": text, "document": documents[doc_id]}
+        return found
+
+    def delete_chunks(self, ids: List[str]):
+        with self._lock:
+            for batch in self._batches(ids):
+                placeholders = ",".join("?" * len(batch))
+                self._db.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", batch)
+            self._db.commit()
+
+    def delete_document(self, doc_id: str):
+        """Removes a document's metadata and every chunk stored for it."""
+        with self._lock:
+            self._db.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+            self._db.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+            self._db.commit()
+
+    def sample_texts(self, limit: int) -> List[str]:
+        """Up to limit chunk texts, picked at random (e.g. for evaluations)."""
+        with self._lock:
+            rows = self._db.execute("SELECT text FROM chunks ORDER BY RANDOM() LIMIT ?", (limit,)).fetchall()
+        return [row[0] for row in rows]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            documents = self._db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            chunks = self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        return {"documents": documents, "chunks": chunks}
+
+    @staticmethod
+    def _batches(ids: List[str], size: int = 500):
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(ids), size):
+            yield ids[i:i+size]
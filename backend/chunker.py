@@ -0,0 +1,96 @@
+import re
+from collections import deque
+from typing import Iterator, Dict, Any, Optional, Tuple, Sequence
+
+# Tried in order: a piece still over the token limit is split on the next one
+SEPARATORS = ("\n\n", "\n", ". ", " ")
+
+
+class Chunker:
+    """Splits text into overlapping chunks of at most chunk_tokens tokens.
+
+    Text is cut at the coarsest separator that makes each piece fit
+    (paragraphs, then lines, sentences, words, and finally raw characters),
+    and pieces are merged greedily up to the limit; the trailing pieces of a
+    chunk, up to overlap_tokens, also start the next one. split() is a
+    generator, so chunks are available while the rest of the text is still
+    being split. Build one Chunker and reuse it: separator patterns are
+    compiled once and the token counter keeps its loaded encoding.
+    """
+
+    def __init__(self, counter, chunk_tokens: int = 256, overlap_tokens: int = 40,
+                 separators: Sequence[str] = SEPARATORS):
+        if chunk_tokens <= 0:
+            raise ValueError("chunk_tokens must be positive")
+        if not 0 <= overlap_tokens < chunk_tokens:
+            raise ValueError("overlap_tokens must be between 0 and chunk_tokens")
+        self.counter = counter
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self._patterns = [re.compile(re.escape(separator)) for separator in separators]
+
+    def split(self, text: str, page: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Yields {"text", "start", "end", "tokens", "page"} per chunk, where
+        text == source[start:end] (surrounding whitespace excluded) and tokens
+        is the chunk's approximate size."""
+        window: deque = deque()
+        total = 0
+        for piece in self._pieces(text, 0, len(text), 0):
+            if window and total + piece[2] > self.chunk_tokens:
+                chunk = self._chunk(text, window, total, page)
+                if chunk is not None:
+                    yield chunk
+                # Keep the tail that fits in the overlap as the start of the next chunk
+                while window and (total > self.overlap_tokens or total + piece[2] > self.chunk_tokens):
+                    total -= window.popleft()[2]
+            window.append(piece)
+            total += piece[2]
+
+        if window:
+            chunk = self._chunk(text, window, total, page)
+            if chunk is not None:
+                yield chunk
+
+    def _pieces(self, text: str, start: int, end: int, level: int) -> Iterator[Tuple[int, int, int]]:
+        """Yields contiguous (start, end, tokens) pieces of text[start:end] that
+        each fit in a chunk; separators stay attached to the preceding piece."""
+        if level == len(self._patterns):
+            yield from self._hard_split(text, start, end)
+            return
+
+        position = start
+        for match in self._patterns[level].finditer(text, start, end):
+            yield from self._fit(text, position, match.end(), level)
+            position = match.end()
+        if position < end:
+            yield from self._fit(text, position, end, level)
+
+    def _fit(self, text: str, start: int, end: int, level: int) -> Iterator[Tuple[int, int, int]]:
+        tokens = self.counter.count(text[start:end])
+        if tokens <= self.chunk_tokens:
+            yield start, end, tokens
+        else:
+            yield from self._pieces(text, start, end, level + 1)
+
+    def _hard_split(self, text: str, start: int, end: int) -> Iterator[Tuple[int, int, int]]:
+        # No separator left (e.g. a long URL or base64 blob): cut by characters,
+        # shrinking the window until it fits
+        while start < end:
+            size = min(end - start, self.chunk_tokens * 4)
+            tokens = self.counter.count(text[start:start + size])
+            while tokens > self.chunk_tokens and size > 1:
+                size = max(1, int(size * self.chunk_tokens / tokens * 0.9))
+                tokens = self.counter.count(text[start:start + size])
+            yield start, start + size, tokens
+            start += size
+
+    @staticmethod
+    def _chunk(text: str, window: deque, tokens: int, page: Optional[int]) -> Optional[Dict[str, Any]]:
+        start, end = window[0][0], window[-1][1]
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start == end:
+            return None
+        return {"text": text[start:end], "start": start, "end": end, "tokens": tokens, "page": page}
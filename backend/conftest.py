@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+# Tests import the backend modules the way main.py does
+sys.path.insert(0, os.path.dirname(__file__))
+
+# Every provider setting the engine reads; set to "" so keys from backend/.env
+# (load_dotenv never overrides existing variables) can't reach a real provider
+PROVIDER_KEYS = ("OPENAI_API_KEY", "GEMINI_API_KEY", "PINECONE_API_KEY", "COHERE_API_KEY")
+
+
+@pytest.fixture
+def offline_env(monkeypatch, tmp_path):
+    """Fake providers, in-memory vectors and throwaway SQLite files."""
+    for key in PROVIDER_KEYS:
+        monkeypatch.setenv(key, "")
+    monkeypatch.setenv("LLM_PROVIDER", "fake")
+    monkeypatch.setenv("VECTOR_STORE", "memory")
+    monkeypatch.setenv("EMBEDDING_CACHE_PATH", "")
+    monkeypatch.setenv("LEXICAL_INDEX_PATH", "")
+    monkeypatch.setenv("CHUNK_STORE_PATH", str(tmp_path / "chunks.sqlite3"))
+    monkeypatch.setenv("SHARED_STATE_PATH", str(tmp_path / "state.sqlite3"))
+    monkeypatch.setenv("PREWARM_PROVIDERS", "0")
+    return tmp_path
+
+
+@pytest.fixture
+def engine(offline_env):
+    from rag_core import RAGEngine
+    return RAGEngine()
@@ -0,0 +1,133 @@
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+
+# USD per 1M tokens: (prompt, completion)
+MODEL_PRICING = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gemini-2.5-flash": (0.30, 2.50),
+    # Offline fake (fake_providers.EchoLLM)
+    "fake-echo": (0.0, 0.0),
+}
+
+# Overlaps shorter than this are treated as coincidence, not splitter overlap
+MIN_OVERLAP_CHARS = 20
+# Chunk overlap is CHUNK_OVERLAP tokens (40, roughly 160 characters); allow for
+# the chunker snapping to separators
+MAX_OVERLAP_CHARS = 400
+# A chunk truncated to fewer tokens than this is dropped instead
+MIN_PARTIAL_TOKENS = 32
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """Cost in USD, or None for a model without known pricing."""
+    pricing = MODEL_PRICING.get(model)
+    if pricing is None:
+        return None
+    return (prompt_tokens * pricing[0] + completion_tokens * pricing[1]) / 1_000_000
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of left that is also a prefix of right."""
+    for size in range(min(len(left), len(right), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+class TokenCounter:
+    """Counts and truncates tokens with the tiktoken encoding of a model,
+    falling back to 4 characters per token when none can be loaded."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self._encoding = None
+        self._encoding_lock = threading.Lock()
+
+    def _get_encoding(self):
+        # Loading a tiktoken encoding may download it, so do it on first use
+        if self._encoding is None:
+            with self._encoding_lock:
+                if self._encoding is None:
+                    import tiktoken
+                    try:
+                        try:
+                            self._encoding = tiktoken.encoding_for_model(self.model)
+                        except KeyError:
+                            # Not an OpenAI model; o200k_base is a close enough estimate
+                            self._encoding = tiktoken.get_encoding("o200k_base")
+                    except Exception as e:
+                        print(f"Warning: tiktoken encoding unavailable ({e}); estimating 4 characters per token.")
+                        self._encoding = False
+        return self._encoding
+
+    def count(self, text: str) -> int:
+        encoding = self._get_encoding()
+        if encoding is False:
+            return (len(text) + 3) // 4
+        return len(encoding.encode(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        encoding = self._get_encoding()
+        if encoding is False:
+            return text[:max_tokens * 4]
+        return encoding.decode(encoding.encode(text)[:max_tokens])
+
+
+class ContextPacker:
+    """Fits reranked chunks into a token budget for the prompt context.
+
+    Chunks are taken in rank order. Text repeated from an already packed
+    chunk of the same document (the splitter overlap between neighbours, or
+    a chunk fully contained in another) is cut, and the first chunk that no
+    longer fits is truncated to the remaining budget.
+    """
+
+    def __init__(self, model: str, token_budget: int = 3000):
+        self.model = model
+        self.token_budget = token_budget
+        self.tokens = TokenCounter(model)
+
+    def count(self, text: str) -> int:
+        return self.tokens.count(text)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        return self.tokens.truncate(text, max_tokens)
+
+    def pack(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Returns copies of the chunks that fit, with their text deduplicated
+        and trimmed; each carries its prompt size under "tokens"."""
+        packed: List[Dict[str, Any]] = []
+        # (doc_id, untrimmed text) of every packed chunk
+        seen: List[Tuple[Optional[str], str]] = []
+        remaining = self.token_budget
+
+        for chunk in chunks:
+            text = chunk["text"]
+            doc_id = chunk.get("metadata", {}).get("doc_id")
+            for previous_doc, previous in seen:
+                if previous_doc != doc_id:
+                    continue
+                if text in previous:
+                    text = ""
+                    break
+                text = text[_overlap(previous, text):]
+                cut = _overlap(text, previous)
+                if cut:
+                    text = text[:-cut]
+            text = text.strip()
+            if not text:
+                continue
+
+            tokens = self.count(text)
+            if tokens > remaining:
+                if remaining < MIN_PARTIAL_TOKENS:
+                    break
+                text = self.truncate(text, remaining)
+                tokens = self.count(text)
+            packed.append({**chunk, "text": text, "tokens": tokens})
+            seen.append((doc_id, chunk["text"]))
+            remaining -= tokens
+            if remaining <= 0:
+                break
+
+        return packed
@@ -0,0 +1,139 @@
+import os
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """Two-tier, content-addressed cache for embedding vectors.
+
+    Tier 1 is an in-process LRU bounded by the bytes it holds; tier 2 is an
+    optional SQLite file that survives restarts. Keys are built from
+    (provider, model, task_type, sha256(text)), so the same text embedded for
+    a different model or task never collides.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_memory_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.max_memory_bytes = max_memory_bytes
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._memory_bytes = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(provider: str, model: str, task_type: str, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{provider}:{model}:{task_type}:{digest}"
+
+    def get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        """Looks up keys in memory, then on disk. Missing entries come back as None."""
+        results: List[Optional[np.ndarray]] = [None] * len(keys)
+        pending: Dict[str, List[int]] = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    results[i] = vector
+                    self.memory_hits += 1
+                else:
+                    pending.setdefault(key, []).append(i)
+
+            if pending and self._db is not None:
+                found = self._load(list(pending))
+                for key, vector in found.items():
+                    for i in pending.pop(key):
+                        results[i] = vector
+                        self.disk_hits += 1
+                    self._remember(key, vector)
+
+            self.misses += sum(len(positions) for positions in pending.values())
+
+        return [v.tolist() if v is not None else None for v in results]
+
+    def put_many(self, items: Dict[str, List[float]]):
+        """Stores freshly computed embeddings in both tiers."""
+        if not items:
+            return
+        arrays = {key: np.asarray(vector, dtype=np.float32) for key, vector in items.items()}
+
+        with self._lock:
+            for key, vector in arrays.items():
+                self._remember(key, vector)
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, vector.tobytes()) for key, vector in arrays.items()]
+                )
+                self._db.commit()
+
+    # Async variants run the SQLite tier on a worker thread so the event loop
+    # stays free; a memory-only cache is answered inline.
+
+    async def aget_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        if self._db is None:
+            return self.get_many(keys)
+        return await asyncio.to_thread(self.get_many, keys)
+
+    async def aput_many(self, items: Dict[str, List[float]]):
+        if self._db is None:
+            return self.put_many(items)
+        return await asyncio.to_thread(self.put_many, items)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+            }
+
+    def _load(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i+500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._db.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def _remember(self, key: str, vector: np.ndarray):
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= previous.nbytes
+        self._memory[key] = vector
+        self._memory_bytes += vector.nbytes
+
+        while self._memory_bytes > self.max_memory_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
@@ -0,0 +1,141 @@
+"""Recall evaluation for shortened and quantized embeddings.
+
+Embeds chunks of the ingested corpus (the chunk store) once at the model's
+full dimension, then, for every candidate EMBEDDING_DIM and quantization,
+searches an in-memory index built from the shortened vectors and reports
+recall@k against exact full-precision search, with index size and query time:
+
+    python embedding_eval.py --dims 1024,512,256 --int8
+    python embedding_eval.py --corpus 5000 --queries 500 --k 5 --json
+    python embedding_eval.py --queries-file questions.txt
+    LLM_PROVIDER=fake python embedding_eval.py --synthetic 100   # offline smoke run
+
+Queries are read from --queries-file (one per line) or, by default, are
+random word windows cut from corpus chunks. Shortening is done by truncation
++ renormalisation, which is what the providers' native shortened embeddings
+(OpenAI `dimensions`, Gemini `output_dimensionality`) compute for
+Matryoshka-trained models, so the whole grid costs one embedding pass.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from typing import Dict, List
+
+import numpy as np
+
+
+def pseudo_queries(rng: random.Random, texts: List[str], count: int) -> List[str]:
+    queries = []
+    for _ in range(count):
+        words = rng.choice(texts).split()
+        size = min(len(words), rng.randint(6, 14))
+        start = rng.randint(0, len(words) - size)
+        queries.append(" ".join(words[start:start + size]))
+    return queries
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Row indices of each query's k nearest corpus vectors (both normalised)."""
+    scores = queries @ corpus.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1), axis=1)
+
+
+def evaluate(corpus: np.ndarray, queries: np.ndarray, truth: np.ndarray, dimension: int,
+             quantization: str, k: int) -> Dict:
+    from rag_core import shorten_embeddings
+    from vector_store import LocalVectorStore
+
+    store = LocalVectorStore(None, dimension, quantization)
+    store.upsert([{"id": str(i), "values": vector, "metadata": {}}
+                  for i, vector in enumerate(shorten_embeddings(corpus, dimension))])
+    short_queries = shorten_embeddings(queries, dimension)
+
+    hits = 0
+    start = time.perf_counter()
+    for query, expected in zip(short_queries, truth):
+        found = {int(match["id"]) for match in store.query(query, top_k=k, include_metadata=False)["matches"]}
+        hits += len(found & set(expected.tolist()))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "dimension": dimension,
+        "quantization": quantization,
+        "bytes_per_vector": store.nbytes() // max(len(store), 1),
+        "index_mb": round(store.nbytes() / (1024 * 1024), 2),
+        f"recall@{k}": round(hits / (len(truth) * k), 4),
+        "query_ms": round(elapsed / len(truth) * 1000, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k of shortened / int8 embeddings vs. full precision.")
+    parser.add_argument("--dims", default="", help="comma-separated dimensions to try (default: 1/2 and 1/4 of the model's)")
+    parser.add_argument("--int8", action="store_true", help="also evaluate int8 quantization of every dimension")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--corpus", type=int, default=2000, help="chunks sampled from the chunk store")
+    parser.add_argument("--queries", type=int, default=200, help="pseudo-queries to generate")
+    parser.add_argument("--queries-file", help="file with one query per line instead of pseudo-queries")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="chunk this many generated documents instead of reading the chunk store")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    # Baseline vectors are always the model's full dimension
+    os.environ["EMBEDDING_DIM"] = ""
+    from rag_core import RAGEngine
+    engine = RAGEngine()
+    if not hasattr(engine, "embedding_dim"):
+        sys.exit("No embedding provider configured.")
+
+    rng = random.Random(args.seed)
+    if args.synthetic:
+        from benchmark import make_document
+        texts = [chunk["text"] for _ in range(args.synthetic)
+                 for chunk in engine.chunker.split(make_document(rng, 5000))][:args.corpus]
+    elif engine.chunk_store is not None:
+        texts = engine.chunk_store.sample_texts(args.corpus)
+    else:
+        texts = []
+    if len(texts) < args.k:
+        sys.exit("Not enough chunks to evaluate; ingest documents first or pass --synthetic.")
+
+    if args.queries_file:
+        with open(args.queries_file, encoding="utf-8") as f:
+            query_texts = [line.strip() for line in f if line.strip()]
+    else:
+        query_texts = pseudo_queries(rng, texts, args.queries)
+
+    corpus = np.asarray(engine.get_embeddings(texts), dtype=np.float32)
+    queries = np.asarray(engine.get_query_embeddings(query_texts), dtype=np.float32)
+    corpus /= np.maximum(np.linalg.norm(corpus, axis=1, keepdims=True), 1e-12)
+    queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    truth = exact_top_k(corpus, queries, args.k)
+
+    native = engine.embedding_dim
+    dims = [int(d) for d in args.dims.split(",") if d.strip()] or [native // 2, native // 4]
+    results = []
+    for dimension in [native] + [d for d in dims if 0 < d < native]:
+        for quantization in (["none", "int8"] if args.int8 else ["none"]):
+            results.append(evaluate(corpus, queries, truth, dimension, quantization, args.k))
+
+    report = {"model": engine.embedding_model, "corpus": len(texts), "queries": len(query_texts), "k": args.k,
+              "results": results}
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{engine.embedding_model}: {len(texts)} chunks, {len(query_texts)} queries, k={args.k}")
+    recall = f"recall@{args.k}"
+    print(f"{'dim':>6}{'quant':>7}{'bytes/vec':>11}{'index MB':>10}{recall:>11}{'query ms':>10}")
+    for row in results:
+        print(f"{row['dimension']:>6}{row['quantization']:>7}{row['bytes_per_vector']:>11}"
+              f"{row['index_mb']:>10}{row[recall]:>11}{row['query_ms']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import time
+import random
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Callable, Awaitable, Optional
+
+
+# Per-provider defaults: texts per request, parallel requests, requests per minute.
+# OpenAI accepts up to 2048 inputs per call; Gemini's batchEmbedContents caps at 100.
+PROVIDER_LIMITS = {
+    "openai": {"batch_size": 256, "max_concurrency": 4, "requests_per_minute": 3000},
+    "gemini": {"batch_size": 100, "max_concurrency": 4, "requests_per_minute": 1500},
+    # Offline fakes (fake_providers): no real quota, so only batching applies
+    "fake": {"batch_size": 256, "max_concurrency": 8, "requests_per_minute": 1_000_000},
+}
+
+
+def is_rate_limited(exc: Exception) -> bool:
+    """True for HTTP 429 / quota errors from the OpenAI, Gemini and Cohere clients."""
+    for attr in ("status_code", "status", "code"):
+        if getattr(exc, attr, None) == 429:
+            return True
+    return type(exc).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequestsError")
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Request-rate limiter that halves its rate on 429s and creeps back up on success."""
+
+    def __init__(self, requests_per_minute: float, capacity: Optional[float] = None):
+        self.max_rate = requests_per_minute / 60.0
+        self.min_rate = self.max_rate / 32
+        self.rate = self.max_rate
+        self.capacity = capacity if capacity is not None else max(1.0, self.max_rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Takes one token, returning how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def penalize(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+
+    def reward(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class EmbeddingScheduler:
+    """Splits texts into provider-sized batches and embeds them with bounded concurrency.
+
+    Every request first takes a token from the provider's bucket; a 429 shrinks
+    the bucket's rate and the batch is retried with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str], str], List[List[float]]],
+        aembed_batch: Callable[[List[str], str], Awaitable[List[List[float]]]],
+        batch_size: int,
+        max_concurrency: int,
+        requests_per_minute: float,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+    ):
+        self.embed_batch = embed_batch
+        self.aembed_batch = aembed_batch
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.bucket = TokenBucket(requests_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embed")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.retries = 0
+
+    def _batches(self, texts: List[str]) -> List[List[str]]:
+        return [texts[i:i+self.batch_size] for i in range(0, len(texts), self.batch_size)]
+
+    def _backoff(self, attempt: int, exc: Exception) -> float:
+        self.retries += 1
+        self.bucket.penalize()
+        delay = _retry_after(exc)
+        if delay is None:
+            delay = self.base_delay * (2 ** attempt)
+        return delay * (1 + random.random() / 2)
+
+    def _run_batch(self, batch: List[str], task_type: str) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                result = self.embed_batch(batch, task_type)
+                self.bucket.reward()
+                return result
+            except Exception as e:
+                if not is_rate_limited(e) or attempt == self.max_retries:
+                    raise
+                time.sleep(self._backoff(attempt, e))
+
+    async def _arun_batch(self, batch: List[str], task_type: str) -> List[List[float]]:
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self.bucket.aacquire()
+                try:
+                    result = await self.aembed_batch(batch, task_type)
+                    self.bucket.reward()
+                    return result
+                except Exception as e:
+                    if not is_rate_limited(e) or attempt == self.max_retries:
+                        raise
+                    await asyncio.sleep(self._backoff(attempt, e))
+
+    def embed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        batches = self._batches(texts)
+        if len(batches) == 1:
+            return self._run_batch(batches[0], task_type)
+
+        results = self._executor.map(lambda batch: self._run_batch(batch, task_type), batches)
+        return [emb for batch_result in results for emb in batch_result]
+
+    async def aembed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        results = await asyncio.gather(*[self._arun_batch(batch, task_type) for batch in self._batches(texts)])
+        return [emb for batch_result in results for emb in batch_result]
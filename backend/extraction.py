@@ -0,0 +1,155 @@
+import os
+import hashlib
+import asyncio
+import tempfile
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple, AsyncIterator
+
+from pypdf import PdfReader
+
+# Pages handed to a worker process per task, and bytes per read when spooling
+PAGES_PER_TASK = 4
+SPOOL_CHUNK_BYTES = 1024 * 1024
+# Plain-text uploads are streamed in blocks of roughly this many characters
+TEXT_BLOCK_CHARS = 256 * 1024
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+
+
+class ExtractionError(ValueError):
+    """The upload could not be turned into text (bad PDF, wrong encoding, empty)."""
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Process pool for PDF parsing, created on first use (PDF_WORKERS, default: all cores)."""
+    global _pool, _pool_workers
+    if _pool is None:
+        _pool_workers = int(os.getenv("PDF_WORKERS", "0")) or os.cpu_count() or 1
+        # spawn, not fork: the parent runs gRPC/HTTP client threads that are not fork-safe
+        _pool = ProcessPoolExecutor(max_workers=_pool_workers, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def spool_upload(upload, suffix: str = "") -> str:
+    """Copies an UploadFile to a temp file in fixed-size chunks and returns its path."""
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="rag_upload_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                block = await upload.read(SPOOL_CHUNK_BYTES)
+                if not block:
+                    break
+                f.write(block)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def fingerprint_file(path: str) -> str:
+    """Content fingerprint of a spooled upload, used as its default doc_id."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(SPOOL_CHUNK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()[:32]
+
+
+def is_pdf(filename: str, content_type: Optional[str]) -> bool:
+    return content_type == "application/pdf" or filename.lower().endswith(".pdf")
+
+
+def _count_pages(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def _extract_page_range(path: str, start: int, end: int) -> List[str]:
+    """Runs in a worker process: returns the text of pages [start, end)."""
+    reader = PdfReader(path)
+    return [(reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+
+async def iter_pdf_pages(path: str) -> AsyncIterator[Tuple[int, str]]:
+    """Yields (page_number, text) in order while later pages are still being parsed.
+
+    At most two tasks per worker are in flight, so memory stays bounded
+    regardless of document size.
+    """
+    try:
+        page_count = await asyncio.to_thread(_count_pages, path)
+    except Exception as e:
+        raise ExtractionError(f"Error reading PDF: {str(e)}")
+
+    pool = get_pool()
+    ranges = deque((start, min(start + PAGES_PER_TASK, page_count)) for start in range(0, page_count, PAGES_PER_TASK))
+    in_flight = deque()
+    max_in_flight = 2 * _pool_workers
+
+    try:
+        while ranges or in_flight:
+            while ranges and len(in_flight) < max_in_flight:
+                start, end = ranges.popleft()
+                in_flight.append((start, asyncio.wrap_future(pool.submit(_extract_page_range, path, start, end))))
+
+            start, future = in_flight.popleft()
+            try:
+                texts = await future
+            except Exception as e:
+                raise ExtractionError(f"Error reading PDF: {str(e)}")
+            for offset, text in enumerate(texts):
+                yield start + offset + 1, text
+    finally:
+        for _, future in in_flight:
+            future.cancel()
+
+
+def _block_end(data: str) -> int:
+    """Index of the last character of the block to yield from data: its last
+    line break, else (one very long line) its last whitespace, else its end."""
+    cut = data.rfind("\n")
+    if cut == -1:
+        cut = max(data.rfind(" "), data.rfind("\t"))
+    return cut if cut != -1 else len(data) - 1
+
+
+async def iter_text_blocks(path: str) -> AsyncIterator[Tuple[Optional[int], str]]:
+    """Yields a UTF-8 file in blocks that end on a line break; page is always None.
+
+    Text without line breaks (one huge line) is cut at the last whitespace,
+    or anywhere if there is none, so no block exceeds 3 * TEXT_BLOCK_CHARS.
+    """
+    f = open(path, encoding="utf-8")
+    try:
+        carry = ""
+        while True:
+            try:
+                data = await asyncio.to_thread(f.read, TEXT_BLOCK_CHARS)
+            except UnicodeDecodeError:
+                raise ExtractionError("File encoding not supported. Please upload a UTF-8 text file or PDF.")
+            if not data:
+                break
+            data = carry + data
+            cut = _block_end(data)
+            yield None, data[:cut + 1]
+            carry = data[cut + 1:]
+        if carry:
+            yield None, carry
+    finally:
+        f.close()
+
+
+def iter_upload_pages(path: str, filename: str, content_type: Optional[str]) -> AsyncIterator[Tuple[Optional[int], str]]:
+    """Picks the page iterator for a spooled upload."""
+    if is_pdf(filename, content_type):
+        return iter_pdf_pages(path)
+    return iter_text_blocks(path)
@@ -0,0 +1,100 @@
+import re
+import time
+import zlib
+import asyncio
+from typing import List, Iterator, AsyncIterator, Tuple
+
+import numpy as np
+
+WORD_RE = re.compile(r"\w+")
+
+
+class HashEmbedder:
+    """Deterministic offline embeddings via feature hashing.
+
+    Every word is hashed into one of `dimension` signed buckets, so texts
+    that share words get similar vectors and retrieval behaves plausibly
+    without any network access. latency_ms is slept once per request to
+    mimic a remote provider.
+    """
+
+    provider = "fake"
+    model = "fake-hash"
+
+    def __init__(self, dimension: int = 256, latency_ms: float = 0.0):
+        self.dimension = dimension
+        self.latency = latency_ms / 1000
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in WORD_RE.findall(text.lower()):
+            h = zlib.crc32(word.encode("utf-8"))
+            vector[h % self.dimension] += 1.0 if h & 0x80000000 else -1.0
+        norm = float(np.linalg.norm(vector))
+        if norm == 0:
+            vector[0] = 1.0
+            norm = 1.0
+        return (vector / norm).tolist()
+
+    def embed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    async def aembed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+
+class EchoLLM:
+    """Offline LLM that answers by echoing the question and citing source [1].
+
+    latency_ms is slept before the first token and token_latency_ms between
+    streamed tokens. Token counts are whitespace word counts.
+    """
+
+    model = "fake-echo"
+
+    def __init__(self, latency_ms: float = 0.0, token_latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000
+        self.token_latency = token_latency_ms / 1000
+
+    @staticmethod
+    def _answer(user_prompt: str) -> str:
+        question = user_prompt.rsplit("Question:", 1)[-1].strip()
+        return f"Based on the provided documents, here is what they say about: {question} [1]"
+
+    @staticmethod
+    def _tokens(answer: str) -> List[str]:
+        words = answer.split(" ")
+        return [words[0]] + [" " + word for word in words[1:]]
+
+    def complete(self, system_prompt: str, user_prompt: str) -> Tuple[str, int, int]:
+        """Returns (answer, prompt_tokens, completion_tokens)."""
+        if self.latency:
+            time.sleep(self.latency)
+        answer = self._answer(user_prompt)
+        return answer, len((system_prompt + " " + user_prompt).split()), len(answer.split())
+
+    async def acomplete(self, system_prompt: str, user_prompt: str) -> Tuple[str, int, int]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        answer = self._answer(user_prompt)
+        return answer, len((system_prompt + " " + user_prompt).split()), len(answer.split())
+
+    def stream(self, system_prompt: str, user_prompt: str) -> Iterator[str]:
+        if self.latency:
+            time.sleep(self.latency)
+        for token in self._tokens(self._answer(user_prompt)):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            yield token
+
+    async def astream(self, system_prompt: str, user_prompt: str) -> AsyncIterator[str]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for token in self._tokens(self._answer(user_prompt)):
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield token
@@ -0,0 +1,244 @@
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Callable, Awaitable, AsyncIterator, List, Set
+
+from shared_state import SharedState
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATES = ("completed", "failed", "cancelled")
+
+
+class IngestJob:
+    """State and progress counters of one background ingestion."""
+
+    def __init__(self, title: str, source: str, cleanup: Optional[Callable[[], None]] = None):
+        self.id = str(uuid.uuid4())
+        self.title = title
+        self.source = source
+        self.status = "queued"
+        self.doc_id: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+        self.pages_parsed = 0
+        self.chunks_total = 0
+        self.chunks_embedded = 0
+        self.vectors_upserted = 0
+        self.chunks_unchanged = 0
+        self.chunks_removed = 0
+
+        self.cancel_requested = False
+        # Called once when the job reaches a terminal state (e.g. to delete a spooled upload)
+        self.cleanup = cleanup
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, pages: int = 0, chunks: int = 0, embedded: int = 0, upserted: int = 0,
+               unchanged: int = 0, removed: int = 0):
+        """Progress callback handed to the extraction and ingest stages."""
+        self.pages_parsed += pages
+        self.chunks_total += chunks
+        self.chunks_embedded += embedded
+        self.vectors_upserted += upserted
+        self.chunks_unchanged += unchanged
+        self.chunks_removed += removed
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL_STATES
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "title": self.title,
+            "source": self.source,
+            "doc_id": self.doc_id,
+            "error": self.error,
+            "pages_parsed": self.pages_parsed,
+            "chunks_total": self.chunks_total,
+            "chunks_embedded": self.chunks_embedded,
+            "vectors_upserted": self.vectors_upserted,
+            "chunks_unchanged": self.chunks_unchanged,
+            "chunks_removed": self.chunks_removed,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """Runs ingestion jobs on a bounded pool of asyncio workers.
+
+    With shared state, job snapshots are published every publish_interval
+    seconds so that other worker processes can report them, and cancellations
+    requested through another worker are picked up on the same schedule.
+    """
+
+    def __init__(self, max_workers: int = 2, max_jobs_kept: int = 500,
+                 shared: Optional[SharedState] = None, publish_interval: float = 0.5):
+        self.max_workers = max_workers
+        self.max_jobs_kept = max_jobs_kept
+        self.shared = shared
+        self.publish_interval = publish_interval
+        self.jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._work: Dict[str, Callable[[IngestJob], Awaitable[None]]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._publisher: Optional[asyncio.Task] = None
+        # Last snapshot written to shared state per job
+        self._published: Dict[str, Dict[str, Any]] = {}
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_workers)]
+        if self.shared is not None:
+            self._publisher = asyncio.create_task(self._publish_loop())
+
+    async def stop(self):
+        for job in self.jobs.values():
+            if not job.done:
+                self.cancel(job.id)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._publisher is not None:
+            self._publisher.cancel()
+            await asyncio.gather(self._publisher, return_exceptions=True)
+            self._publisher = None
+            # Final states (e.g. cancelled by this shutdown) for the other workers
+            await self._sync_shared()
+
+    def submit(self, job: IngestJob, work: Callable[[IngestJob], Awaitable[None]]) -> IngestJob:
+        """Queues work(job); returns immediately. If this raises, nothing was queued."""
+        if self.shared is not None:
+            # Right away, since the client may poll another worker next
+            snapshot = job.to_dict()
+            self.shared.put_job(snapshot)
+            self._published[job.id] = snapshot
+        self.jobs[job.id] = job
+        self._work[job.id] = work
+        self._queue.put_nowait(job.id)
+        self._evict()
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self.jobs.get(job_id)
+
+    def snapshot(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job's state as a dict, whichever worker runs it."""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self.shared is not None:
+            return self.shared.get_job(job_id)
+        return None
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancels a job and returns its snapshot. Jobs running on another
+        worker are cancelled within publish_interval of the request."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            snapshot = self.snapshot(job_id)
+            if snapshot is not None and snapshot["status"] not in TERMINAL_STATES:
+                self.shared.request_job_cancel(job_id)
+            return snapshot
+        if job.done:
+            return job.to_dict()
+        job.cancel_requested = True
+        if job._task is not None:
+            job._task.cancel()
+        else:
+            # Still queued: the worker will skip it
+            self._finish(job, "cancelled")
+        return job.to_dict()
+
+    async def watch(self, job_id: str, interval: float = 0.5) -> AsyncIterator[Dict[str, Any]]:
+        """Yields a job snapshot whenever it changes, until the job finishes."""
+        last = None
+        while True:
+            if job_id in self.jobs or self.shared is None:
+                snapshot = self.snapshot(job_id)
+            else:
+                snapshot = await asyncio.to_thread(self.snapshot, job_id)
+            if snapshot is None:
+                return
+            if snapshot != last:
+                last = snapshot
+                yield snapshot
+            if snapshot["status"] in TERMINAL_STATES:
+                return
+            await asyncio.sleep(interval)
+
+    async def _publish_loop(self):
+        while True:
+            await asyncio.sleep(self.publish_interval)
+            try:
+                await self._sync_shared()
+            except Exception as e:
+                logger.warning(f"Publishing ingest job state failed: {e}")
+
+    async def _sync_shared(self):
+        """Publishes changed snapshots and applies cancellations requested elsewhere."""
+        changed = [job.to_dict() for job in self.jobs.values()]
+        changed = [snapshot for snapshot in changed if self._published.get(snapshot["job_id"]) != snapshot]
+        running = [job.id for job in self.jobs.values() if not job.done]
+        cancelled = await asyncio.to_thread(self._write_shared, changed, running)
+        for snapshot in changed:
+            self._published[snapshot["job_id"]] = snapshot
+        for job_id in cancelled:
+            self.cancel(job_id)
+
+    def _write_shared(self, snapshots: List[Dict[str, Any]], running: List[str]) -> Set[str]:
+        for snapshot in snapshots:
+            self.shared.put_job(snapshot)
+        return self.shared.cancel_requests(running)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self.jobs.get(job_id)
+            work = self._work.pop(job_id, None)
+            if job is None or job.done or work is None:
+                continue
+
+            job.status = "running"
+            job.started_at = time.time()
+            job._task = asyncio.create_task(work(job))
+            try:
+                await job._task
+                self._finish(job, "completed")
+            except asyncio.CancelledError:
+                self._finish(job, "cancelled")
+                if not job.cancel_requested:
+                    raise  # the worker itself is shutting down
+            except Exception as e:
+                logger.error(f"Ingest job {job.id} failed: {e}")
+                job.error = str(e)
+                self._finish(job, "failed")
+            finally:
+                job._task = None
+
+    def _finish(self, job: IngestJob, status: str):
+        job.status = status
+        job.finished_at = time.time()
+        self._work.pop(job.id, None)
+        if job.cleanup is not None:
+            cleanup, job.cleanup = job.cleanup, None
+            try:
+                cleanup()
+            except Exception as e:
+                logger.warning(f"Cleanup for ingest job {job.id} failed: {e}")
+
+    def _evict(self):
+        """Drops the oldest finished jobs beyond max_jobs_kept."""
+        excess = len(self.jobs) - self.max_jobs_kept
+        for job_id in [jid for jid, job in self.jobs.items() if job.done][:max(excess, 0)]:
+            del self.jobs[job_id]
+            self._published.pop(job_id, None)
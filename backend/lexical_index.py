@@ -0,0 +1,178 @@
+import os
+import re
+import json
+import math
+import threading
+from array import array
+from collections import Counter
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+from shared_state import file_lock
+
+# Keeps identifiers such as "ERR-404", "v1.2" or "user_id" as single tokens
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """Incremental BM25 inverted index.
+
+    Postings are stored per term as two parallel compact arrays (document
+    numbers and term frequencies) that only ever grow. Documents are the
+    chunks stored in the vector store, addressed by their vector id. With a
+    path, every added or removed document is also appended to a JSONL log
+    that is replayed on startup. Worker processes sharing the log append
+    under a file lock and replay each other's new lines before every search.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._doc_ids: List[str] = []
+        self._doc_num: Dict[str, int] = {}
+        self._doc_len = array("I")
+        self._live = array("b")
+        self._total_len = 0
+        self._live_count = 0
+        # Bytes of the log already replayed
+        self._offset = 0
+
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.lock_path = path + ".lock"
+            with self._lock:
+                self._refresh()
+
+    def _replay(self):
+        """Applies log lines appended after _offset; callers hold both locks."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1  # anything after it is a torn write from an interrupted append
+        self._apply([json.loads(line) for line in data[:end].splitlines()])
+        self._offset += end
+
+    def _refresh(self):
+        """Picks up entries other processes logged; callers hold the lock."""
+        if not self.path or not os.path.exists(self.path) or os.path.getsize(self.path) == self._offset:
+            return
+        with file_lock(self.lock_path, shared=True):
+            self._replay()
+
+    def _append(self, records: List[Dict]):
+        """Applies records and logs them; callers hold the lock."""
+        if not self.path:
+            self._apply(records)
+            return
+        with file_lock(self.lock_path):
+            self._replay()
+            self._apply(records)
+            with open(self.path, "ab") as f:
+                f.truncate(self._offset)  # drop a torn line left by a crashed writer
+                f.write("".join(json.dumps(record) + "\n" for record in records).encode("utf-8"))
+                self._offset = f.tell()
+
+    def _apply(self, records: List[Dict]):
+        for record in records:
+            if record.get("deleted"):
+                self._forget(record["id"])
+            else:
+                self._index(record["id"], record["tf"])
+
+    def add(self, doc_ids: List[str], texts: List[str]):
+        """Indexes (or re-indexes) chunks by vector id."""
+        records = [{"id": doc_id, "tf": dict(Counter(tokenize(text)))} for doc_id, text in zip(doc_ids, texts)]
+        with self._lock:
+            self._append(records)
+
+    def remove(self, doc_ids: List[str]):
+        """Drops chunks by vector id; unknown ids are ignored."""
+        with self._lock:
+            self._refresh()
+            doc_ids = [doc_id for doc_id in doc_ids if doc_id in self._doc_num]
+            if doc_ids:
+                self._append([{"id": doc_id, "deleted": True} for doc_id in doc_ids])
+
+    def _index(self, doc_id: str, tf: Dict[str, int]):
+        self._forget(doc_id)
+
+        num = len(self._doc_ids)
+        self._doc_ids.append(doc_id)
+        self._doc_num[doc_id] = num
+        length = sum(tf.values())
+        self._doc_len.append(length)
+        self._live.append(1)
+        self._total_len += length
+        self._live_count += 1
+
+        for term, count in tf.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("I"), array("I"))
+            postings[0].append(num)
+            postings[1].append(count)
+
+    def _forget(self, doc_id: str):
+        num = self._doc_num.pop(doc_id, None)
+        if num is not None and self._live[num]:
+            self._live[num] = 0
+            self._total_len -= self._doc_len[num]
+            self._live_count -= 1
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """Returns up to top_k (vector_id, bm25_score) pairs, best first."""
+        terms = set(tokenize(query))
+        with self._lock:
+            self._refresh()
+            if not terms or self._live_count == 0:
+                return []
+            doc_count = len(self._doc_ids)
+            live = np.frombuffer(self._live, dtype=np.int8, count=doc_count).astype(bool)
+            doc_len = np.frombuffer(self._doc_len, dtype=np.uint32, count=doc_count).astype(np.float32)
+            avg_len = self._total_len / self._live_count
+            postings = [(np.frombuffer(docs, dtype=np.uint32).copy(), np.frombuffer(tfs, dtype=np.uint32).astype(np.float32))
+                        for docs, tfs in (self._postings[t] for t in terms if t in self._postings)]
+            live_count = self._live_count
+            doc_ids = self._doc_ids
+
+        scores = np.zeros(doc_count, dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * doc_len / avg_len)
+        for docs, tfs in postings:
+            mask = live[docs]
+            docs, tfs = docs[mask], tfs[mask]
+            df = len(docs)
+            if df == 0:
+                continue
+            idf = math.log(1 + (live_count - df + 0.5) / (df + 0.5))
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+
+        hits = int(np.count_nonzero(scores))
+        if hits == 0:
+            return []
+        k = min(top_k, hits)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(doc_ids[i], float(scores[i])) for i in top]
+
+    def __len__(self):
+        return self._live_count
+
+
+def reciprocal_rank_fusion(*rankings: List[str], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuses ranked id lists: score(id) = sum over lists of 1 / (k + rank)."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
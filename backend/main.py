@@ -1,20 +1,26 @@
 import logging
 import os
-import io
+import asyncio
+import json
 import time
-import uuid
-from typing import Optional, List, Dict, Any
+import hashlib
+from typing import Optional, List, Dict, Any, Literal
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
-from pypdf import PdfReader
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response
+from pydantic import BaseModel, Field
 import uvicorn
+from prometheus_client import CONTENT_TYPE_LATEST
 
-from rag_core import RAGEngine
+from rag_core import RAGEngine, NO_CONTEXT_ANSWER, COLLECTION_RE, build_filter
+from resilience import CircuitOpenError
+from jobs import IngestJob, JobManager
+from telemetry import (setup_tracing, register_engine, span, STAGE_SECONDS, metrics_payload,
+                       sync_engine_metrics, multiprocess_enabled, prepare_multiprocess_metrics, shutdown_metrics)
+from extraction import ExtractionError, spool_upload, fingerprint_file, iter_upload_pages, shutdown_pool
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
@@ -25,40 +31,146 @@ logger = logging.getLogger(__name__)
 class IngestRequest(BaseModel):
     text: str
     title: Optional[str] = "Untitled"
+    # Stable document identity; re-ingesting under the same key only updates changed chunks
+    doc_key: Optional[str] = Field(None, min_length=1, max_length=256, pattern=r"^[^#]+$")
+    # Collection to ingest into ("" is the default collection)
+    collection: str = Field("", max_length=64, pattern=r"^[A-Za-z0-9_-]*$")
 
 class IngestResponse(BaseModel):
     status: str
     message: str
     doc_id: str
+    chunks_added: int = 0
+    chunks_unchanged: int = 0
+    chunks_removed: int = 0
+    timing: Optional[float] = None
+    # Seconds per ingest stage (ingest_chunk, ingest_embed, ingest_upsert, ingest_delete)
+    timings: Dict[str, float] = {}
+
+class IngestJobResponse(BaseModel):
+    job_id: str
+    status: str
+    title: str
+    source: str
+    doc_id: Optional[str] = None
+    error: Optional[str] = None
+    pages_parsed: int
+    chunks_total: int
+    chunks_embedded: int
+    vectors_upserted: int
+    chunks_unchanged: int
+    chunks_removed: int
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+class QueryFilters(BaseModel):
+    """Restricts retrieval to matching chunks; all given conditions must hold."""
+    doc_ids: Optional[List[str]] = None
+    titles: Optional[List[str]] = None
+    sources: Optional[List[str]] = None
+    # Ingest time range, Unix seconds (inclusive)
+    timestamp_from: Optional[float] = None
+    timestamp_to: Optional[float] = None
 
 class QueryRequest(BaseModel):
     query: str
+    # "auto": Cohere within its deadline, falling back to the local reranker
+    reranker: Literal["auto", "cohere", "local", "none"] = "auto"
+    collection: str = Field("", max_length=64, pattern=r"^[A-Za-z0-9_-]*$")
+    filters: Optional[QueryFilters] = None
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=1000)
+    reranker: Literal["auto", "cohere", "local", "none"] = "auto"
+    collection: str = Field("", max_length=64, pattern=r"^[A-Za-z0-9_-]*$")
+    filters: Optional[QueryFilters] = None
+    # False returns only the reranked citations for each query
+    generate: bool = True
+    max_concurrency: int = Field(8, ge=1, le=32)
 
 class Citation(BaseModel):
     text: str
     metadata: Dict[str, Any]
     score: Optional[float] = None
 
+class Usage(BaseModel):
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    cost_usd: Optional[float] = None
+
 class QueryResponse(BaseModel):
     answer: str
     citations: List[Citation]
     timing: float
+    # Seconds per stage, e.g. embed_query, dense_retrieval, lexical_retrieval, rerank_cohere, generate
+    timings: Dict[str, float] = {}
     cost_estimate: Optional[str] = None
+    # LLM tokens spent on this request (None when nothing was generated, e.g. cache hits)
+    usage: Optional[Usage] = None
+    cache_hit: bool = False
+
+class DeleteDocumentResponse(BaseModel):
+    doc_id: str
+    collection: str
+    chunks_removed: int
 
 # --- Lifespan & App Initialization ---
 
 rag_engine = None
+job_manager = None
+
+async def warm_up_engine():
+    """Resolves (or creates) the vector index in the background after startup,
+    then (unless PREWARM_PROVIDERS=0) imports the remaining provider SDKs."""
+    try:
+        await asyncio.to_thread(rag_engine.warm_up)
+        logger.info("Vector index ready.")
+    except Exception as e:
+        logger.error(f"Index warm-up failed: {e}")
+
+    if os.getenv("PREWARM_PROVIDERS", "1") == "1":
+        try:
+            await asyncio.to_thread(rag_engine.prewarm)
+            logger.info(f"Providers pre-warmed: {rag_engine.providers.init_seconds}")
+        except Exception as e:
+            logger.error(f"Provider pre-warm failed: {e}")
+
+async def sync_metrics_periodically(interval: float):
+    """Publishes this worker's engine counters for /metrics, which any worker may answer."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            sync_engine_metrics()
+        except Exception as e:
+            logger.error(f"Metrics sync failed: {e}")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    global rag_engine
+    global rag_engine, job_manager
     logger.info("Initializing RAG Engine...")
+    setup_tracing()
     rag_engine = RAGEngine()
+    register_engine(rag_engine)
+    warmup_task = asyncio.create_task(warm_up_engine())
+    metrics_task = None
+    if multiprocess_enabled():
+        metrics_task = asyncio.create_task(sync_metrics_periodically(float(os.getenv("METRICS_SYNC_SECONDS", "5"))))
+    job_manager = JobManager(max_workers=int(os.getenv("INGEST_WORKERS", "2")), shared=rag_engine.shared_state)
+    await job_manager.start()
     logger.info("RAG Engine ready.")
     yield
     # Shutdown
     logger.info("Shutting down...")
+    warmup_task.cancel()
+    if metrics_task is not None:
+        metrics_task.cancel()
+    await job_manager.stop()
+    shutdown_pool()
+    await rag_engine.aclose()
+    shutdown_metrics()
 
 app = FastAPI(
     title="Mini RAG API", 
@@ -76,15 +188,69 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- Helpers ---
+
+def format_cost(usage: Optional[Dict[str, Any]]) -> str:
+    if usage is None:
+        return "$0.000000"
+    if usage.get("cost_usd") is None:
+        return "Unknown pricing"
+    return f"${usage['cost_usd']:.6f}"
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Formats one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 # --- API Routes ---
 
+def validate_doc_key(doc_key: Optional[str]) -> Optional[str]:
+    """Form fields bypass the pydantic model, so the doc_key rules are checked here."""
+    if doc_key is not None and (not doc_key or len(doc_key) > 256 or "#" in doc_key):
+        raise HTTPException(status_code=400, detail="doc_key must be 1-256 characters and must not contain '#'.")
+    return doc_key
+
+def validate_collection(collection: str) -> str:
+    """Form fields bypass the pydantic model, so the collection name is checked here."""
+    if collection and not COLLECTION_RE.match(collection):
+        raise HTTPException(status_code=400, detail="collection must be 1-64 letters, digits, '-' or '_'.")
+    return collection
+
+def validate_reranker(reranker: str) -> str:
+    """An explicitly requested reranker that isn't configured is a client error."""
+    try:
+        rag_engine.choose_reranker(reranker)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return reranker
+
+def query_filter(filters: Optional[QueryFilters]) -> Optional[Dict[str, Any]]:
+    return build_filter(**filters.model_dump()) if filters is not None else None
+
+def ingest_response(doc_id: str, result: Dict[str, int], timings: Dict[str, float], start_time: float,
+                    source: str = "") -> IngestResponse:
+    return IngestResponse(
+        status="success",
+        message=(f"Ingested {result['chunks']} chunks{source}: {result['added']} new, "
+                 f"{result['unchanged']} unchanged, {result['removed']} removed."),
+        doc_id=doc_id,
+        chunks_added=result["added"],
+        chunks_unchanged=result["unchanged"],
+        chunks_removed=result["removed"],
+        timing=time.time() - start_time,
+        timings=timings
+    )
+
 @app.post("/ingest", response_model=IngestResponse, summary="Ingest Raw Text")
 async def ingest_text(request: IngestRequest):
     """
     Ingests raw text into the RAG system.
+
+    The document is identified by `doc_key` if given, otherwise by a
+    fingerprint of its content. Re-ingesting the same document only embeds
+    new chunks and deletes chunks that are gone.
     """
     try:
-        doc_id = str(uuid.uuid4())
+        doc_id = request.doc_key or hashlib.sha256(request.text.encode("utf-8")).hexdigest()[:32]
         metadata = {
             "doc_id": doc_id,
             "title": request.title,
@@ -92,47 +258,36 @@ async def ingest_text(request: IngestRequest):
             "timestamp": time.time()
         }
         
-        chunk_count = rag_engine.ingest_document(request.text, metadata)
-        
-        return IngestResponse(
-            status="success", 
-            message=f"Ingested {chunk_count} chunks.", 
-            doc_id=doc_id
-        )
+        start_time = time.time()
+        timings = {}
+        result = await rag_engine.aingest_document(request.text, metadata, timings=timings, collection=request.collection)
+
+        return ingest_response(doc_id, result, timings, start_time)
     except Exception as e:
         logger.error(f"Ingest error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/ingest/file", response_model=IngestResponse, summary="Ingest File (PDF/Text)")
-async def ingest_file(file: UploadFile = File(...)):
+async def ingest_file(file: UploadFile = File(...), doc_key: Optional[str] = Form(None),
+                      collection: str = Form("")):
     """
     Ingests a file (PDF or Text) into the RAG system.
+
+    Pass `doc_key` to re-ingest an edited file in place; without it the
+    document is identified by a fingerprint of the file content. `collection`
+    selects the collection to ingest into.
     """
+    validate_doc_key(doc_key)
+    validate_collection(collection)
+    start_time = time.time()
+    timings = {}
+    path = None
     try:
-        content = await file.read()
+        # Spool to disk instead of holding the whole upload in memory
+        path = await spool_upload(file, suffix=os.path.splitext(file.filename)[1])
         logger.info(f"Ingesting file: {file.filename} ({file.content_type})")
-        
-        # Check file type
-        if file.content_type == "application/pdf" or file.filename.lower().endswith(".pdf"):
-            try:
-                pdf_file = io.BytesIO(content)
-                reader = PdfReader(pdf_file)
-                text = ""
-                for page in reader.pages:
-                    text += page.extract_text() + "\n"
-            except Exception as pdf_err:
-                raise HTTPException(status_code=400, detail=f"Error reading PDF: {str(pdf_err)}")
-        else:
-            # Assume text/markdown
-            try:
-                text = content.decode("utf-8") 
-            except UnicodeDecodeError:
-                raise HTTPException(status_code=400, detail="File encoding not supported. Please upload a UTF-8 text file or PDF.")
-        
-        if not text.strip():
-             raise HTTPException(status_code=400, detail="Extracted text is empty.")
 
-        doc_id = str(uuid.uuid4())
+        doc_id = doc_key or await asyncio.to_thread(fingerprint_file, path)
         metadata = {
             "doc_id": doc_id,
             "title": file.filename,
@@ -140,39 +295,134 @@ async def ingest_file(file: UploadFile = File(...)):
             "timestamp": time.time()
         }
         
-        chunk_count = rag_engine.ingest_document(text, metadata)
-        
-        return IngestResponse(
-            status="success", 
-            message=f"Ingested {chunk_count} chunks from {file.filename}.", 
-            doc_id=doc_id
-        )
+        # Pages are extracted in a process pool and chunked/embedded as they arrive
+        try:
+            result = await rag_engine.aingest_pages(iter_upload_pages(path, file.filename, file.content_type), metadata,
+                                                    timings=timings, collection=collection)
+        except ExtractionError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if result["chunks"] == 0:
+            raise HTTPException(status_code=400, detail="Extracted text is empty.")
+
+        return ingest_response(doc_id, result, timings, start_time, source=f" from {file.filename}")
     except HTTPException as he:
         raise he
     except Exception as e:
         logger.error(f"File ingest error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if path:
+            os.remove(path)
+
+@app.post("/ingest/jobs", response_model=IngestJobResponse, status_code=202, summary="Ingest File in Background")
+async def create_ingest_job(file: UploadFile = File(...), doc_key: Optional[str] = Form(None),
+                            collection: str = Form("")):
+    """
+    Accepts a file (PDF or Text) and ingests it in the background.
+
+    Returns a job immediately; poll `/ingest/jobs/{job_id}` or stream
+    `/ingest/jobs/{job_id}/events` for progress. `doc_key` and `collection`
+    work as for `/ingest/file`.
+    """
+    validate_doc_key(doc_key)
+    validate_collection(collection)
+    filename, content_type = file.filename, file.content_type
+    path = await spool_upload(file, suffix=os.path.splitext(filename)[1])
+    try:
+        logger.info(f"Queueing ingest job for: {filename} ({content_type})")
+
+        async def run(job: IngestJob):
+            job.doc_id = doc_key or await asyncio.to_thread(fingerprint_file, path)
+            metadata = {
+                "doc_id": job.doc_id,
+                "title": filename,
+                "source": "file_upload",
+                "timestamp": time.time()
+            }
+            pages = iter_upload_pages(path, filename, content_type)
+            result = await rag_engine.aingest_pages(pages, metadata, progress=job.record, collection=collection)
+            if result["chunks"] == 0:
+                raise ExtractionError("Extracted text is empty.")
+
+        job = job_manager.submit(IngestJob(title=filename, source="file_upload", cleanup=lambda: os.remove(path)), run)
+    except Exception:
+        # The job never got to own the spooled file
+        os.remove(path)
+        raise
+    return job.to_dict()
+
+def get_job_or_404(job_id: str) -> Dict[str, Any]:
+    """The job's snapshot, also for jobs running on another worker process."""
+    snapshot = job_manager.snapshot(job_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return snapshot
+
+@app.get("/ingest/jobs/{job_id}", response_model=IngestJobResponse, summary="Ingest Job Status")
+async def get_ingest_job(job_id: str):
+    """
+    Returns the status and progress counters of an ingest job.
+    """
+    return get_job_or_404(job_id)
+
+@app.get("/ingest/jobs/{job_id}/events", summary="Stream Ingest Job Progress")
+async def stream_ingest_job(job_id: str):
+    """
+    Streams job snapshots as Server-Sent Events until the job finishes.
+    """
+    get_job_or_404(job_id)
+
+    async def event_stream():
+        async for snapshot in job_manager.watch(job_id):
+            yield sse_event("progress", snapshot)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.delete("/ingest/jobs/{job_id}", response_model=IngestJobResponse, summary="Cancel Ingest Job")
+async def cancel_ingest_job(job_id: str):
+    """
+    Cancels a queued or running ingest job.
+    """
+    get_job_or_404(job_id)
+    return job_manager.cancel(job_id)
+
+@app.delete("/documents/{doc_id:path}", response_model=DeleteDocumentResponse, summary="Delete Document")
+async def delete_document(doc_id: str, collection: str = ""):
+    """
+    Deletes a document (every chunk ingested under its `doc_id`, its BM25
+    entries and stored text) from a collection. Cached answers are
+    invalidated like after an ingest.
+    """
+    validate_collection(collection)
+    try:
+        removed = await rag_engine.adelete_document(doc_id, collection)
+    except Exception as e:
+        logger.error(f"Delete error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if removed == 0:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    return DeleteDocumentResponse(doc_id=doc_id, collection=collection, chunks_removed=removed)
 
 @app.post("/query", response_model=QueryResponse, summary="Query RAG System")
 async def query_rag(request: QueryRequest):
     """
     Queries the RAG system and returns an abstractive answer with citations.
+
+    `collection` and `filters` narrow retrieval to one collection and to
+    chunks of matching documents (doc ids, titles, sources, ingest time).
     """
+    validate_reranker(request.reranker)
     try:
         start_time = time.time()
+        timings = {}
         
-        # 1. Retrieve & Rerank
-        context = rag_engine.search(request.query)
-        
-        if not context:
-            return QueryResponse(
-                answer="I couldn't find any relevant information in the uploaded documents.",
-                citations=[],
-                timing=time.time() - start_time
-            )
-
-        # 2. Generate Answer
-        result = rag_engine.generate_answer(request.query, context)
+        # Retrieve, rerank & generate (served from the answer cache when possible)
+        result = await rag_engine.aanswer(request.query, reranker=request.reranker, timings=timings,
+                                          collection=request.collection, filter=query_filter(request.filters))
         
         elapsed = time.time() - start_time
         
@@ -180,12 +430,153 @@ async def query_rag(request: QueryRequest):
             answer=result['answer'],
             citations=result['citations'],
             timing=elapsed,
-            cost_estimate="Depends on provider" 
+            timings=timings,
+            cost_estimate=format_cost(result['usage']),
+            usage=result['usage'],
+            cache_hit=result['cache_hit']
         )
+    except CircuitOpenError as e:
+        # A provider the answer depends on is failing; tell clients when to come back
+        logger.warning(f"Query rejected: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
     except Exception as e:
         logger.error(f"Query error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/query/stream", summary="Query RAG System (Streaming)")
+async def query_rag_stream(request: QueryRequest):
+    """
+    Streams the answer as Server-Sent Events.
+
+    Emits a `citations` event (retrieved sources and retrieval timing) first,
+    then one `token` event per generated text fragment, and finally `done`
+    with per-stage timings (plus the detailed `stages` breakdown) and token
+    usage. Failures are reported as an
+    `error` event.
+    """
+    validate_reranker(request.reranker)
+
+    async def event_stream():
+        start_time = time.time()
+        stages = {}
+        filter = query_filter(request.filters)
+        try:
+            cached, query_emb, version = await rag_engine.alookup_answer(
+                request.query, request.reranker, timings=stages, collection=request.collection, filter=filter
+            )
+            if cached is not None:
+                timings = {"retrieval": time.time() - start_time}
+                yield sse_event("citations", {"citations": cached["citations"], "timings": timings, "cache_hit": True})
+                yield sse_event("token", {"text": cached["answer"]})
+                timings["total"] = time.time() - start_time
+                yield sse_event("done", {"timings": timings, "stages": stages, "usage": None,
+                                     "cost_estimate": format_cost(None), "cache_hit": True})
+                return
+
+            # 1. Retrieve & Rerank
+            context = await rag_engine.asearch(request.query, query_emb=query_emb, reranker=request.reranker, timings=stages,
+                                               collection=request.collection, filter=filter)
+            with span("pack", stages):
+                context = rag_engine.pack_context(context)
+            timings = {"retrieval": time.time() - start_time}
+            yield sse_event("citations", {"citations": context, "timings": timings, "cache_hit": False})
+
+            usage = None
+            if not context:
+                yield sse_event("token", {"text": NO_CONTEXT_ANSWER})
+            else:
+                # 2. Generate Answer, forwarding tokens as they arrive
+                generation_start = time.time()
+                tokens = []
+                usage = {}
+                async for token in rag_engine.agenerate_answer_stream(request.query, context, usage=usage):
+                    if "first_token" not in timings:
+                        timings["first_token"] = time.time() - start_time
+                    tokens.append(token)
+                    yield sse_event("token", {"text": token})
+                timings["generation"] = time.time() - generation_start
+                # Recorded directly: a span can't stay open across the yields above
+                STAGE_SECONDS.labels(stage="generate").observe(timings["generation"])
+                stages["generate"] = timings["generation"]
+                await rag_engine.astore_answer(request.query, query_emb, version,
+                                               {"answer": "".join(tokens), "citations": context, "usage": usage},
+                                               request.reranker, request.collection, filter)
+
+            timings["total"] = time.time() - start_time
+            yield sse_event("done", {"timings": timings, "stages": stages, "usage": usage,
+                                     "cost_estimate": format_cost(usage), "cache_hit": False})
+        except Exception as e:
+            logger.error(f"Streaming query error: {e}")
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Stop proxies (Render/nginx) from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/query/batch", summary="Batch Query RAG System")
+async def query_rag_batch(request: BatchQueryRequest):
+    """
+    Answers many queries in one request, streamed back as NDJSON.
+
+    All queries are embedded with batched provider calls, then retrieval,
+    reranking and (optionally) generation run concurrently with bounded
+    parallelism. One JSON line is emitted per query as soon as it completes:
+    `{"index", "query", "answer"?, "citations", "cache_hit"?, "timing"}` or
+    `{"index", "query", "error", "timing"}`.
+    """
+    validate_reranker(request.reranker)
+
+    async def result_stream():
+        async for item in rag_engine.asearch_many(
+            request.queries,
+            reranker=request.reranker,
+            generate=request.generate,
+            max_concurrency=request.max_concurrency,
+            collection=request.collection,
+            filter=query_filter(request.filters)
+        ):
+            yield json.dumps(item) + "\n"
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+@app.get("/metrics", summary="Prometheus Metrics")
+async def metrics():
+    """
+    Exposes Prometheus metrics: per-stage latency histograms
+    (`rag_stage_seconds`), stage and provider error counts, embedding retries,
+    ingested / stored chunk counts, cache hit rates, coalesced and hedged
+    requests and circuit breaker states.
+    """
+    return Response(content=metrics_payload(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/ready", summary="Readiness Check")
+async def ready():
+    """
+    Reports whether the vector index warm-up has finished (503 until it has).
+    """
+    if rag_engine is not None and rag_engine.index_ready:
+        return {"status": "ready"}
+    detail = {"status": "warming_up"}
+    if rag_engine is not None and rag_engine.warmup_error:
+        detail = {"status": "error", "message": rag_engine.warmup_error}
+    return JSONResponse(status_code=503, content=detail)
+
+@app.get("/stats", summary="Cache Statistics")
+async def stats():
+    """
+    Reports embedding and answer cache hit/miss counters, chunk store sizes,
+    and how many requests were coalesced or hedged (plus circuit breaker states).
+    """
+    return {
+        "embedding_cache": rag_engine.embedding_cache.stats(),
+        "answer_cache": rag_engine.answer_cache.stats(),
+        "chunk_store": rag_engine.chunk_store.stats() if rag_engine.chunk_store is not None else None,
+        "resilience": rag_engine.resilience_stats()
+    }
+
 
 # --- Static Files / SPA Fallback ---
 frontend_dist_path = os.path.join(os.path.dirname(__file__), "..", "frontend", "dist")
@@ -209,4 +600,15 @@ else:
         return {"status": "ok", "message": "Backend running. Frontend build not found."}
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    # Development entry point: reloads on code changes unless RELOAD=0 (app.py is the production one)
+    workers = int(os.getenv("WORKERS", "1"))
+    reload = os.getenv("RELOAD", "1" if workers == 1 else "0") == "1"
+    prepare_multiprocess_metrics(1 if reload else workers, os.path.join(os.path.dirname(__file__), "data", "prometheus"))
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=1 if reload else workers,
+        reload=reload,
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "30"))
+    )
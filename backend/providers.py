@@ -0,0 +1,80 @@
+import time
+import threading
+from typing import Callable, Dict, Any, Optional, Iterable
+
+
+class ProviderRegistry:
+    """Provider clients that are imported and constructed on first use.
+
+    The SDKs (pinecone, cohere, google.generativeai, openai) take seconds to
+    import on a cold start and a deployment only uses some of them, so each
+    client is registered as a factory instead. The first get() runs the
+    factory (other callers of the same client wait for it); init_seconds
+    records how long each import + construction took.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._clients: Dict[str, Any] = {}
+        self.init_seconds: Dict[str, float] = {}
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        self._factories[name] = factory
+        self._locks[name] = threading.Lock()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._factories
+
+    def loaded(self, name: str) -> bool:
+        return name in self._clients
+
+    def get(self, name: str) -> Any:
+        if name in self._clients:
+            return self._clients[name]
+        if name not in self._factories:
+            raise ValueError(f"Provider '{name}' is not configured.")
+        with self._locks[name]:
+            if name not in self._clients:
+                start = time.perf_counter()
+                self._clients[name] = self._factories[name]()
+                self.init_seconds[name] = time.perf_counter() - start
+        return self._clients[name]
+
+    def prewarm(self, names: Optional[Iterable[str]] = None):
+        """Builds the given (default: all registered) clients now, e.g. from a
+        background task at startup, so no request pays for the imports."""
+        for name in names if names is not None else list(self._factories):
+            self.get(name)
+
+
+def pinecone_client(api_key: str):
+    from pinecone import Pinecone
+    return Pinecone(api_key=api_key)
+
+
+def cohere_client(api_key: str):
+    import cohere
+    return cohere.Client(api_key)
+
+
+def cohere_async_client(api_key: str):
+    import cohere
+    return cohere.AsyncClient(api_key)
+
+
+def openai_client(api_key: str):
+    from openai import OpenAI
+    return OpenAI(api_key=api_key)
+
+
+def openai_async_client(api_key: str):
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=api_key)
+
+
+def gemini_module(api_key: str):
+    """The google.generativeai module, configured with the key."""
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
+    return genai
@@ -1,200 +1,1283 @@
 import os
+import re
+import json
 import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import uuid
-from typing import List, Dict, Any, Optional
+import hashlib
+from itertools import islice
+from contextlib import nullcontext
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator, Callable, Tuple
 from dotenv import load_dotenv
+import numpy as np
 
-# Third-party integrations
-from pinecone import Pinecone, ServerlessSpec
-import cohere
-import google.generativeai as genai
-from openai import OpenAI
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+# Provider SDKs are imported lazily by the registry (see providers.py)
+from providers import (
+    ProviderRegistry, pinecone_client, cohere_client, cohere_async_client,
+    openai_client, openai_async_client, gemini_module
+)
+from vector_store import VectorStore, PineconeVectorStore, LocalVectorStore, matches_filter
+from embedding_cache import EmbeddingCache
+from chunk_store import ChunkStore
+from embedding_scheduler import EmbeddingScheduler, PROVIDER_LIMITS
+from answer_cache import AnswerCache
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from rerank import RERANKERS, mmr_rerank
+from context_packer import ContextPacker, TokenCounter, estimate_cost
+from chunker import Chunker
+from resilience import SingleFlight, ProviderGuard
+from telemetry import span, INGESTED_CHUNKS
+from shared_state import SharedState, file_lock
+from fake_providers import HashEmbedder, EchoLLM
 
 load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
 
+NO_CONTEXT_ANSWER = "I couldn't find any relevant information in the uploaded documents."
+# Document metadata copied onto every vector (kept small so it stays filterable);
+# the rest, and the chunk text, live in the chunk store
+VECTOR_METADATA_FIELDS = ("doc_id", "title", "source", "timestamp")
+# Collection names double as vector store namespaces and directory names
+COLLECTION_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+# Filtered searches take this many times LEXICAL_TOP_K BM25 hits, since the
+# filter is only applied after fetching their metadata
+LEXICAL_FILTER_OVERSAMPLE = 4
+
+
+def build_filter(doc_ids: Optional[List[str]] = None, titles: Optional[List[str]] = None,
+                 sources: Optional[List[str]] = None, timestamp_from: Optional[float] = None,
+                 timestamp_to: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """Metadata filter (Pinecone syntax) over VECTOR_METADATA_FIELDS; None
+    when nothing is restricted. Timestamps are Unix seconds, inclusive."""
+    conditions: Dict[str, Any] = {}
+    if doc_ids:
+        conditions["doc_id"] = {"$in": list(doc_ids)}
+    if titles:
+        conditions["title"] = {"$in": list(titles)}
+    if sources:
+        conditions["source"] = {"$in": list(sources)}
+    timestamp = {}
+    if timestamp_from is not None:
+        timestamp["$gte"] = timestamp_from
+    if timestamp_to is not None:
+        timestamp["$lte"] = timestamp_to
+    if timestamp:
+        conditions["timestamp"] = timestamp
+    return conditions or None
+
+
+def answer_cache_scope(collection: str, filter: Optional[Dict[str, Any]]) -> str:
+    """Answer cache partition of a collection + filter ("" for unscoped queries)."""
+    if not collection and not filter:
+        return ""
+    return json.dumps([collection, filter], sort_keys=True)
+
+
+def shorten_embeddings(embeddings: List[List[float]], dimension: int) -> List[List[float]]:
+    """Keeps the first `dimension` components of each vector and renormalises
+    it, which is how Matryoshka-trained models (text-embedding-3,
+    text-embedding-004) define their shorter embeddings."""
+    vectors = np.asarray(embeddings, dtype=np.float32)[:, :dimension]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).tolist()
+
 class RAGEngine:
-    def __init__(self):
+    def __init__(self, embedder=None, llm=None, vector_store: Optional[VectorStore] = None):
+        """embedder / llm / vector_store replace the configured providers
+        (see fake_providers for the interface); LLM_PROVIDER=fake injects the
+        offline fakes."""
         # Configuration
+        # "openai", "gemini" or "fake"; by default OpenAI when a key is set, else Gemini
+        self.llm_provider = os.getenv("LLM_PROVIDER", "").lower()
+        if self.llm_provider == "fake":
+            latency_ms = float(os.getenv("FAKE_LATENCY_MS", "0"))
+            if embedder is None:
+                embedder = HashEmbedder(int(os.getenv("FAKE_EMBEDDING_DIM", "256")), latency_ms)
+            if llm is None:
+                llm = EchoLLM(latency_ms, float(os.getenv("FAKE_TOKEN_LATENCY_MS", "0")))
+        self.embedder = embedder
+        self.llm = llm
+        offline = embedder is not None and llm is not None
         self.pinecone_api_key = os.getenv("PINECONE_API_KEY")
         self.pinecone_index_name = os.getenv("PINECONE_INDEX_NAME", "mini-rag-index")
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         self.gemini_api_key = os.getenv("GEMINI_API_KEY")
         self.cohere_api_key = os.getenv("COHERE_API_KEY")
+        # "pinecone", "local" or "memory"; defaults to Pinecone when a key is configured
+        default_store = "memory" if offline else "pinecone" if self.pinecone_api_key else "local"
+        self.vector_store_type = os.getenv("VECTOR_STORE", default_store).lower()
+        self.local_index_path = os.getenv("LOCAL_INDEX_PATH", os.path.join(os.path.dirname(__file__), "data", "index"))
+        # Set EMBEDDING_CACHE_PATH to an empty string to keep the cache in memory only
+        self.embedding_cache_path = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(os.path.dirname(__file__), "data", "embeddings.sqlite3"))
+        self.embedding_cache_memory_mb = int(os.getenv("EMBEDDING_CACHE_MEMORY_MB", "64"))
+        # Set CHUNK_STORE_PATH to an empty string to keep chunk text in vector metadata instead
+        self.chunk_store_path = os.getenv("CHUNK_STORE_PATH", os.path.join(os.path.dirname(__file__), "data", "chunks.sqlite3"))
+        # Hybrid retrieval: dense matches fused with a local BM25 index
+        self.hybrid_search = os.getenv("HYBRID_SEARCH", "1") == "1"
+        self.lexical_index_path = os.getenv("LEXICAL_INDEX_PATH", os.path.join(os.path.dirname(__file__), "data", "bm25.jsonl"))
+        self.retrieval_top_k = int(os.getenv("RETRIEVAL_TOP_K", "10" if self.hybrid_search else "20"))
+        self.lexical_top_k = int(os.getenv("LEXICAL_TOP_K", "10"))
+        # Cohere rerank deadline; past it the local MMR reranker is used instead
+        self.cohere_rerank_timeout = float(os.getenv("COHERE_RERANK_TIMEOUT", "1.0"))
+        self.mmr_lambda = float(os.getenv("MMR_LAMBDA", "0.7"))
+        self.rerank_top_n = 5
+        # State shared by all worker processes (corpus version, shared answer cache,
+        # ingest jobs); set SHARED_STATE_PATH to an empty string to keep it per process
+        self.shared_state_path = os.getenv("SHARED_STATE_PATH", os.path.join(os.path.dirname(__file__), "data", "state.sqlite3"))
+        # Tokens of retrieved context allowed into the prompt
+        self.context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+        # Chunk size and overlap in tokens of the embedding model
+        self.chunk_size = int(os.getenv("CHUNK_SIZE", "256"))
+        self.chunk_overlap = int(os.getenv("CHUNK_OVERLAP", "40"))
+
+        # Concurrent identical embedding / retrieval / generation calls share one in-flight call
+        self.singleflight = SingleFlight(enabled=os.getenv("COALESCE_REQUESTS", "1") == "1")
+        self.guard = ProviderGuard(
+            failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+            reset_seconds=float(os.getenv("CIRCUIT_RESET_SECONDS", "30")),
+            hedge_stages=[stage.strip() for stage in os.getenv("HEDGE_STAGES", "").split(",") if stage.strip()],
+            hedge_percentile=float(os.getenv("HEDGE_PERCENTILE", "95")),
+            min_hedge_delay=float(os.getenv("HEDGE_MIN_DELAY_MS", "10")) / 1000
+        )
         
-        # Initialize Clients
-        if self.pinecone_api_key:
-            self.pc = Pinecone(api_key=self.pinecone_api_key)
-        else:
-            self.pc = None
+        # Register Clients; each SDK is imported and its client built on first use
+        # (none of them when running fully offline)
+        self.providers = ProviderRegistry()
+        if self.pinecone_api_key and not offline:
+            self.providers.register("pinecone", lambda: pinecone_client(self.pinecone_api_key))
+        elif not offline:
             print("Warning: PINECONE_API_KEY not found.")
 
-        if self.cohere_api_key:
-            self.co = cohere.Client(self.cohere_api_key)
-        else:
-            self.co = None
+        if self.cohere_api_key and not offline:
+            self.providers.register("cohere", lambda: cohere_client(self.cohere_api_key))
+            self.providers.register("cohere_async", lambda: cohere_async_client(self.cohere_api_key))
+        elif not offline:
             print("Warning: COHERE_API_KEY not found.")
 
         # Determine Embedding & LLM Provider (Prefer OpenAI, fallback to Gemini)
-        self.provider = "openai" if self.openai_api_key else "gemini"
-        
-        if self.provider == "openai":
-            self.openai_client = OpenAI(api_key=self.openai_api_key)
+        if self.llm_provider in ("openai", "gemini"):
+            self.provider = self.llm_provider
+        else:
+            self.provider = "openai" if self.openai_api_key else "gemini"
+
+        if offline:
+            # Model names and the dimension come from the injected providers below
+            pass
+        elif self.provider == "openai":
+            self.providers.register("openai", lambda: openai_client(self.openai_api_key))
+            # One async client per engine so all requests share its connection pool
+            self.providers.register("openai_async", lambda: openai_async_client(self.openai_api_key))
             self.embedding_model = "text-embedding-3-small"
             self.embedding_dim = 1536
+            self.llm_model = "gpt-4o-mini" # Cost effective
         else:
+            # Using gemini-2.5-flash as requested
+            self.llm_model = "gemini-2.5-flash"
             if self.gemini_api_key:
-                genai.configure(api_key=self.gemini_api_key)
+                self.providers.register("gemini", lambda: gemini_module(self.gemini_api_key))
                 self.embedding_model = "models/text-embedding-004"
                 self.embedding_dim = 768
             else:
                 print("Warning: No LLM/Embedding provider keys found.")
 
+        # Injected providers override whatever the keys selected
+        if offline:
+            self.provider = embedder.provider
+        if embedder is not None:
+            self.embedding_model = embedder.model
+            self.embedding_dim = embedder.dimension
+        if llm is not None:
+            self.llm_model = llm.model
+
+        # EMBEDDING_DIM shortens the model's embeddings: natively by the OpenAI /
+        # Gemini APIs, by truncation + renormalisation for injected embedders
+        self.embedding_quantization = os.getenv("EMBEDDING_QUANTIZATION", "none").lower()
+        if hasattr(self, "embedding_dim"):
+            self.native_embedding_dim = self.embedding_dim
+            requested_dim = os.getenv("EMBEDDING_DIM")
+            if requested_dim:
+                self.embedding_dim = int(requested_dim)
+                if not 0 < self.embedding_dim <= self.native_embedding_dim:
+                    raise ValueError(f"EMBEDDING_DIM must be between 1 and {self.native_embedding_dim} for {self.embedding_model}.")
+            # Cached embeddings are only reusable at the same dimension
+            self.embedding_cache_model = self.embedding_model
+            if self.embedding_dim != self.native_embedding_dim:
+                self.embedding_cache_model = f"{self.embedding_model}@{self.embedding_dim}"
+
+        self.context_packer = ContextPacker(self.llm_model, self.context_token_budget)
+        self.chunker = Chunker(
+            TokenCounter(getattr(self, "embedding_model", self.llm_model)),
+            chunk_tokens=self.chunk_size,
+            overlap_tokens=self.chunk_overlap
+        )
+        self.vector_store = vector_store if vector_store is not None else self._create_vector_store()
+        # Set once warm_up (or the first request) has prepared the vector store
+        self.index_ready = False
+        self.warmup_error: Optional[str] = None
+        self._index_lock = threading.Lock()
+        self.embedding_cache = EmbeddingCache(
+            path=self.embedding_cache_path or None,
+            max_memory_bytes=self.embedding_cache_memory_mb * 1024 * 1024
+        )
+
+        self.chunk_store = ChunkStore(self.chunk_store_path) if self.chunk_store_path else None
+
+        self.lexical_index = BM25Index(self.lexical_index_path or None) if self.hybrid_search else None
+        # BM25 indexes of the other collections, opened on first use
+        self._collection_lexical: Dict[str, BM25Index] = {}
+        self._collection_lexical_lock = threading.Lock()
+
+        self.shared_state = SharedState(self.shared_state_path) if self.shared_state_path else None
+        self._ingest_version = 0
+        self.answer_cache = AnswerCache(
+            max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "1000")),
+            ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+            similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95")),
+            path=self.shared_state_path or None,
+            embedding_space=f"{self.provider}:{getattr(self, 'embedding_model', '')}@{getattr(self, 'embedding_dim', '')}"
+        )
+
+        limits = PROVIDER_LIMITS.get(self.provider, PROVIDER_LIMITS["openai"])
+        self.embedding_scheduler = EmbeddingScheduler(
+            self._embed_batch,
+            self._aembed_batch,
+            batch_size=int(os.getenv("EMBED_BATCH_SIZE", limits["batch_size"])),
+            max_concurrency=int(os.getenv("EMBED_CONCURRENCY", limits["max_concurrency"])),
+            requests_per_minute=float(os.getenv("EMBED_REQUESTS_PER_MINUTE", limits["requests_per_minute"]))
+        )
+
+    def _create_vector_store(self) -> Optional[VectorStore]:
+        """Builds the configured vector store backend."""
+        if not hasattr(self, "embedding_dim"):
+            return None
+
+        if self.vector_store_type == "local":
+            return LocalVectorStore(self.local_index_path, self.embedding_dim, self.embedding_quantization)
+        if self.vector_store_type == "memory":
+            return LocalVectorStore(None, self.embedding_dim, self.embedding_quantization)
+        if self.vector_store_type == "pinecone":
+            if "pinecone" not in self.providers:
+                return None
+            if self.embedding_quantization != "none":
+                print("Warning: EMBEDDING_QUANTIZATION only applies to the local vector store; Pinecone stores float vectors.")
+            return PineconeVectorStore(lambda: self.pc, self.pinecone_index_name, self.embedding_dim)
+        raise ValueError(f"Unknown VECTOR_STORE '{self.vector_store_type}'. Use 'pinecone', 'local' or 'memory'.")
+
+    # Provider clients, built by the registry on first access (None when not configured)
+    @property
+    def pc(self):
+        return self.providers.get("pinecone") if "pinecone" in self.providers else None
+
+    @property
+    def co(self):
+        return self.providers.get("cohere") if "cohere" in self.providers else None
+
+    @property
+    def aco(self):
+        return self.providers.get("cohere_async") if "cohere_async" in self.providers else None
+
+    @property
+    def openai_client(self):
+        return self.providers.get("openai")
+
+    @property
+    def async_openai_client(self):
+        return self.providers.get("openai_async")
+
+    @property
+    def genai(self):
+        return self.providers.get("gemini")
+
+    @property
+    def _store_provider(self) -> Optional[str]:
+        """Breaker name for vector store calls; None for in-process stores."""
+        return "pinecone" if isinstance(self.vector_store, PineconeVectorStore) else None
+
+    async def aclose(self):
+        """Releases pooled connections held by the async clients."""
+        if self.providers.loaded("openai_async"):
+            await self.async_openai_client.close()
+
+    @property
+    def ingest_version(self) -> int:
+        """Bumped after every ingest that changed something (by any worker);
+        cached answers from older versions are discarded."""
+        if self.shared_state is not None:
+            return self.shared_state.get_counter("corpus_version")
+        return self._ingest_version
+
+    async def ingest_version_async(self) -> int:
+        """ingest_version, read from the shared state on a worker thread."""
+        if self.shared_state is not None:
+            return await asyncio.to_thread(self.shared_state.get_counter, "corpus_version")
+        return self._ingest_version
+
+    def _bump_ingest_version(self):
+        if self.shared_state is not None:
+            self.shared_state.increment("corpus_version")
+        else:
+            self._ingest_version += 1
+
     def ensure_index(self):
-        """Creates the Pinecone index if it doesn't exist."""
-        if not self.pc: raise ValueError("Pinecone client not initialized.")
+        """Prepares the vector store (creates the Pinecone index / loads the local one) once."""
+        if self.index_ready:
+            return
+        if self.vector_store is None: raise ValueError("Vector store not initialized.")
         
-        existing_indexes = [i.name for i in self.pc.list_indexes()]
-        if self.pinecone_index_name not in existing_indexes:
-            # Create index
-            self.pc.create_index(
-                name=self.pinecone_index_name,
-                dimension=self.embedding_dim,
-                metric="cosine",
-                spec=ServerlessSpec(cloud="aws", region="us-east-1") # defaulting to common region
-            )
-            # Wait for eventual consistency
-            while not self.pc.describe_index(self.pinecone_index_name).status['ready']:
-                time.sleep(1)
+        with self._index_lock:
+            if not self.index_ready:
+                # One worker at a time, so only the first one creates a missing index
+                lock_path = os.path.join(os.path.dirname(os.path.abspath(self.shared_state_path)), "warmup.lock") if self.shared_state_path else None
+                with file_lock(lock_path) if lock_path else nullcontext():
+                    self.vector_store.ensure_ready()
+                self.index_ready = True
 
-        self.index = self.pc.Index(self.pinecone_index_name)
+    def prewarm(self):
+        """Imports and builds every configured provider client and loads the
+        tokenizers, so the first request doesn't pay for them either."""
+        self.providers.prewarm()
+        self.chunker.counter.count("warm up")
+        self.context_packer.count("warm up")
 
-    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Generates embeddings for a list of texts."""
+    def resilience_stats(self) -> Dict[str, Any]:
+        """Requests served by another in-flight call, hedged provider calls and
+        circuit breaker states."""
+        return {"coalesced": dict(self.singleflight.coalesced), **self.guard.stats()}
+
+    def warm_up(self):
+        """One-time startup work so the first request doesn't pay for index discovery."""
+        try:
+            self.ensure_index()
+            self.warmup_error = None
+        except Exception as e:
+            self.warmup_error = str(e)
+            raise
+
+    @staticmethod
+    def _embed_stage(task_type: str) -> str:
+        return "embed_query" if task_type == "retrieval_query" else "embed_documents"
+
+    def _embed_batch(self, texts: List[str], task_type: str) -> List[List[float]]:
+        """Embeds one provider-sized batch with a single API call."""
+        with span("embed_request", provider=self.provider):
+            return self.guard.call(self.provider, self._embed_stage(task_type), lambda: self._embed_request(texts, task_type))
+
+    async def _aembed_batch(self, texts: List[str], task_type: str) -> List[List[float]]:
+        """Async counterpart of _embed_batch; query embeddings may be hedged."""
+        with span("embed_request", provider=self.provider):
+            return await self.guard.acall(self.provider, self._embed_stage(task_type), lambda: self._aembed_request(texts, task_type))
+
+    def _dimension_options(self) -> Dict[str, int]:
+        """Provider arguments asking for EMBEDDING_DIM-sized embeddings."""
+        if self.embedding_dim == self.native_embedding_dim:
+            return {}
+        if self.provider == "openai":
+            return {"dimensions": self.embedding_dim}
+        return {"output_dimensionality": self.embedding_dim}
+
+    def _embed_request(self, texts: List[str], task_type: str) -> List[List[float]]:
+        if self.embedder is not None:
+            embeddings = self.embedder.embed(texts, task_type)
+            if self.embedding_dim != self.native_embedding_dim:
+                embeddings = shorten_embeddings(embeddings, self.embedding_dim)
+            return embeddings
         if self.provider == "openai":
             response = self.openai_client.embeddings.create(
                 input=texts,
-                model=self.embedding_model
+                model=self.embedding_model,
+                **self._dimension_options()
             )
             return [data.embedding for data in response.data]
         else:
-            # Gemini
-            results = []
-            for text in texts:
-                result = genai.embed_content(
-                    model=self.embedding_model,
-                    content=text,
-                    task_type="retrieval_document"
-                )
-                results.append(result['embedding'])
-            return results
+            # Gemini: a list of contents is sent as one batchEmbedContents request
+            result = self.genai.embed_content(
+                model=self.embedding_model,
+                content=texts,
+                task_type=task_type,
+                **self._dimension_options()
+            )
+            return result['embedding']
 
-    def get_query_embedding(self, text: str) -> List[float]:
-        """Generates embedding for a single query."""
+    async def _aembed_request(self, texts: List[str], task_type: str) -> List[List[float]]:
+        if self.embedder is not None:
+            embeddings = await self.embedder.aembed(texts, task_type)
+            if self.embedding_dim != self.native_embedding_dim:
+                embeddings = shorten_embeddings(embeddings, self.embedding_dim)
+            return embeddings
         if self.provider == "openai":
-            response = self.openai_client.embeddings.create(
-                input=text,
-                model=self.embedding_model
+            response = await self.async_openai_client.embeddings.create(
+                input=texts,
+                model=self.embedding_model,
+                **self._dimension_options()
             )
-            return response.data[0].embedding
+            return [data.embedding for data in response.data]
         else:
-            result = genai.embed_content(
+            result = await self.genai.embed_content_async(
                 model=self.embedding_model,
-                content=text,
-                task_type="retrieval_query"
+                content=texts,
+                task_type=task_type,
+                **self._dimension_options()
             )
             return result['embedding']
 
-    def chunk_text(self, text: str, chunk_size: int = 1000, chunk_overlap: int = 150) -> List[str]:
-        """Chunks text using RecursiveCharacterTextSplitter."""
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            separators=["\n\n", "\n", ".", " ", ""]
-        )
-        return splitter.split_text(text)
+    def _embed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        """Calls the embedding provider (no caching), batched and rate limited."""
+        return self.embedding_scheduler.embed(texts, task_type)
+
+    async def _aembed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        """Async counterpart of _embed."""
+        return await self.embedding_scheduler.aembed(texts, task_type)
+
+    def _cache_keys(self, texts: List[str], task_type: str) -> List[str]:
+        return [EmbeddingCache.make_key(self.provider, self.embedding_cache_model, task_type, text) for text in texts]
+
+    @staticmethod
+    def _cache_misses(keys: List[str], texts: List[str], embeddings: List) -> Dict[str, str]:
+        # Deduplicate misses so repeated chunks are embedded once
+        missing: Dict[str, str] = {}
+        for key, text, emb in zip(keys, texts, embeddings):
+            if emb is None:
+                missing.setdefault(key, text)
+        return missing
+
+    def _cache_lookup(self, texts: List[str], task_type: str):
+        """Returns (keys, cached embeddings or None, {key: text} of deduplicated misses)."""
+        keys = self._cache_keys(texts, task_type)
+        embeddings = self.embedding_cache.get_many(keys)
+        return keys, embeddings, self._cache_misses(keys, texts, embeddings)
+
+    async def _acache_lookup(self, texts: List[str], task_type: str):
+        keys = self._cache_keys(texts, task_type)
+        embeddings = await self.embedding_cache.aget_many(keys)
+        return keys, embeddings, self._cache_misses(keys, texts, embeddings)
+
+    @staticmethod
+    def _merge_fresh(keys: List[str], embeddings: List, fresh: Dict[str, List[float]]) -> List[List[float]]:
+        return [emb if emb is not None else fresh[key] for key, emb in zip(keys, embeddings)]
+
+    def _cached_embed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        """Serves embeddings from the cache and only sends the misses to the provider."""
+        keys, embeddings, missing = self._cache_lookup(texts, task_type)
+        if not missing:
+            return embeddings
+        fresh = dict(zip(missing.keys(), self._embed(list(missing.values()), task_type)))
+        self.embedding_cache.put_many(fresh)
+        return self._merge_fresh(keys, embeddings, fresh)
 
-    def ingest_document(self, text: str, metadata: Dict[str, Any]):
-        """Chunks, embeds, and upserts text to Pinecone."""
+    async def _acached_embed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        """Async _cached_embed; concurrent requests for the same misses (e.g. a
+        popular question) share one provider call."""
+        keys, embeddings, missing = await self._acache_lookup(texts, task_type)
+        if not missing:
+            return embeddings
+
+        async def embed_missing():
+            fresh = dict(zip(missing.keys(), await self._aembed(list(missing.values()), task_type)))
+            await self.embedding_cache.aput_many(fresh)
+            return fresh
+
+        fresh, _ = await self.singleflight.do("embed", (task_type, *missing), embed_missing)
+        return self._merge_fresh(keys, embeddings, fresh)
+
+    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generates embeddings for a list of texts."""
+        return self._cached_embed(texts, "retrieval_document")
+
+    def get_query_embedding(self, text: str) -> List[float]:
+        """Generates embedding for a single query."""
+        return self._cached_embed([text], "retrieval_query")[0]
+
+    def get_query_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Embeds many queries with batched provider calls."""
+        return self._cached_embed(texts, "retrieval_query")
+
+    async def get_embeddings_async(self, texts: List[str]) -> List[List[float]]:
+        return await self._acached_embed(texts, "retrieval_document")
+
+    async def get_query_embedding_async(self, text: str) -> List[float]:
+        return (await self._acached_embed([text], "retrieval_query"))[0]
+
+    async def get_query_embeddings_async(self, texts: List[str]) -> List[List[float]]:
+        return await self._acached_embed(texts, "retrieval_query")
+
+    def chunk_text(self, text: str) -> List[str]:
+        """Chunks text with the engine's chunker (CHUNK_SIZE / CHUNK_OVERLAP tokens)."""
+        return [chunk["text"] for chunk in self.chunker.split(text)]
+
+    def ingest_document(self, text: str, metadata: Dict[str, Any], timings: Optional[Dict[str, float]] = None,
+                        collection: str = "") -> Dict[str, int]:
+        """Chunks, embeds, and upserts text to the vector store.
+
+        Incremental like aingest_pages: only chunks not already stored for
+        metadata['doc_id'] are embedded, and chunks that disappeared are deleted.
+        """
+        self._check_collection(collection)
         self.ensure_index()
-        
-        chunks = self.chunk_text(text)
-        embeddings = self.get_embeddings(chunks)
-        
+
+        doc_id = metadata.get('doc_id')
+        existing = set(self.vector_store.list_ids(f"{doc_id}#", namespace=collection))
+        with span("ingest_chunk", timings):
+            chunks = self._plan_chunks(doc_id, list(self.chunker.split(text)), 0, {})
+        if self.chunk_store is not None:
+            self.chunk_store.put_document(self._chunk_key(collection, doc_id), metadata)
+
+        stored = self.vector_store.fetch([c["id"] for c in chunks if c["id"] in existing], namespace=collection) if existing else {}
+        writes = [c for c in chunks if c["id"] not in existing or self._moved(c, stored.get(c["id"]))]
+        relabels = self._relabels(chunks, writes, stored, metadata)
+        removed = list(existing - {c["id"] for c in chunks})
+
+        changed = False
+        try:
+            if writes:
+                changed = True
+                with span("ingest_embed", timings):
+                    embeddings = self.get_embeddings([c["text"] for c in writes])
+                vectors = self._build_vectors(writes, embeddings, metadata)
+                with span("ingest_upsert", timings):
+                    self._store_chunks(doc_id, writes, collection)
+                    self.vector_store.upsert(vectors, namespace=collection)
+                    self._index_lexical(writes, collection)
+            if relabels:
+                changed = True
+                with span("ingest_upsert", timings):
+                    self._relabel(relabels, metadata, collection)
+            if removed:
+                changed = True
+                with span("ingest_delete", timings):
+                    self._delete_chunks(removed, collection)
+        finally:
+            if changed:
+                self._bump_ingest_version()
+
+        added = sum(1 for c in chunks if c["id"] not in existing)
+        counts = {"chunks": len(chunks), "added": added, "unchanged": len(chunks) - added, "removed": len(removed)}
+        self._record_ingest(counts)
+        return counts
+
+    async def aingest_document(self, text: str, metadata: Dict[str, Any], batch_size: Optional[int] = None,
+                               progress: Optional[Callable[..., None]] = None,
+                               timings: Optional[Dict[str, float]] = None, collection: str = "") -> Dict[str, int]:
+        """Async ingest of a single text; see aingest_pages."""
+        async def single_page():
+            yield None, text
+
+        return await self.aingest_pages(single_page(), metadata, batch_size=batch_size, progress=progress,
+                                        timings=timings, collection=collection)
+
+    async def aingest_pages(self, pages: AsyncIterator[Tuple[Optional[int], str]], metadata: Dict[str, Any],
+                            batch_size: Optional[int] = None, progress: Optional[Callable[..., None]] = None,
+                            timings: Optional[Dict[str, float]] = None, collection: str = "") -> Dict[str, int]:
+        """Streams (page_number, text) pairs through chunk -> embed -> upsert.
+
+        Pages are split lazily, so embedding starts as soon as a batch of
+        chunks is available, even within a long page, and the upsert of one
+        batch overlaps the embedding of the next. Chunks carry their page
+        number (when known) and character offsets within it in metadata;
+        consecutive pageless blocks count as one text. progress, if given,
+        is called with pages=, chunks=, embedded=, upserted=, unchanged= and
+        removed= counts as each stage advances.
+
+        Ingest is incremental per metadata['doc_id']: vector ids are derived
+        from chunk content, so chunks already stored for the document are
+        skipped (only re-upserted if they moved to another page), and chunks
+        that no longer exist are deleted once the new ones are in place.
+        Returns {"chunks", "added", "unchanged", "removed"} counts; timings, if
+        given, collects the seconds spent per stage (embedding and upserts
+        overlap, so stages can add up to more than the wall time).
+
+        collection names the namespace the document goes into ("" is the
+        default); the same doc_id in two collections is two documents.
+        """
+        self._check_collection(collection)
+        progress = progress or (lambda **counts: None)
+        if batch_size is None:
+            # Enough texts per stage to keep every concurrent embedding request busy
+            batch_size = self.embedding_scheduler.batch_size * self.embedding_scheduler.max_concurrency
+
+        if not self.index_ready:
+            await asyncio.to_thread(self.ensure_index)
+
+        doc_id = metadata.get('doc_id')
+        existing = set(await self.vector_store.alist_ids(f"{doc_id}#", namespace=collection))
+        if self.chunk_store is not None:
+            await asyncio.to_thread(self.chunk_store.put_document, self._chunk_key(collection, doc_id), metadata)
+        seen = set()
+        occurrences: Dict[str, int] = {}
+        counts = {"chunks": 0, "added": 0, "unchanged": 0, "removed": 0}
+        changed = False
+
+        async def upsert(chunks, vectors):
+            with span("ingest_upsert", timings):
+                # Text first, so a vector is never visible without it
+                await asyncio.to_thread(self._store_chunks, doc_id, chunks, collection)
+                await self.vector_store.aupsert(vectors, namespace=collection)
+                await asyncio.to_thread(self._index_lexical, chunks, collection)
+            progress(upserted=len(vectors))
+
+        pending_upsert = None
+        buffer: List[Dict[str, Any]] = []
+
+        async def flush(batch):
+            nonlocal pending_upsert, changed
+            known = [c["id"] for c in batch if c["id"] in existing]
+            stored = await self.vector_store.afetch(known, namespace=collection) if known else {}
+            writes = [c for c in batch if c["id"] not in existing or self._moved(c, stored.get(c["id"]))]
+            relabels = self._relabels(batch, writes, stored, metadata)
+            counts["added"] += len(batch) - len(known)
+            counts["unchanged"] += len(known)
+            progress(unchanged=len(known))
+            if relabels:
+                changed = True
+                with span("ingest_upsert", timings):
+                    await asyncio.to_thread(self._relabel, relabels, metadata, collection)
+            if not writes:
+                return
+
+            with span("ingest_embed", timings):
+                embeddings = await self.get_embeddings_async([c["text"] for c in writes])
+            progress(embedded=len(writes))
+            vectors = self._build_vectors(writes, embeddings, metadata)
+
+            if pending_upsert is not None:
+                await pending_upsert
+            changed = True
+            pending_upsert = asyncio.create_task(upsert(writes, vectors))
+
+        # Pageless blocks (text uploads) are consecutive slices of one text;
+        # their chunk offsets are shifted to be relative to the whole of it
+        text_offset = 0
+        try:
+            async for page, page_text in pages:
+                if page is not None:
+                    progress(pages=1)
+                    base = 0
+                else:
+                    base = text_offset
+                    text_offset += len(page_text)
+                page_chunks = self.chunker.split(page_text, page)
+                while True:
+                    # Split only as far as the next batch needs
+                    with span("ingest_chunk", timings):
+                        piece = await asyncio.to_thread(lambda: list(islice(page_chunks, batch_size - len(buffer))))
+                    if not piece:
+                        break
+                    if base:
+                        piece = [{**c, "start": c["start"] + base, "end": c["end"] + base} for c in piece]
+                    progress(chunks=len(piece))
+                    piece = self._plan_chunks(doc_id, piece, counts["chunks"], occurrences)
+                    counts["chunks"] += len(piece)
+                    seen.update(c["id"] for c in piece)
+                    buffer.extend(piece)
+
+                    if len(buffer) >= batch_size:
+                        await flush(buffer)
+                        buffer = []
+
+            if buffer:
+                await flush(buffer)
+            if pending_upsert is not None:
+                await pending_upsert
+
+            # Only drop old chunks after the new version is fully stored
+            removed = list(existing - seen)
+            if removed:
+                changed = True
+                with span("ingest_delete", timings):
+                    await asyncio.to_thread(self._delete_chunks, removed, collection)
+                counts["removed"] = len(removed)
+                progress(removed=len(removed))
+        except BaseException:
+            if pending_upsert is not None and not pending_upsert.done():
+                pending_upsert.cancel()
+            raise
+        finally:
+            if changed:
+                await asyncio.to_thread(self._bump_ingest_version)
+
+        self._record_ingest(counts)
+        return counts
+
+    @staticmethod
+    def _record_ingest(counts: Dict[str, int]):
+        for outcome in ("added", "unchanged", "removed"):
+            INGESTED_CHUNKS.labels(outcome=outcome).inc(counts[outcome])
+
+    def _plan_chunks(self, doc_id: str, chunks: List[Dict[str, Any]], start_index: int,
+                     occurrences: Dict[str, int]) -> List[Dict[str, Any]]:
+        """Adds content-derived vector ids to Chunker output: f"{doc_id}#{chunk_hash}",
+        with a ".n" suffix for the n-th repeat of identical text within the document."""
+        planned = []
+        for i, chunk in enumerate(chunks, start=start_index):
+            chunk_hash = hashlib.sha256(chunk["text"].encode("utf-8")).hexdigest()[:32]
+            n = occurrences.get(chunk_hash, 0)
+            occurrences[chunk_hash] = n + 1
+            vector_id = f"{doc_id}#{chunk_hash}" if n == 0 else f"{doc_id}#{chunk_hash}.{n}"
+            planned.append({**chunk, "id": vector_id, "hash": chunk_hash, "index": i})
+        return planned
+
+    @staticmethod
+    def _moved(chunk: Dict[str, Any], stored: Optional[Dict[str, Any]]) -> bool:
+        """True if an already stored chunk now sits on a different page."""
+        return stored is not None and stored["metadata"].get('page') != chunk["page"]
+
+    def _document_fields(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """The document metadata every chunk vector carries."""
+        if self.chunk_store is not None:
+            return {key: metadata[key] for key in VECTOR_METADATA_FIELDS if key in metadata}
+        return dict(metadata)
+
+    def _relabels(self, chunks: List[Dict[str, Any]], writes: List[Dict[str, Any]],
+                  stored: Dict[str, Dict[str, Any]], metadata: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Unchanged chunks whose vectors still carry an older version of the
+        document metadata (e.g. a new title or ingest timestamp)."""
+        fields = self._document_fields(metadata)
+        written = {c["id"] for c in writes}
+        return [
+            c for c in chunks
+            if c["id"] in stored and c["id"] not in written
+            and any(stored[c["id"]]["metadata"].get(key) != value for key, value in fields.items())
+        ]
+
+    def _relabel(self, chunks: List[Dict[str, Any]], metadata: Dict[str, Any], collection: str = ""):
+        """Re-upserts the stored vectors of chunks with the current document
+        metadata, so metadata filters see it; nothing is re-embedded."""
+        stored = self.vector_store.fetch([c["id"] for c in chunks], namespace=collection, include_values=True)
+        chunks = [c for c in chunks if c["id"] in stored]
+        if chunks:
+            vectors = self._build_vectors(chunks, [stored[c["id"]]["values"] for c in chunks], metadata)
+            self.vector_store.upsert(vectors, namespace=collection)
+
+    def _delete_chunks(self, ids: List[str], collection: str = ""):
+        self.vector_store.delete(ids, namespace=collection)
+        lexical_index = self._lexical_for(collection)
+        if lexical_index is not None:
+            lexical_index.remove(ids)
+        if self.chunk_store is not None:
+            self.chunk_store.delete_chunks([self._chunk_key(collection, chunk_id) for chunk_id in ids])
+
+    def _store_chunks(self, doc_id: str, chunks: List[Dict[str, Any]], collection: str = ""):
+        if self.chunk_store is not None:
+            self.chunk_store.put_chunks([(self._chunk_key(collection, c["id"]), self._chunk_key(collection, doc_id), c["text"])
+                                         for c in chunks])
+
+    def _index_lexical(self, chunks: List[Dict[str, Any]], collection: str = ""):
+        lexical_index = self._lexical_for(collection)
+        if lexical_index is not None:
+            lexical_index.add([c["id"] for c in chunks], [c["text"] for c in chunks])
+
+    @staticmethod
+    def _check_collection(collection: str):
+        if collection and not COLLECTION_RE.match(collection):
+            raise ValueError("Collection names must be 1-64 letters, digits, '-' or '_'.")
+
+    @staticmethod
+    def _chunk_key(collection: str, key: str) -> str:
+        """Chunk store key of a chunk or document id. Ids are only unique per
+        collection; doc ids never contain '#', so the prefix can't collide."""
+        return f"{collection}#{key}" if collection else key
+
+    def _lexical_for(self, collection: str) -> Optional[BM25Index]:
+        """The collection's BM25 index (a log under collections/<name>/ next to LEXICAL_INDEX_PATH)."""
+        if not collection or self.lexical_index is None:
+            return self.lexical_index
+        with self._collection_lexical_lock:
+            if collection not in self._collection_lexical:
+                path = None
+                if self.lexical_index_path:
+                    root, name = os.path.split(self.lexical_index_path)
+                    path = os.path.join(root, "collections", collection, name)
+                self._collection_lexical[collection] = BM25Index(path)
+            return self._collection_lexical[collection]
+
+    def delete_document(self, doc_id: str, collection: str = "") -> int:
+        """Removes every chunk of a document (vectors, BM25 entries, text) and
+        its metadata; returns the number of chunks removed."""
+        self._check_collection(collection)
+        self.ensure_index()
+        ids = self.vector_store.list_ids(f"{doc_id}#", namespace=collection)
+        if ids:
+            try:
+                self._delete_chunks(ids, collection)
+            finally:
+                self._bump_ingest_version()
+        if self.chunk_store is not None:
+            self.chunk_store.delete_document(self._chunk_key(collection, doc_id))
+        return len(ids)
+
+    async def adelete_document(self, doc_id: str, collection: str = "") -> int:
+        return await asyncio.to_thread(self.delete_document, doc_id, collection)
+
+    def _build_vectors(self, chunks: List[Dict[str, Any]], embeddings: List[List[float]], metadata: Dict[str, Any]) -> List[Dict]:
+        metadata = self._document_fields(metadata)
+
         vectors = []
-        for i, (chunk, emb) in enumerate(zip(chunks, embeddings)):
-            vector_id = f"{metadata.get('doc_id')}_{i}"
+        for chunk, emb in zip(chunks, embeddings):
             # Add chunk specific metadata
             chunk_metadata = metadata.copy()
-            chunk_metadata['text'] = chunk
-            chunk_metadata['chunk_index'] = i
-            
+            if self.chunk_store is None:
+                chunk_metadata['text'] = chunk["text"]
+            chunk_metadata['chunk_index'] = chunk["index"]
+            chunk_metadata['chunk_hash'] = chunk["hash"]
+            # Like chunk_index, offsets describe the document version the chunk was last written in
+            chunk_metadata['char_start'] = chunk["start"]
+            chunk_metadata['char_end'] = chunk["end"]
+            if chunk["page"] is not None:
+                chunk_metadata['page'] = chunk["page"]
+
             vectors.append({
-                "id": vector_id,
+                "id": chunk["id"],
                 "values": emb,
                 "metadata": chunk_metadata
             })
-            
-        # Batch upsert (Pinecone limit is usually 100-200 vectors per request)
-        batch_size = 100
-        for i in range(0, len(vectors), batch_size):
-            batch = vectors[i:i+batch_size]
-            self.index.upsert(vectors=batch)
-            
-        return len(vectors)
+        return vectors
+
+    def search(self, query: str, top_k: Optional[int] = None, query_emb: Optional[List[float]] = None,
+               reranker: str = "auto", timings: Optional[Dict[str, float]] = None,
+               collection: str = "", filter: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """Retrieves and then reranks results.
 
-    def search(self, query: str, top_k: int = 20) -> List[Dict]:
-        """Retrieves and then reranks results."""
+        reranker is "auto" (Cohere within its deadline, else local), "cohere",
+        "local" (in-process cosine + MMR) or "none" (retrieval order).
+        timings, if given, collects the seconds spent in each stage.
+        collection and filter (see build_filter) restrict the search to one
+        collection and to the chunks whose metadata matches.
+        """
+        self._check_collection(collection)
         self.ensure_index()
-        
+        reranker = self.choose_reranker(reranker)
+        # The local reranker scores the stored chunk vectors, so fetch them with the matches
+        values = reranker == "local"
+
         # 1. Retrieval
-        query_emb = self.get_query_embedding(query)
-        results = self.index.query(
-            vector=query_emb,
-            top_k=top_k,
-            include_metadata=True
-        )
+        if query_emb is None:
+            with span("embed_query", timings):
+                query_emb = self.get_query_embedding(query)
+        with span("dense_retrieval", timings):
+            results = self.guard.call(self._store_provider, "dense_retrieval", lambda: self.vector_store.query(
+                vector=query_emb,
+                top_k=top_k or self.retrieval_top_k,
+                include_metadata=True,
+                filter=filter,
+                namespace=collection,
+                include_values=values
+            ))
         
         matches = results['matches']
-        docs = [match['metadata']['text'] for match in matches]
-        
-        if not docs:
-            return []
-
-        # 2. Rerank (if Cohere is available)
-        if self.co:
-            rerank_results = self.co.rerank(
-                model='rerank-english-v3.0',
-                query=query,
-                documents=docs,
-                top_n=5 # Return top 5 after reranking
-            )
-            
-            final_results = []
-            for rr in rerank_results.results:
-                # Map back to original metadata
-                original_match = matches[rr.index]
-                final_results.append({
-                    "score": rr.relevance_score,
-                    "text": original_match['metadata']['text'],
-                    "metadata": original_match['metadata']
-                })
-            return final_results
-        
+        lexical_index = self._lexical_for(collection)
+        if lexical_index is not None:
+            with span("lexical_retrieval", timings):
+                lexical_hits = lexical_index.search(query, self._lexical_limit(filter))
+            missing = self._missing_ids(matches, lexical_hits)
+            with span("fetch", timings):
+                fetched = self.guard.call(self._store_provider, "fetch", lambda: self.vector_store.fetch(missing, namespace=collection, include_values=values)) if missing else {}
+            matches = self._fuse(matches, lexical_hits, self._filter_fetched(fetched, filter))
+
+        # 2. Rerank (Cohere scores every candidate's text; the local reranker scores
+        # the stored vectors, so it and "none" only need the text of the top-n shown)
+        if reranker == "cohere":
+            with span("hydrate", timings):
+                matches = self._hydrate(matches, collection)
+            docs = [match['metadata']['text'] for match in matches]
+            if not docs:
+                return []
+            try:
+                with span("rerank_cohere", timings, provider="cohere"):
+                    rerank_results = self.guard.call("cohere", "rerank_cohere", lambda: self.co.rerank(
+                        model='rerank-english-v3.0',
+                        query=query,
+                        documents=docs,
+                        top_n=self.rerank_top_n,
+                        request_options={"timeout_in_seconds": self.cohere_rerank_timeout}
+                    ))
+                return self._format_reranked(matches, rerank_results)
+            except Exception as e:
+                print(f"Warning: Cohere rerank failed ({e}); using local reranker.")
+                reranker = "local"
+
+        if reranker == "local":
+            with span("hydrate", timings):
+                matches = self._hydrate(matches, collection, keep_embedded=True)
+            with span("rerank_local", timings):
+                ranked = mmr_rerank(query_emb, self._candidate_embeddings(matches), self.rerank_top_n, self.mmr_lambda)
+            matches = self._picked(matches, ranked)
         else:
-            # Fallback if no reranker: just return top 5 by vector score
-            final_results = []
-            for match in matches[:5]:
-                final_results.append({
-                    "score": match['score'],
-                    "text": match['metadata']['text'],
-                    "metadata": match['metadata']
-                })
-            return final_results
+            # No reranker: just the top 5 by retrieval score
+            matches = matches[:self.rerank_top_n]
 
-    def generate_answer(self, query: str, context_chunks: List[Dict]) -> Dict:
-        """Generates answer using LLM."""
-        
+        with span("hydrate", timings):
+            matches = self._hydrate(matches, collection)
+        return self._format_top(matches, self.rerank_top_n)
+
+    async def asearch(self, query: str, top_k: Optional[int] = None, query_emb: Optional[List[float]] = None,
+                      reranker: str = "auto", timings: Optional[Dict[str, float]] = None,
+                      collection: str = "", filter: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """Async retrieve + rerank; see search for the options and timings.
+
+        Concurrent searches for the same query and options share one retrieval;
+        the stage timings are then only collected by the caller that ran it.
+        """
+        self._check_collection(collection)
+        # The corpus version isn't part of the key: an ingest finishing while a
+        # search is in flight doesn't change what that search returns either
+        results, _ = await self.singleflight.do(
+            "search", (query, top_k, reranker, collection, json.dumps(filter, sort_keys=True)),
+            lambda: self._asearch(query, top_k, query_emb, reranker, timings, collection, filter)
+        )
+        return results
+
+    async def _asearch(self, query: str, top_k: Optional[int], query_emb: Optional[List[float]],
+                       reranker: str, timings: Optional[Dict[str, float]], collection: str,
+                       filter: Optional[Dict[str, Any]]) -> List[Dict]:
+        if not self.index_ready:
+            await asyncio.to_thread(self.ensure_index)
+        reranker = self.choose_reranker(reranker)
+        values = reranker == "local"
+
+        # 1. Retrieval (dense and lexical run concurrently)
+        if query_emb is None:
+            with span("embed_query", timings):
+                query_emb = await self.get_query_embedding_async(query)
+
+        async def dense():
+            with span("dense_retrieval", timings):
+                return await self.guard.acall(self._store_provider, "dense_retrieval", lambda: self.vector_store.aquery(
+                    vector=query_emb,
+                    top_k=top_k or self.retrieval_top_k,
+                    include_metadata=True,
+                    filter=filter,
+                    namespace=collection,
+                    include_values=values
+                ))
+
+        lexical_index = self._lexical_for(collection)
+
+        async def lexical():
+            with span("lexical_retrieval", timings):
+                return await asyncio.to_thread(lexical_index.search, query, self._lexical_limit(filter))
+
+        if lexical_index is not None:
+            results, lexical_hits = await asyncio.gather(dense(), lexical())
+            missing = self._missing_ids(results['matches'], lexical_hits)
+            with span("fetch", timings):
+                fetched = await self.guard.acall(self._store_provider, "fetch", lambda: self.vector_store.afetch(missing, namespace=collection, include_values=values)) if missing else {}
+            matches = self._fuse(results['matches'], lexical_hits, self._filter_fetched(fetched, filter))
+        else:
+            matches = (await dense())['matches']
+
+        # 2. Rerank
+        if reranker == "cohere":
+            with span("hydrate", timings):
+                matches = await asyncio.to_thread(self._hydrate, matches, collection)
+            docs = [match['metadata']['text'] for match in matches]
+            if not docs:
+                return []
+            try:
+                with span("rerank_cohere", timings, provider="cohere"):
+                    rerank_results = await self.guard.acall(
+                        "cohere", "rerank_cohere",
+                        lambda: self.aco.rerank(
+                            model='rerank-english-v3.0',
+                            query=query,
+                            documents=docs,
+                            top_n=self.rerank_top_n
+                        ),
+                        timeout=self.cohere_rerank_timeout
+                    )
+                return self._format_reranked(matches, rerank_results)
+            except Exception as e:
+                print(f"Warning: Cohere rerank failed ({e!r}); using local reranker.")
+                reranker = "local"
+
+        if reranker == "local":
+            with span("hydrate", timings):
+                matches = await asyncio.to_thread(self._hydrate, matches, collection, True)
+            with span("rerank_local", timings):
+                candidate_embs = await self._acandidate_embeddings(matches)
+                ranked = await asyncio.to_thread(mmr_rerank, query_emb, candidate_embs, self.rerank_top_n, self.mmr_lambda)
+            matches = self._picked(matches, ranked)
+        else:
+            matches = matches[:self.rerank_top_n]
+
+        with span("hydrate", timings):
+            matches = await asyncio.to_thread(self._hydrate, matches, collection)
+        return self._format_top(matches, self.rerank_top_n)
+
+    def choose_reranker(self, reranker: str) -> str:
+        """Resolves "auto" to Cohere when configured, else the local reranker."""
+        if reranker not in RERANKERS:
+            raise ValueError(f"Unknown reranker '{reranker}'. Use one of {', '.join(RERANKERS)}.")
+        if reranker == "auto":
+            return "cohere" if "cohere" in self.providers else "local"
+        if reranker == "cohere" and "cohere" not in self.providers:
+            raise ValueError("Cohere reranker requested but COHERE_API_KEY is not set.")
+        return reranker
+
+    async def aanswer(self, query: str, reranker: str = "auto", query_emb: Optional[List[float]] = None,
+                      timings: Optional[Dict[str, float]] = None, collection: str = "",
+                      filter: Optional[Dict[str, Any]] = None) -> Dict:
+        """Search + generate behind the answer cache.
+
+        Returns {"answer", "citations", "usage", "cache_hit"}; an exact or near-duplicate
+        question answered since the last ingest is served without retrieval or
+        generation. Only "auto" reranking is cached, so an explicitly chosen
+        reranker always runs. timings, if given, collects seconds per stage.
+        Answers are cached per collection and filter.
+        """
+        self._check_collection(collection)
+        cached, query_emb, version = await self.alookup_answer(query, reranker, query_emb, timings, collection, filter)
+        if cached is not None:
+            # Nothing was spent on this request
+            return {**cached, "usage": None, "cache_hit": True}
+
+        context = await self.asearch(query, query_emb=query_emb, reranker=reranker, timings=timings,
+                                     collection=collection, filter=filter)
+        if not context:
+            return {"answer": NO_CONTEXT_ANSWER, "citations": [], "usage": None, "cache_hit": False}
+
+        with span("generate", timings, provider=self.provider):
+            result = await self.agenerate_answer(query, context)
+        await self.astore_answer(query, query_emb, version, result, reranker, collection, filter)
+        return {**result, "cache_hit": False}
+
+    async def alookup_answer(self, query: str, reranker: str = "auto", query_emb: Optional[List[float]] = None,
+                             timings: Optional[Dict[str, float]] = None, collection: str = "",
+                             filter: Optional[Dict[str, Any]] = None) -> Tuple[Optional[Dict], Optional[List[float]], int]:
+        """Answer cache lookup shared by aanswer and the streaming endpoint.
+
+        Returns (cached result or None, query embedding, corpus version); pass
+        the latter two to astore_answer. An exact repeat of a question is served
+        before anything is embedded, so on such a hit the embedding may be None.
+        """
+        version = await self.ingest_version_async()
+        scope = answer_cache_scope(collection, filter)
+        use_cache = reranker == "auto"
+
+        if use_cache:
+            with span("answer_cache", timings):
+                cached = await self.answer_cache.aget_exact(query, version, scope)
+            if cached is not None:
+                return cached, query_emb, version
+
+        if query_emb is None:
+            with span("embed_query", timings):
+                query_emb = await self.get_query_embedding_async(query)
+
+        cached = None
+        if use_cache:
+            with span("answer_cache", timings):
+                cached = await self.answer_cache.aget(query, query_emb, version, scope)
+        return cached, query_emb, version
+
+    async def astore_answer(self, query: str, query_emb: List[float], version: int, result: Dict[str, Any],
+                            reranker: str = "auto", collection: str = "", filter: Optional[Dict[str, Any]] = None):
+        """Caches a generated answer looked up with alookup_answer (only "auto" reranking is cached)."""
+        if reranker == "auto":
+            await self.answer_cache.aput(query, query_emb, version, result, answer_cache_scope(collection, filter))
+
+    def search_many(self, queries: List[str], reranker: str = "auto", max_concurrency: int = 8,
+                    collection: str = "", filter: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """Searches many queries: one batched embedding call, then retrieval and
+        reranking fanned out over a bounded thread pool.
+
+        Returns one {"index", "query", "citations" | "error", "timing", "timings"}
+        dict per query, in input order; timings is the per-stage breakdown.
+        """
+        query_embs = self.get_query_embeddings(queries)
+
+        def run(item):
+            i, (query, query_emb) = item
+            start = time.time()
+            timings: Dict[str, float] = {}
+            try:
+                result = {"index": i, "query": query, "citations": self.search(query, query_emb=query_emb, reranker=reranker, timings=timings,
+                                                                               collection=collection, filter=filter)}
+            except Exception as e:
+                result = {"index": i, "query": query, "error": str(e)}
+            result["timing"] = time.time() - start
+            result["timings"] = timings
+            return result
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+            return list(pool.map(run, enumerate(zip(queries, query_embs))))
+
+    async def asearch_many(self, queries: List[str], reranker: str = "auto", generate: bool = False,
+                           max_concurrency: int = 8, collection: str = "",
+                           filter: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict]:
+        """Async search_many that yields each result as soon as it completes.
+
+        With generate=True each item also carries an "answer" (and "cache_hit"),
+        produced through the answer cache like aanswer.
+        """
+        try:
+            query_embs = await self.get_query_embeddings_async(queries)
+        except Exception as e:
+            for i, query in enumerate(queries):
+                yield {"index": i, "query": query, "error": f"Embedding failed: {e}", "timing": 0.0}
+            return
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run(i, query, query_emb):
+            async with semaphore:
+                start = time.time()
+                timings: Dict[str, float] = {}
+                try:
+                    if generate:
+                        result = await self.aanswer(query, reranker=reranker, query_emb=query_emb, timings=timings,
+                                                    collection=collection, filter=filter)
+                    else:
+                        result = {"citations": await self.asearch(query, query_emb=query_emb, reranker=reranker, timings=timings,
+                                                                  collection=collection, filter=filter)}
+                    result = {"index": i, "query": query, **result}
+                except Exception as e:
+                    result = {"index": i, "query": query, "error": str(e)}
+                result["timing"] = time.time() - start
+                result["timings"] = timings
+                return result
+
+        tasks = [asyncio.create_task(run(i, q, emb)) for i, (q, emb) in enumerate(zip(queries, query_embs))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Consumer went away (e.g. client disconnected): stop outstanding work
+            for task in tasks:
+                task.cancel()
+
+    def _hydrate(self, matches: List[Dict], collection: str = "", keep_embedded: bool = False) -> List[Dict]:
+        """Fills in chunk text and document metadata from the chunk store in one
+        bulk lookup. Vectors written before the chunk store existed still carry
+        their text in metadata and are passed through unchanged, as are, with
+        keep_embedded, matches that came with their vector values."""
+        def needs_text(match):
+            return 'text' not in match['metadata'] and not (keep_embedded and match.get('values'))
+
+        pending = [self._chunk_key(collection, match['id']) for match in matches if needs_text(match)]
+        if not pending:
+            return matches
+        found = self.chunk_store.get_chunks(pending) if self.chunk_store is not None else {}
+
+        hydrated = []
+        for match in matches:
+            if needs_text(match):
+                chunk = found.get(self._chunk_key(collection, match['id']))
+                if chunk is None:
+                    continue  # text is gone (e.g. deleted mid-query)
+                # The document record is always current; vector metadata may lag behind it
+                metadata = {**match['metadata'], **chunk["document"], 'text': chunk["text"]}
+                match = {**match, 'metadata': metadata}
+            hydrated.append(match)
+        return hydrated
+
+    def _lexical_limit(self, filter: Optional[Dict[str, Any]]) -> int:
+        # BM25 can't filter, so oversample and drop the non-matching hits after the fetch
+        return self.lexical_top_k * LEXICAL_FILTER_OVERSAMPLE if filter else self.lexical_top_k
+
+    @staticmethod
+    def _filter_fetched(fetched: Dict[str, Dict], filter: Optional[Dict[str, Any]]) -> Dict[str, Dict]:
+        if not filter:
+            return fetched
+        return {vector_id: record for vector_id, record in fetched.items() if matches_filter(record['metadata'], filter)}
+
+    def _missing_ids(self, matches: List[Dict], lexical_hits: List) -> List[str]:
+        """Ids found only by BM25, whose metadata still has to be fetched."""
+        dense_ids = {match['id'] for match in matches}
+        return [doc_id for doc_id, _ in lexical_hits if doc_id not in dense_ids]
+
+    def _fuse(self, matches: List[Dict], lexical_hits: List, fetched: Dict[str, Dict]) -> List[Dict]:
+        """Reciprocal rank fusion of dense matches and BM25 hits; stored
+        vector values, where requested, are carried over."""
+        records = {match['id']: match for match in matches}
+        for doc_id, record in fetched.items():
+            records.setdefault(doc_id, record)
+
+        fused = reciprocal_rank_fusion([match['id'] for match in matches], [doc_id for doc_id, _ in lexical_hits])
+        return [
+            {"id": doc_id, "score": score, "metadata": records[doc_id]['metadata'], "values": records[doc_id].get('values')}
+            for doc_id, score in fused
+            # BM25 can still hold ids whose vectors are gone
+            if doc_id in records
+        ]
+
+    @staticmethod
+    def _unembedded(matches: List[Dict]) -> List[int]:
+        """Positions of matches that came without their stored vector values
+        (e.g. "auto" fell back to the local reranker after Cohere failed)."""
+        return [i for i, match in enumerate(matches) if not match.get('values')]
+
+    def _candidate_embeddings(self, matches: List[Dict]) -> List[List[float]]:
+        """Vectors for the local reranker: the stored ones, with only the
+        candidates missing them embedded again (normally a cache hit)."""
+        embs = [match.get('values') for match in matches]
+        missing = self._unembedded(matches)
+        if missing:
+            for i, emb in zip(missing, self.get_embeddings([matches[i]['metadata']['text'] for i in missing])):
+                embs[i] = emb
+        return embs
+
+    async def _acandidate_embeddings(self, matches: List[Dict]) -> List[List[float]]:
+        embs = [match.get('values') for match in matches]
+        missing = self._unembedded(matches)
+        if missing:
+            found = await self.get_embeddings_async([matches[i]['metadata']['text'] for i in missing])
+            for i, emb in zip(missing, found):
+                embs[i] = emb
+        return embs
+
+    def _format_reranked(self, matches: List[Dict], rerank_results) -> List[Dict]:
+        final_results = []
+        for rr in rerank_results.results:
+            # Map back to original metadata
+            original_match = matches[rr.index]
+            final_results.append({
+                "score": rr.relevance_score,
+                "text": original_match['metadata']['text'],
+                "metadata": original_match['metadata']
+            })
+        return final_results
+
+    @staticmethod
+    def _picked(matches: List[Dict], ranked: List) -> List[Dict]:
+        """The matches the local reranker picked, in its order, scored by relevance."""
+        return [{**matches[i], "score": relevance} for i, relevance in ranked]
+
+    def _format_top(self, matches: List[Dict], n: int) -> List[Dict]:
+        final_results = []
+        for match in matches[:n]:
+            final_results.append({
+                "score": match['score'],
+                "text": match['metadata']['text'],
+                "metadata": match['metadata']
+            })
+        return final_results
+
+    def pack_context(self, context_chunks: List[Dict]) -> List[Dict]:
+        """Dedupes overlapping chunk text and fits the chunks, in rank order, into
+        CONTEXT_TOKEN_BUDGET tokens. The result is what the prompt cites as [1], [2], ..."""
+        return self.context_packer.pack(context_chunks)
+
+    def _usage(self, prompt_tokens: int, completion_tokens: int) -> Dict[str, Any]:
+        return {
+            "model": self.llm_model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost_usd": estimate_cost(self.llm_model, prompt_tokens, completion_tokens)
+        }
+
+    def _openai_usage(self, usage, prompt: str, answer: str) -> Dict[str, Any]:
+        if usage is None:
+            # Provider didn't report usage; count locally
+            return self._usage(self.context_packer.count(prompt), self.context_packer.count(answer))
+        return self._usage(usage.prompt_tokens, usage.completion_tokens)
+
+    def _gemini_usage(self, usage, prompt: str, answer: str) -> Dict[str, Any]:
+        if usage is None or not usage.prompt_token_count:
+            return self._usage(self.context_packer.count(prompt), self.context_packer.count(answer))
+        return self._usage(usage.prompt_token_count, usage.candidates_token_count)
+
+    def _build_prompt(self, query: str, context_chunks: List[Dict]):
+        """Returns (system_prompt, user_prompt) for the answer generator."""
         # Prepare context with visible citation markers
         context_text = ""
         for i, chunk in enumerate(context_chunks):
@@ -211,24 +1294,177 @@ class RAGEngine:
         )
         
         user_prompt = f"Context:\n{context_text}\n\nQuestion: {query}"
-        
-        if self.provider == "openai":
+        return system_prompt, user_prompt
+
+    def generate_answer(self, query: str, context_chunks: List[Dict]) -> Dict:
+        """Generates answer using LLM.
+
+        Returns {"answer", "citations", "usage"}: citations are the packed
+        context chunks, usage the prompt/completion tokens and cost in USD.
+        """
+        context_chunks = self.pack_context(context_chunks)
+        system_prompt, user_prompt = self._build_prompt(query, context_chunks)
+        answer, usage = self.guard.call(self.provider, "generate", lambda: self._complete(system_prompt, user_prompt))
+        return {
+            "answer": answer,
+            "citations": context_chunks,
+            "usage": usage
+        }
+
+    async def agenerate_answer(self, query: str, context_chunks: List[Dict]) -> Dict:
+        """Async counterpart of generate_answer.
+
+        Concurrent requests with the same prompt share one LLM call; only the
+        caller that made it reports usage (the others spent nothing)."""
+        context_chunks = self.pack_context(context_chunks)
+        system_prompt, user_prompt = self._build_prompt(query, context_chunks)
+        (answer, usage), coalesced = await self.singleflight.do(
+            "generate", (self.llm_model, system_prompt, user_prompt),
+            lambda: self.guard.acall(self.provider, "generate", lambda: self._acomplete(system_prompt, user_prompt))
+        )
+        return {
+            "answer": answer,
+            "citations": context_chunks,
+            "usage": None if coalesced else usage
+        }
+
+    def _complete(self, system_prompt: str, user_prompt: str) -> Tuple[str, Dict[str, Any]]:
+        """One LLM call; returns (answer, usage)."""
+        if self.llm is not None:
+            answer, prompt_tokens, completion_tokens = self.llm.complete(system_prompt, user_prompt)
+            return answer, self._usage(prompt_tokens, completion_tokens)
+        elif self.provider == "openai":
             response = self.openai_client.chat.completions.create(
-                model="gpt-4o-mini", # Cost effective
+                model=self.llm_model,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ]
             )
             answer = response.choices[0].message.content
+            return answer, self._openai_usage(response.usage, system_prompt + user_prompt, answer)
         else:
             # Gemini
-            # Using gemini-2.5-flash as requested
-            model = genai.GenerativeModel('gemini-2.5-flash')
+            model = self.genai.GenerativeModel(self.llm_model)
             response = model.generate_content(system_prompt + "\n" + user_prompt)
             answer = response.text
-            
-        return {
-            "answer": answer,
-            "citations": context_chunks
-        }
+            return answer, self._gemini_usage(response.usage_metadata, system_prompt + user_prompt, answer)
+
+    async def _acomplete(self, system_prompt: str, user_prompt: str) -> Tuple[str, Dict[str, Any]]:
+        if self.llm is not None:
+            answer, prompt_tokens, completion_tokens = await self.llm.acomplete(system_prompt, user_prompt)
+            return answer, self._usage(prompt_tokens, completion_tokens)
+        elif self.provider == "openai":
+            response = await self.async_openai_client.chat.completions.create(
+                model=self.llm_model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ]
+            )
+            answer = response.choices[0].message.content
+            return answer, self._openai_usage(response.usage, system_prompt + user_prompt, answer)
+        else:
+            model = self.genai.GenerativeModel(self.llm_model)
+            response = await model.generate_content_async(system_prompt + "\n" + user_prompt)
+            answer = response.text
+            return answer, self._gemini_usage(response.usage_metadata, system_prompt + user_prompt, answer)
+
+    def generate_answer_stream(self, query: str, context_chunks: List[Dict],
+                               usage: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        """Yields the answer text piece by piece as the LLM produces it.
+
+        context_chunks should already be packed with pack_context, since the
+        caller usually sends them as citations before the first token. If a
+        usage dict is given it is filled in once the stream is exhausted.
+        """
+        # Streams are neither coalesced nor hedged, but count towards the breaker
+        with self.guard.track(self.provider):
+            yield from self._stream(query, context_chunks, usage)
+
+    def _stream(self, query: str, context_chunks: List[Dict], usage: Optional[Dict[str, Any]]) -> Iterator[str]:
+        system_prompt, user_prompt = self._build_prompt(query, context_chunks)
+        answer = []
+
+        if self.llm is not None:
+            for token in self.llm.stream(system_prompt, user_prompt):
+                answer.append(token)
+                yield token
+            if usage is not None:
+                usage.update(self._openai_usage(None, system_prompt + user_prompt, "".join(answer)))
+        elif self.provider == "openai":
+            stream = self.openai_client.chat.completions.create(
+                model=self.llm_model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            reported = None
+            for chunk in stream:
+                # The final chunk has no choices, only usage
+                if chunk.usage is not None:
+                    reported = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    answer.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+            if usage is not None:
+                usage.update(self._openai_usage(reported, system_prompt + user_prompt, "".join(answer)))
+        else:
+            model = self.genai.GenerativeModel(self.llm_model)
+            response = model.generate_content(system_prompt + "\n" + user_prompt, stream=True)
+            for chunk in response:
+                if chunk.text:
+                    answer.append(chunk.text)
+                    yield chunk.text
+            if usage is not None:
+                usage.update(self._gemini_usage(response.usage_metadata, system_prompt + user_prompt, "".join(answer)))
+
+    async def agenerate_answer_stream(self, query: str, context_chunks: List[Dict],
+                                      usage: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """Async counterpart of generate_answer_stream."""
+        with self.guard.track(self.provider):
+            async for token in self._astream(query, context_chunks, usage):
+                yield token
+
+    async def _astream(self, query: str, context_chunks: List[Dict],
+                       usage: Optional[Dict[str, Any]]) -> AsyncIterator[str]:
+        system_prompt, user_prompt = self._build_prompt(query, context_chunks)
+        answer = []
+
+        if self.llm is not None:
+            async for token in self.llm.astream(system_prompt, user_prompt):
+                answer.append(token)
+                yield token
+            if usage is not None:
+                usage.update(self._openai_usage(None, system_prompt + user_prompt, "".join(answer)))
+        elif self.provider == "openai":
+            stream = await self.async_openai_client.chat.completions.create(
+                model=self.llm_model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            reported = None
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    reported = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    answer.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+            if usage is not None:
+                usage.update(self._openai_usage(reported, system_prompt + user_prompt, "".join(answer)))
+        else:
+            model = self.genai.GenerativeModel(self.llm_model)
+            response = await model.generate_content_async(system_prompt + "\n" + user_prompt, stream=True)
+            async for chunk in response:
+                if chunk.text:
+                    answer.append(chunk.text)
+                    yield chunk.text
+            if usage is not None:
+                usage.update(self._gemini_usage(response.usage_metadata, system_prompt + user_prompt, "".join(answer)))
@@ -0,0 +1,52 @@
+from typing import List, Tuple
+
+import numpy as np
+
+RERANKERS = ("auto", "cohere", "local", "none")
+
+
+def mmr_rerank(
+    query_emb: List[float],
+    candidate_embs: List[List[float]],
+    top_n: int = 5,
+    lambda_mult: float = 0.7,
+    duplicate_threshold: float = 0.95,
+) -> List[Tuple[int, float]]:
+    """Scores candidates against the query and picks a diverse top_n.
+
+    Uses maximal marginal relevance: each step picks the candidate with the
+    best lambda * relevance - (1 - lambda) * max similarity to those already
+    picked. Candidates nearly identical to a picked one (e.g. chunks that
+    overlap through the splitter overlap) are dropped outright. Returns
+    (candidate_index, relevance) pairs in selection order.
+    """
+    if not candidate_embs:
+        return []
+
+    q = np.asarray(query_emb, dtype=np.float32)
+    q = q / max(float(np.linalg.norm(q)), 1e-12)
+    c = np.asarray(candidate_embs, dtype=np.float32)
+    c = c / np.maximum(np.linalg.norm(c, axis=1, keepdims=True), 1e-12)
+
+    relevance = c @ q
+    similarity = c @ c.T
+
+    selected: List[int] = []
+    available = np.ones(len(c), dtype=bool)
+    # Highest similarity of each candidate to anything selected so far
+    max_sim = np.full(len(c), -np.inf, dtype=np.float32)
+
+    while len(selected) < top_n and available.any():
+        if selected:
+            scores = lambda_mult * relevance - (1 - lambda_mult) * max_sim
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+
+        selected.append(best)
+        available[best] = False
+        max_sim = np.maximum(max_sim, similarity[best])
+        available &= max_sim < duplicate_threshold
+
+    return [(i, float(relevance[i])) for i in selected]
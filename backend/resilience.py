@@ -0,0 +1,261 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from embedding_scheduler import is_rate_limited
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open."""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"Provider '{provider}' is failing; calls are paused for {retry_after:.0f}s.")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class SingleFlight:
+    """Shares one in-flight call among concurrent callers with the same key.
+
+    The first caller for a key starts the call; callers arriving while it is
+    running await the same result (or exception) instead of issuing their
+    own. Nothing is cached: once the call finishes, the next caller starts a
+    new one. The call is only cancelled when every caller waiting on it has
+    been cancelled (e.g. all their clients disconnected).
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        # (stage, key) -> [task, callers waiting on it]
+        self._calls: Dict[Tuple[str, Hashable], list] = {}
+        self.coalesced: Dict[str, int] = {}
+
+    async def do(self, stage: str, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Returns (result, coalesced): coalesced is True when the result came
+        from a call another caller had already started."""
+        if not self.enabled:
+            return await factory(), False
+
+        call_key = (stage, key)
+        entry = self._calls.get(call_key)
+        coalesced = entry is not None
+        if coalesced:
+            self.coalesced[stage] = self.coalesced.get(stage, 0) + 1
+        else:
+            entry = self._calls[call_key] = [asyncio.ensure_future(factory()), 0]
+
+            def forget(_, entry=entry):
+                if self._calls.get(call_key) is entry:
+                    del self._calls[call_key]
+            entry[0].add_done_callback(forget)
+
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task), coalesced
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not task.done():
+                task.cancel()
+
+
+class LatencyTracker:
+    """Latencies of the most recent calls of one stage."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self._samples = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """The p-th percentile, or None until min_samples calls were seen."""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class CircuitBreaker:
+    """Stops calling a provider after repeated failures.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    fail immediately with CircuitOpenError for reset_seconds. Then a single
+    trial call is let through (half-open): success closes the circuit, a
+    failure opens it again. Rate limiting (429) is left to the callers'
+    retries and doesn't count as a failure.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self._trial or time.monotonic() >= self.opened_at + self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            if remaining > 0 or self._trial:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, max(remaining, 1.0))
+            self._trial = True
+
+    def record(self, success: Optional[bool]):
+        """Records a call's outcome; None (cancelled, rate limited) only ends a trial."""
+        with self._lock:
+            if success:
+                self.failures = 0
+                self.opened_at = None
+            elif success is False:
+                self.failures += 1
+                if self._trial or (self.opened_at is None and self.failures >= self.failure_threshold):
+                    self.opened_at = time.monotonic()
+                    self.times_opened += 1
+            self._trial = False
+
+
+class ProviderGuard:
+    """Runs provider calls behind per-provider circuit breakers, hedging the
+    slow ones.
+
+    Calls of the stages in hedge_stages are hedged: if one hasn't returned
+    after the hedge_percentile of that stage's recent latencies, an identical
+    second call is started and whichever succeeds first is used (the other is
+    cancelled). Only hedge idempotent, cheap calls; a hedge costs a second
+    provider request. Calls for provider None (in-process backends) run
+    unguarded.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0,
+                 hedge_stages: Iterable[str] = (), hedge_percentile: float = 95.0,
+                 min_hedge_delay: float = 0.01):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.hedge_stages = set(hedge_stages)
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.latencies: Dict[str, LatencyTracker] = {}
+        self.hedged: Dict[str, int] = {}
+        self.hedge_wins: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        with self._lock:
+            if provider not in self.breakers:
+                self.breakers[provider] = CircuitBreaker(provider, self.failure_threshold, self.reset_seconds)
+            return self.breakers[provider]
+
+    def _tracker(self, stage: str) -> LatencyTracker:
+        with self._lock:
+            if stage not in self.latencies:
+                self.latencies[stage] = LatencyTracker()
+            return self.latencies[stage]
+
+    @contextmanager
+    def track(self, provider: Optional[str]):
+        """Checks the provider's breaker before the block and records its outcome after."""
+        if provider is None:
+            yield
+            return
+        breaker = self.breaker(provider)
+        breaker.before_call()
+        success = None
+        try:
+            yield
+            success = True
+        except Exception as e:
+            if not is_rate_limited(e):
+                success = False
+            raise
+        finally:
+            breaker.record(success)
+
+    def call(self, provider: Optional[str], stage: str, fn: Callable[[], Any]) -> Any:
+        """Blocking call behind the breaker (blocking calls are never hedged)."""
+        with self.track(provider):
+            start = time.perf_counter()
+            result = fn()
+        self._tracker(stage).record(time.perf_counter() - start)
+        return result
+
+    async def acall(self, provider: Optional[str], stage: str, factory: Callable[[], Awaitable[Any]],
+                    timeout: Optional[float] = None) -> Any:
+        """Awaits factory() behind the breaker, hedged if the stage allows it.
+        A timeout, if given, bounds the whole call including the hedge and
+        counts as a provider failure."""
+        if provider is None:
+            return await factory()
+        with self.track(provider):
+            if timeout is None:
+                return await self._run(stage, factory)
+            return await asyncio.wait_for(self._run(stage, factory), timeout)
+
+    def hedge_delay(self, stage: str) -> Optional[float]:
+        if stage not in self.hedge_stages:
+            return None
+        delay = self._tracker(stage).percentile(self.hedge_percentile)
+        return None if delay is None else max(delay, self.min_hedge_delay)
+
+    async def _timed(self, stage: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        start = time.perf_counter()
+        result = await factory()
+        self._tracker(stage).record(time.perf_counter() - start)
+        return result
+
+    async def _run(self, stage: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        delay = self.hedge_delay(stage)
+        if delay is None:
+            return await self._timed(stage, factory)
+
+        attempts = [asyncio.ensure_future(self._timed(stage, factory))]
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=delay)
+            if done:
+                return attempts[0].result()
+
+            self.hedged[stage] = self.hedged.get(stage, 0) + 1
+            attempts.append(asyncio.ensure_future(self._timed(stage, factory)))
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        if attempt is attempts[1]:
+                            self.hedge_wins[stage] = self.hedge_wins.get(stage, 0) + 1
+                        return attempt.result()
+            # Both failed: report the original call's error
+            return attempts[0].result()
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedged": dict(self.hedged),
+            "hedge_wins": dict(self.hedge_wins),
+            "breakers": {
+                name: {"state": breaker.state, "failures": breaker.failures,
+                       "times_opened": breaker.times_opened, "rejected": breaker.rejected}
+                for name, breaker in self.breakers.items()
+            }
+        }
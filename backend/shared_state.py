@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List, Set
+
+# Advisory file locks coordinate worker processes; fcntl is POSIX-only, and
+# without it (Windows) only a single worker is supported
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Finished job snapshots are kept this long for workers that didn't run the job
+JOB_RETENTION_SECONDS = 24 * 3600
+
+
+@contextmanager
+def file_lock(path: str, shared: bool = False):
+    """Holds an exclusive (or shared) lock on path, created if missing, for the
+    duration of the block. Serialises appends to files that several worker
+    processes write to."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class SharedState:
+    """Small SQLite database for state every worker process has to agree on.
+
+    Holds named counters (the corpus version that invalidates cached
+    answers) and snapshots of background ingest jobs, so that a job started
+    on one worker can be polled or cancelled through any other.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Workers write concurrently; wait for the write lock instead of failing
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, snapshot TEXT NOT NULL, "
+            "updated_at REAL NOT NULL, cancel_requested INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.commit()
+
+    def get_counter(self, name: str) -> int:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def increment(self, name: str) -> int:
+        """Atomically adds one to the counter (across processes) and returns the new value."""
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO counters (name, value) VALUES (?, 1) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,)
+            )
+            value = self._db.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()[0]
+            self._db.commit()
+        return value
+
+    def put_job(self, snapshot: Dict[str, Any]):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (job_id, snapshot, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(job_id) DO UPDATE SET snapshot = excluded.snapshot, updated_at = excluded.updated_at",
+                (snapshot["job_id"], json.dumps(snapshot), now)
+            )
+            self._db.execute("DELETE FROM jobs WHERE updated_at < ?", (now - JOB_RETENTION_SECONDS,))
+            self._db.commit()
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT snapshot FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def request_job_cancel(self, job_id: str):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET cancel_requested = 1 WHERE job_id = ?", (job_id,))
+            self._db.commit()
+
+    def cancel_requests(self, job_ids: List[str]) -> Set[str]:
+        """The ids among job_ids that some worker asked to cancel."""
+        if not job_ids:
+            return set()
+        placeholders = ",".join("?" * len(job_ids))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT job_id FROM jobs WHERE cancel_requested = 1 AND job_id IN ({placeholders})", job_ids
+            ).fetchall()
+        return {row[0] for row in rows}
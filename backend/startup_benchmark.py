@@ -0,0 +1,101 @@
+"""Cold-start benchmark: import and initialization time of the engine.
+
+Every run uses a fresh interpreter, like a new Render instance would:
+
+    python startup_benchmark.py             # 5 runs with the configured providers
+    python startup_benchmark.py --runs 10 --json
+
+Reports how long `import rag_core` and `RAGEngine()` take (what the server
+pays before it accepts requests), how long each provider SDK takes to import
+and construct on first use (what pre-warming moves off the first request),
+and, for comparison, the cost of importing every SDK eagerly.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from statistics import median
+from typing import Dict, List
+
+# All SDKs the engine can use, as the old eager imports loaded them
+EAGER_IMPORTS = "import pinecone, cohere, google.generativeai, openai"
+
+
+def measure_engine(prewarm: bool) -> Dict[str, float]:
+    start = time.perf_counter()
+    import rag_core
+    imported = time.perf_counter()
+    engine = rag_core.RAGEngine()
+    initialized = time.perf_counter()
+
+    timings = {"import_rag_core": imported - start, "engine_init": initialized - imported}
+    if prewarm:
+        engine.prewarm()
+        timings["prewarm"] = time.perf_counter() - initialized
+        for name, seconds in engine.providers.init_seconds.items():
+            timings[f"provider:{name}"] = seconds
+    return timings
+
+
+def measure_eager_imports() -> Dict[str, float]:
+    start = time.perf_counter()
+    exec(EAGER_IMPORTS)
+    return {"eager_sdk_imports": time.perf_counter() - start}
+
+
+def run_child(mode: str, prewarm: bool) -> Dict[str, float]:
+    """Runs one measurement in a fresh interpreter and returns its timings."""
+    command = [sys.executable, os.path.abspath(__file__), "--child", mode]
+    if not prewarm:
+        command.append("--no-prewarm")
+    result = subprocess.run(command, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        raise RuntimeError(f"{mode} run failed:\n{result.stderr}")
+    # The engine may print warnings; the measurement is the last line
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start import and init time.")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("--no-prewarm", action="store_true", help="skip building provider clients")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--child", choices=["engine", "eager"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        timings = measure_engine(not args.no_prewarm) if args.child == "engine" else measure_eager_imports()
+        print(json.dumps(timings))
+        return
+
+    samples: Dict[str, List[float]] = {}
+    for mode in ("engine", "eager"):
+        for _ in range(args.runs):
+            try:
+                timings = run_child(mode, not args.no_prewarm)
+            except RuntimeError as e:
+                # e.g. an SDK that isn't installed; report what could be measured
+                print(f"Warning: {e}", file=sys.stderr)
+                break
+            for key, seconds in timings.items():
+                samples.setdefault(key, []).append(seconds)
+
+    report = {key: {"median_ms": round(median(values) * 1000, 1), "max_ms": round(max(values) * 1000, 1)}
+              for key, values in samples.items()}
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{'stage':<28}{'median ms':>12}{'max ms':>12}")
+    for key, values in report.items():
+        print(f"{key:<28}{values['median_ms']:>12}{values['max_ms']:>12}")
+    if "import_rag_core" in report and "engine_init" in report:
+        ready = report["import_rag_core"]["median_ms"] + report["engine_init"]["median_ms"]
+        print(f"\nServer-side startup before the first request: ~{ready:.1f} ms "
+              "(provider imports happen on first use or in the background pre-warm)")
+
+
+if __name__ == "__main__":
+    main()
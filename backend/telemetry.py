@@ -0,0 +1,242 @@
+import os
+import glob
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, CollectorRegistry, generate_latest, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from vector_store import LocalVectorStore
+
+# OpenTelemetry is optional: spans are only exported when the API is installed
+# and a tracer provider is configured (see setup_tracing)
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds",
+    "Latency of each query / ingest stage.",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+STAGE_ERRORS = Counter("rag_stage_errors_total", "Stages that ended with an exception.", ["stage"])
+PROVIDER_ERRORS = Counter(
+    "rag_provider_errors_total",
+    "Failed calls to external providers (including ones that were retried or fell back).",
+    ["provider", "operation"]
+)
+INGESTED_CHUNKS = Counter("rag_ingested_chunks_total", "Chunks seen by ingestion, by outcome.", ["outcome"])
+
+_tracer = otel_trace.get_tracer("minirag") if otel_trace is not None else None
+_collector = None
+_mirror = None
+
+# How the engine gauges of several worker processes are combined
+MULTIPROCESS_GAUGE_MODES = {"rag_cache_hit_rate": "liveall", "rag_circuit_open": "livemax", "rag_chunks": "livemax"}
+
+
+def multiprocess_enabled() -> bool:
+    """True when metrics are aggregated across worker processes (PROMETHEUS_MULTIPROC_DIR)."""
+    return bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def prepare_multiprocess_metrics(workers: int, default_dir: str):
+    """Called by the launcher before starting workers: with several of them,
+    points PROMETHEUS_MULTIPROC_DIR (unless set) at default_dir and clears the
+    files a previous run left there. Workers inherit the variable, so every
+    process writes its metrics to that directory and /metrics sums them."""
+    if workers <= 1 and not multiprocess_enabled():
+        return
+    path = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", default_dir)
+    os.makedirs(path, exist_ok=True)
+    for stale in glob.glob(os.path.join(path, "*.db")):
+        os.remove(stale)
+
+
+def setup_tracing():
+    """Exports spans over OTLP when OTEL_EXPORTER_OTLP_ENDPOINT is set.
+
+    Needs opentelemetry-sdk and opentelemetry-exporter-otlp; without the
+    variable, spans go to whatever provider is already installed (e.g. by
+    opentelemetry-instrument) or nowhere.
+    """
+    if not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        return
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    except ImportError:
+        print("Warning: OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry-sdk / "
+              "opentelemetry-exporter-otlp are not installed; traces are not exported.")
+        return
+
+    provider = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "minirag")}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    otel_trace.set_tracer_provider(provider)
+
+
+@contextmanager
+def span(stage: str, timings: Optional[Dict[str, float]] = None, provider: Optional[str] = None):
+    """Times a stage: records the latency histogram, an OpenTelemetry span and,
+    if given, adds the elapsed seconds to timings[stage]. Exceptions are
+    counted per stage, and per provider when the stage is a provider call."""
+    start = time.perf_counter()
+    with _tracer.start_as_current_span(f"rag.{stage}") if _tracer is not None else nullcontext():
+        try:
+            yield
+        except Exception:
+            STAGE_ERRORS.labels(stage=stage).inc()
+            if provider is not None:
+                PROVIDER_ERRORS.labels(provider=provider, operation=stage).inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            STAGE_SECONDS.labels(stage=stage).observe(elapsed)
+            if timings is not None:
+                timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+class EngineCollector:
+    """Reads counters the engine already keeps (cache stats, retries,
+    coalescing / hedging, index sizes) at scrape time."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def collect(self):
+        engine = self.engine
+
+        retries = CounterMetricFamily("rag_embedding_retries", "Embedding requests retried after rate limiting.")
+        retries.add_metric([], engine.embedding_scheduler.retries)
+        yield retries
+
+        lookups = CounterMetricFamily("rag_cache_lookups", "Cache lookups by cache and result.", labels=["cache", "result"])
+        hit_rate = GaugeMetricFamily("rag_cache_hit_rate", "Fraction of cache lookups that hit.", labels=["cache"])
+        embedding = engine.embedding_cache.stats()
+        lookups.add_metric(["embedding", "memory_hit"], embedding["memory_hits"])
+        lookups.add_metric(["embedding", "disk_hit"], embedding["disk_hits"])
+        lookups.add_metric(["embedding", "miss"], embedding["misses"])
+        hit_rate.add_metric(["embedding"], embedding["hit_rate"])
+        answer = engine.answer_cache.stats()
+        lookups.add_metric(["answer", "exact_hit"], answer["exact_hits"])
+        lookups.add_metric(["answer", "semantic_hit"], answer["semantic_hits"])
+        lookups.add_metric(["answer", "miss"], answer["misses"])
+        hit_rate.add_metric(["answer"], answer["hit_rate"])
+        yield lookups
+        yield hit_rate
+
+        resilience = engine.resilience_stats()
+        coalesced = CounterMetricFamily("rag_coalesced_requests", "Requests served by an identical in-flight call.", labels=["stage"])
+        for stage, count in resilience["coalesced"].items():
+            coalesced.add_metric([stage], count)
+        yield coalesced
+        hedged = CounterMetricFamily("rag_hedged_requests", "Provider calls duplicated after the hedge delay.", labels=["stage"])
+        hedge_wins = CounterMetricFamily("rag_hedge_wins", "Hedged calls where the duplicate answered first.", labels=["stage"])
+        for stage, count in resilience["hedged"].items():
+            hedged.add_metric([stage], count)
+            hedge_wins.add_metric([stage], resilience["hedge_wins"].get(stage, 0))
+        yield hedged
+        yield hedge_wins
+        circuit_open = GaugeMetricFamily("rag_circuit_open", "1 while a provider's circuit breaker is open or half-open.", labels=["provider"])
+        rejected = CounterMetricFamily("rag_circuit_rejected", "Calls failed fast by an open circuit breaker.", labels=["provider"])
+        for provider, breaker in resilience["breakers"].items():
+            circuit_open.add_metric([provider], 0 if breaker["state"] == "closed" else 1)
+            rejected.add_metric([provider], breaker["rejected"])
+        yield circuit_open
+        yield rejected
+
+        chunks = GaugeMetricFamily("rag_chunks", "Chunks currently held, by store.", labels=["store"])
+        # Only local stores: counting Pinecone vectors would cost a network call per scrape
+        if isinstance(engine.vector_store, LocalVectorStore):
+            chunks.add_metric(["vector"], engine.vector_store.live_count())
+        if engine.lexical_index is not None:
+            chunks.add_metric(["lexical"], len(engine.lexical_index))
+        if engine.chunk_store is not None:
+            chunks.add_metric(["chunk_store"], engine.chunk_store.stats()["chunks"])
+        yield chunks
+
+
+class MultiprocessMirror:
+    """Copies EngineCollector's values into prometheus_client's multiprocess
+    metrics, so that /metrics can combine them across worker processes.
+
+    The engine keeps its counters in process memory; every sync() adds what
+    each counter grew by since the last one to a multiprocess Counter, and
+    sets the gauges (combined per MULTIPROCESS_GAUGE_MODES).
+    """
+
+    def __init__(self, collector: EngineCollector):
+        self.collector = collector
+        self._metrics: Dict[str, object] = {}
+        self._synced: Dict[Tuple, float] = {}
+
+    def _metric(self, family, labelnames):
+        metric = self._metrics.get(family.name)
+        if metric is None:
+            if family.type == "counter":
+                metric = Counter(family.name, family.documentation, labelnames, registry=None)
+            else:
+                metric = Gauge(family.name, family.documentation, labelnames, registry=None,
+                               multiprocess_mode=MULTIPROCESS_GAUGE_MODES.get(family.name, "livemax"))
+            self._metrics[family.name] = metric
+        return metric
+
+    def sync(self):
+        for family in self.collector.collect():
+            for sample in family.samples:
+                if sample.name.endswith("_created"):
+                    continue
+                labelnames = sorted(sample.labels)
+                metric = self._metric(family, labelnames)
+                child = metric.labels(**sample.labels) if labelnames else metric
+                if family.type == "counter":
+                    key = (family.name, tuple(sorted(sample.labels.items())))
+                    delta = sample.value - self._synced.get(key, 0.0)
+                    if delta > 0:
+                        child.inc(delta)
+                    self._synced[key] = sample.value
+                else:
+                    child.set(sample.value)
+
+
+def register_engine(engine):
+    """Exposes the engine's counters on the default registry (replacing a previous
+    engine's), or in multiprocess mode through a MultiprocessMirror."""
+    global _collector, _mirror
+    if _collector is not None and _mirror is None:
+        REGISTRY.unregister(_collector)
+    _collector = EngineCollector(engine)
+    if multiprocess_enabled():
+        _mirror = MultiprocessMirror(_collector)
+    else:
+        _mirror = None
+        REGISTRY.register(_collector)
+
+
+def sync_engine_metrics():
+    """Publishes this worker's engine counters (multiprocess mode only)."""
+    if _mirror is not None:
+        _mirror.sync()
+
+
+def metrics_payload() -> bytes:
+    """The /metrics response body: this process's registry, or in multiprocess
+    mode the metrics of every worker, combined."""
+    if not multiprocess_enabled():
+        return generate_latest()
+    sync_engine_metrics()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+def shutdown_metrics():
+    """Drops this worker's live gauges from the combined metrics on exit."""
+    if multiprocess_enabled():
+        sync_engine_metrics()
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,49 @@
+import sqlite3
+
+from answer_cache import AnswerCache
+
+RESULT = {"answer": "In autumn.", "citations": []}
+
+
+def vector(dim, hot=0):
+    return [1.0 if i == hot else 0.0 for i in range(dim)]
+
+
+def test_shared_answers_are_loaded_within_one_embedding_space(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    AnswerCache(path=path, embedding_space="fake:fake-hash@256").put("When do apples ripen?", vector(256), 1, RESULT)
+
+    same = AnswerCache(path=path, embedding_space="fake:fake-hash@256")
+    assert same.get("Apples ripen when?", vector(256), 1) == RESULT
+
+    # A restart at another dimension (or with another model) starts empty instead of failing
+    other = AnswerCache(path=path, embedding_space="fake:fake-hash@128")
+    assert other.get("Apples ripen when?", vector(128), 1) is None
+    assert other.get_exact("When do apples ripen?", 1) is None
+    other.put("When do apples ripen?", vector(128), 1, RESULT)
+    assert other.get("Apples ripen when?", vector(128), 1) == RESULT
+
+
+def test_rows_of_another_dimension_are_skipped(tmp_path):
+    cache = AnswerCache()
+    cache.put("When do apples ripen?", vector(256), 1, RESULT)
+    cache.put("When do bananas ship?", vector(128), 1, RESULT)
+    assert cache.get("Bananas ship when?", vector(128), 1) is None
+    assert cache.stats()["entries"] == 1
+
+
+def test_tables_from_before_embedding_spaces_are_upgraded(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE answers (key TEXT PRIMARY KEY, seq INTEGER NOT NULL, version INTEGER NOT NULL, "
+        "created_at REAL NOT NULL, embedding BLOB NOT NULL, result TEXT NOT NULL)"
+    )
+    db.execute("INSERT INTO answers VALUES ('when do apples ripen', 1, 1, 1e12, ?, '{}')", (bytes(4 * 8),))
+    db.commit()
+    db.close()
+
+    cache = AnswerCache(path=path, embedding_space="fake:fake-hash@256")
+    assert cache.get("When do apples ripen?", vector(256), 1) is None
+    cache.put("When do apples ripen?", vector(256), 1, RESULT)
+    assert AnswerCache(path=path, embedding_space="fake:fake-hash@256").get_exact("When do apples ripen?", 1) == RESULT
@@ -0,0 +1,32 @@
+from chunker import Chunker
+
+
+class WordCounter:
+    """Counts whitespace-separated words, so the tests don't need tiktoken."""
+
+    def count(self, text):
+        return len(text.split())
+
+
+def test_offsets_slice_the_source_text():
+    text = "\n\n".join(
+        f"Paragraph {i}. " + " ".join(f"word{i}-{j}" for j in range(5 + i % 13)) + "\n" + "line " * (i % 4)
+        for i in range(60)
+    ) + " " + "x" * 500
+    chunks = list(Chunker(WordCounter(), chunk_tokens=25, overlap_tokens=5).split(text, page=3))
+
+    assert len(chunks) > 10
+    for chunk in chunks:
+        assert text[chunk["start"]:chunk["end"]] == chunk["text"]
+        assert chunk["page"] == 3
+        assert chunk["tokens"] <= 25
+
+
+def test_chunks_cover_the_text_in_order():
+    text = " ".join(f"w{i}" for i in range(1000))
+    chunks = list(Chunker(WordCounter(), chunk_tokens=50, overlap_tokens=10).split(text))
+
+    assert chunks[0]["start"] == 0 and chunks[-1]["end"] == len(text)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        # Consecutive chunks overlap (or touch) and move forward
+        assert previous["start"] < chunk["start"] <= previous["end"]
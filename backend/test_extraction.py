@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+import extraction
+
+
+def blocks(path):
+    async def collect():
+        return [block async for block in extraction.iter_text_blocks(str(path))]
+    return asyncio.run(collect())
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(extraction, "TEXT_BLOCK_CHARS", 100)
+
+
+@pytest.mark.parametrize("text", [
+    "\n".join(f"line {i} " + "x" * (i % 50) for i in range(300)),
+    " ".join(f"word{i}" for i in range(3000)),
+    "y" * 5000,
+    "short\n" + " ".join(f"word{i}" for i in range(3000)),
+])
+def test_text_blocks_are_bounded_and_lossless(small_blocks, tmp_path, text):
+    path = tmp_path / "upload.txt"
+    path.write_text(text, encoding="utf-8")
+
+    result = blocks(path)
+    assert all(page is None for page, _ in result)
+    assert "".join(block for _, block in result) == text
+    assert max(len(block) for _, block in result) <= 3 * extraction.TEXT_BLOCK_CHARS
+
+
+def test_text_blocks_end_on_line_breaks(small_blocks, tmp_path):
+    text = "\n".join(f"line {i}" for i in range(200)) + "\n"
+    path = tmp_path / "upload.txt"
+    path.write_text(text, encoding="utf-8")
+
+    assert all(block.endswith("\n") for _, block in blocks(path))
+
+
+def test_undecodable_text_is_an_extraction_error(tmp_path):
+    path = tmp_path / "upload.txt"
+    path.write_bytes(b"\xff\xfe\x00 not utf-8")
+    with pytest.raises(extraction.ExtractionError):
+        blocks(path)
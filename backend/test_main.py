@@ -0,0 +1,107 @@
+import asyncio
+import tempfile
+
+import httpx
+import pytest
+
+
+def call(requests):
+    """Runs requests(client) against the app, started with its lifespan."""
+    import main
+
+    async def run():
+        async with main.lifespan(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await requests(client)
+
+    return asyncio.run(run())
+
+
+def test_delete_document_is_scoped_to_its_collection(offline_env):
+    async def requests(client):
+        for collection, text in (("", "Apples ripen in autumn."), ("team-a", "Bananas ship green.")):
+            response = await client.post("/ingest", json={"text": text, "doc_key": "fruit", "collection": collection})
+            assert response.status_code == 200
+
+        deleted = await client.delete("/documents/fruit", params={"collection": "team-a"})
+        again = await client.delete("/documents/fruit", params={"collection": "team-a"})
+        unknown = await client.delete("/documents/nope")
+        invalid = await client.delete("/documents/fruit", params={"collection": "bad name"})
+        scoped = await client.post("/query", json={"query": "fruit", "collection": "team-a"})
+        default = await client.post("/query", json={"query": "fruit", "reranker": "none"})
+        return deleted, again, unknown, invalid, scoped, default
+
+    deleted, again, unknown, invalid, scoped, default = call(requests)
+    assert deleted.status_code == 200
+    assert deleted.json() == {"doc_id": "fruit", "collection": "team-a", "chunks_removed": 1}
+    assert again.status_code == 404
+    assert unknown.status_code == 404
+    assert invalid.status_code == 400
+    assert scoped.json()["citations"] == []
+    assert [c["text"] for c in default.json()["citations"]] == ["Apples ripen in autumn."]
+
+
+def test_answer_cache_is_scoped_by_collection_and_filters(offline_env):
+    async def requests(client):
+        await client.post("/ingest", json={"text": "Apples ripen in autumn.", "doc_key": "a"})
+        await client.post("/ingest", json={"text": "Bananas ship green.", "doc_key": "b", "collection": "team-a"})
+        first = await client.post("/query", json={"query": "fruit?"})
+        repeat = await client.post("/query", json={"query": "Fruit"})
+        scoped = await client.post("/query", json={"query": "fruit?", "collection": "team-a"})
+        filtered = await client.post("/query", json={"query": "fruit?", "filters": {"doc_ids": ["b"]}})
+        return first, repeat, scoped, filtered
+
+    first, repeat, scoped, filtered = call(requests)
+    assert not first.json()["cache_hit"]
+    assert repeat.json()["cache_hit"]
+    assert not scoped.json()["cache_hit"]
+    assert [c["text"] for c in scoped.json()["citations"]] == ["Bananas ship green."]
+    assert not filtered.json()["cache_hit"]
+    assert filtered.json()["citations"] == []
+
+
+def test_stream_shares_the_answer_cache_with_query(offline_env):
+    async def requests(client):
+        await client.post("/ingest", json={"text": "Apples ripen in autumn.", "doc_key": "a"})
+        streamed = await client.post("/query/stream", json={"query": "When do apples ripen?"})
+        answered = await client.post("/query", json={"query": "when do apples ripen"})
+        restreamed = await client.post("/query/stream", json={"query": "When do apples ripen?"})
+        return streamed, answered, restreamed
+
+    streamed, answered, restreamed = call(requests)
+    assert '"cache_hit": false' in streamed.text
+    assert answered.json()["cache_hit"]
+    assert '"cache_hit": true' in restreamed.text
+
+
+def test_failed_job_submit_removes_the_spooled_upload(offline_env, monkeypatch):
+    import main
+    spool_dir = offline_env / "spool"
+    spool_dir.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(spool_dir))
+
+    def full(job, work):
+        raise RuntimeError("queue unavailable")
+
+    async def requests(client):
+        monkeypatch.setattr(main.job_manager, "submit", full)
+        with pytest.raises(RuntimeError):
+            await client.post("/ingest/jobs", files={"file": ("notes.txt", b"Apples ripen in autumn.", "text/plain")})
+
+    call(requests)
+    assert list(spool_dir.iterdir()) == []
+
+
+def test_unconfigured_cohere_reranker_is_a_client_error(offline_env):
+    async def requests(client):
+        body = {"query": "fruit?", "reranker": "cohere"}
+        return [
+            await client.post("/query", json=body),
+            await client.post("/query/stream", json=body),
+            await client.post("/query/batch", json={"queries": ["fruit?"], "reranker": "cohere"}),
+        ]
+
+    for response in call(requests):
+        assert response.status_code == 400
+        assert "COHERE_API_KEY" in response.json()["detail"]
@@ -0,0 +1,260 @@
+import asyncio
+import threading
+
+import pytest
+
+import extraction
+from rag_core import build_filter
+
+PARAGRAPHS = [
+    "Apples grow in orchards and ripen in autumn across the northern valleys.",
+    "Bananas are picked green and shipped in cooled containers to distant ports.",
+    "Cherries bloom early in spring and need a cold winter to set fruit well.",
+]
+
+
+def document(*paragraphs):
+    return "\n\n".join(paragraphs)
+
+
+def small_chunks(engine):
+    # One chunk per paragraph, so chunk counts follow the paragraphs
+    engine.chunker.chunk_tokens = 24
+    engine.chunker.overlap_tokens = 0
+    return engine
+
+
+def ingest(engine, doc_id, text, collection="", **metadata):
+    metadata = {"doc_id": doc_id, "title": doc_id, "source": "text_input", "timestamp": 100.0, **metadata}
+    return engine.ingest_document(text, metadata, collection=collection)
+
+
+def search_ids(engine, query="fruit", collection="", **filters):
+    results = engine.search(query, reranker="none", collection=collection, filter=build_filter(**filters))
+    return sorted(r["metadata"]["doc_id"] for r in results)
+
+
+def search_titles(engine, **filters):
+    results = engine.search("fruit", reranker="none", filter=build_filter(**filters))
+    return [r["metadata"]["title"] for r in results]
+
+
+def test_collections_are_isolated(engine):
+    ingest(engine, "fruit", PARAGRAPHS[0])
+    ingest(engine, "fruit", PARAGRAPHS[1], collection="team-a")
+    ingest(engine, "cherry", PARAGRAPHS[2], collection="team-a")
+
+    assert search_ids(engine) == ["fruit"]
+    assert search_ids(engine, collection="team-a") == ["cherry", "fruit"]
+    default_text = engine.search("fruit", reranker="none")[0]["text"]
+    assert default_text == PARAGRAPHS[0]
+
+
+def test_filters_narrow_the_search(engine):
+    ingest(engine, "a", PARAGRAPHS[0], title="Apples", timestamp=100.0)
+    ingest(engine, "b", PARAGRAPHS[1], title="Bananas", source="file_upload", timestamp=200.0)
+    ingest(engine, "c", PARAGRAPHS[2], title="Cherries", timestamp=300.0)
+
+    assert search_ids(engine, doc_ids=["a", "c"]) == ["a", "c"]
+    assert search_ids(engine, titles=["Bananas"]) == ["b"]
+    assert search_ids(engine, sources=["file_upload"]) == ["b"]
+    assert search_ids(engine, timestamp_from=150.0) == ["b", "c"]
+    assert search_ids(engine, timestamp_from=150.0, timestamp_to=250.0) == ["b"]
+    assert search_ids(engine, doc_ids=["missing"]) == []
+
+
+def test_reingest_refreshes_document_metadata_of_unchanged_chunks(engine):
+    small_chunks(engine)
+    ingest(engine, "a", document(*PARAGRAPHS[:2]), title="Old", timestamp=100.0)
+    counts = ingest(engine, "a", document(*PARAGRAPHS), title="New", timestamp=200.0)
+    assert_relabelled(engine, counts)
+
+
+def test_async_reingest_refreshes_document_metadata_of_unchanged_chunks(engine):
+    small_chunks(engine)
+    metadata = {"doc_id": "a", "source": "text_input"}
+    asyncio.run(engine.aingest_document(document(*PARAGRAPHS[:2]), {**metadata, "title": "Old", "timestamp": 100.0}))
+    counts = asyncio.run(engine.aingest_document(document(*PARAGRAPHS), {**metadata, "title": "New", "timestamp": 200.0}))
+    assert_relabelled(engine, counts)
+
+
+def assert_relabelled(engine, counts):
+    assert counts["added"] == 1 and counts["unchanged"] == 2
+
+    assert search_titles(engine, titles=["New"]) == ["New"] * 3
+    assert search_titles(engine, titles=["Old"]) == []
+    assert len(search_titles(engine, timestamp_from=150.0)) == 3
+    assert set(search_titles(engine)) == {"New"}
+
+
+def reingest(engine, doc_id, text, use_async):
+    metadata = {"doc_id": doc_id, "title": doc_id, "source": "text_input", "timestamp": 100.0}
+    if use_async:
+        return asyncio.run(engine.aingest_document(text, metadata))
+    return engine.ingest_document(text, metadata)
+
+
+def count_embeddings(engine, monkeypatch):
+    embedded = []
+    embed, aembed = engine.get_embeddings, engine.get_embeddings_async
+
+    def counting(texts, *args, **kwargs):
+        embedded.extend(texts)
+        return embed(texts, *args, **kwargs)
+
+    async def acounting(texts, *args, **kwargs):
+        embedded.extend(texts)
+        return await aembed(texts, *args, **kwargs)
+
+    monkeypatch.setattr(engine, "get_embeddings", counting)
+    monkeypatch.setattr(engine, "get_embeddings_async", acounting)
+    return embedded
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_reingest_embeds_only_new_chunks(engine, monkeypatch, use_async):
+    small_chunks(engine)
+    embedded = count_embeddings(engine, monkeypatch)
+    first = reingest(engine, "a", document(*PARAGRAPHS[:2]), use_async)
+    version = engine.ingest_version
+    same = reingest(engine, "a", document(*PARAGRAPHS[:2]), use_async)
+    assert engine.ingest_version == version
+    grown = reingest(engine, "a", document(*PARAGRAPHS), use_async)
+
+    assert first == {"chunks": 2, "added": 2, "unchanged": 0, "removed": 0}
+    assert same == {"chunks": 2, "added": 0, "unchanged": 2, "removed": 0}
+    assert grown == {"chunks": 3, "added": 1, "unchanged": 2, "removed": 0}
+    assert embedded == PARAGRAPHS
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_reingest_removes_stale_chunks_everywhere(engine, use_async):
+    small_chunks(engine)
+    reingest(engine, "a", document(*PARAGRAPHS), use_async)
+    version = engine.ingest_version
+    counts = reingest(engine, "a", document(PARAGRAPHS[0], PARAGRAPHS[2]), use_async)
+
+    assert counts == {"chunks": 2, "added": 0, "unchanged": 2, "removed": 1}
+    assert engine.ingest_version > version
+    ids = engine.vector_store.list_ids("a#")
+    assert len(ids) == 2
+    assert sorted(chunk["text"] for chunk in engine.chunk_store.get_chunks(ids).values()) == [PARAGRAPHS[0], PARAGRAPHS[2]]
+    assert engine.chunk_store.stats() == {"documents": 1, "chunks": 2}
+    assert engine.lexical_index.search("bananas containers", 10) == []
+    assert PARAGRAPHS[1] not in [r["text"] for r in engine.search("bananas containers", reranker="none")]
+
+
+def test_delete_document_removes_it_from_one_collection(engine):
+    ingest(engine, "fruit", PARAGRAPHS[0])
+    ingest(engine, "fruit", PARAGRAPHS[1], collection="team-a")
+    version = engine.ingest_version
+
+    assert engine.delete_document("fruit", collection="team-a") == 1
+    assert engine.ingest_version > version
+    assert search_ids(engine, collection="team-a") == []
+    assert engine._lexical_for("team-a").search("bananas", 10) == []
+    assert search_ids(engine) == ["fruit"]
+    assert engine.chunk_store.stats() == {"documents": 1, "chunks": 1}
+    # Nothing left to delete
+    assert engine.delete_document("fruit", collection="team-a") == 0
+
+
+def test_text_upload_offsets_are_relative_to_the_whole_file(engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(extraction, "TEXT_BLOCK_CHARS", 500)
+    small_chunks(engine)
+    text = document(*(f"{i}: {PARAGRAPHS[i % 3]}" for i in range(40)))
+    path = tmp_path / "upload.txt"
+    path.write_text(text, encoding="utf-8")
+
+    metadata = {"doc_id": "upload", "title": "upload.txt", "source": "file_upload", "timestamp": 100.0}
+    counts = asyncio.run(engine.aingest_pages(extraction.iter_text_blocks(str(path)), metadata))
+
+    ids = engine.vector_store.list_ids("upload#")
+    vectors = engine.vector_store.fetch(ids)
+    chunks = engine.chunk_store.get_chunks(ids)
+    assert counts["chunks"] == len(ids) == 40
+    for vector_id in ids:
+        meta = vectors[vector_id]["metadata"]
+        assert text[meta["char_start"]:meta["char_end"]] == chunks[vector_id]["text"]
+
+
+def test_exact_repeat_is_answered_without_embedding(engine, monkeypatch):
+    ingest(engine, "a", PARAGRAPHS[0])
+    embedded = []
+    embed = engine.get_query_embedding_async
+
+    async def counting_embed(text):
+        embedded.append(text)
+        return await embed(text)
+
+    monkeypatch.setattr(engine, "get_query_embedding_async", counting_embed)
+    first = asyncio.run(engine.aanswer("When do apples ripen?"))
+    repeat = asyncio.run(engine.aanswer("  when do APPLES ripen "))
+    other_scope = asyncio.run(engine.aanswer("When do apples ripen?", collection="team-a"))
+
+    assert not first["cache_hit"] and repeat["cache_hit"] and not other_scope["cache_hit"]
+    assert repeat["answer"] == first["answer"]
+    assert embedded == ["When do apples ripen?", "When do apples ripen?"]
+
+
+def test_local_rerank_scores_the_stored_vectors(engine, monkeypatch):
+    small_chunks(engine)
+    ingest(engine, "a", document(*PARAGRAPHS))
+
+    def no_embedding(*args):
+        raise AssertionError("candidates were embedded again")
+
+    monkeypatch.setattr(engine, "get_embeddings", no_embedding)
+    monkeypatch.setattr(engine, "get_embeddings_async", no_embedding)
+    # top_k=1 leaves the other chunks to BM25, so their values come from the fetch
+    results = engine.search("cherries need a cold winter in spring", top_k=1, reranker="local")
+    async_results = asyncio.run(engine.asearch("cherries need a cold winter in spring", top_k=1, reranker="local"))
+
+    assert results[0]["text"] == PARAGRAPHS[2] and len(results) > 1
+    assert [r["text"] for r in async_results] == [r["text"] for r in results]
+
+
+def test_local_rerank_hydrates_only_the_results(engine, monkeypatch):
+    small_chunks(engine)
+    engine.rerank_top_n = 1
+    ingest(engine, "a", document(*PARAGRAPHS))
+    looked_up = []
+    get_chunks = engine.chunk_store.get_chunks
+
+    def counting(ids):
+        looked_up.append(len(ids))
+        return get_chunks(ids)
+
+    monkeypatch.setattr(engine.chunk_store, "get_chunks", counting)
+    results = engine.search("cherries need a cold winter", reranker="local")
+    async_results = asyncio.run(engine.asearch("cherries need a cold winter", reranker="local"))
+
+    assert [r["text"] for r in results] == [r["text"] for r in async_results] == [PARAGRAPHS[2]]
+    assert looked_up == [1, 1]
+
+
+def test_async_answer_keeps_sqlite_off_the_event_loop(offline_env, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_CACHE_PATH", str(offline_env / "embeddings.sqlite3"))
+    from rag_core import RAGEngine
+    engine = RAGEngine()
+    ingest(engine, "a", PARAGRAPHS[0])
+    on_loop = []
+
+    def record(obj, name):
+        method = getattr(obj, name)
+
+        def wrapper(*args):
+            if threading.current_thread() is threading.main_thread():
+                on_loop.append(name)
+            return method(*args)
+        monkeypatch.setattr(obj, name, wrapper)
+
+    record(engine.shared_state, "get_counter")
+    for name in ("get_many", "put_many"):
+        record(engine.embedding_cache, name)
+    for name in ("get_exact", "get", "put"):
+        record(engine.answer_cache, name)
+
+    asyncio.run(engine.aanswer("When do apples ripen?"))
+    asyncio.run(engine.aanswer("When do apples ripen?"))
+    assert on_loop == []
@@ -0,0 +1,185 @@
+import asyncio
+
+import pytest
+
+import resilience
+from resilience import CircuitBreaker, CircuitOpenError, ProviderGuard, SingleFlight
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+def fail(exc):
+    def call():
+        raise exc
+    return call
+
+
+def test_singleflight_coalesces_concurrent_identical_calls():
+    flight = SingleFlight()
+    calls = []
+
+    async def work(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return f"result {key}"
+
+    async def run():
+        concurrent = await asyncio.gather(*(flight.do("search", key, lambda key=key: work(key)) for key in ("a", "a", "a", "b")))
+        later = await flight.do("search", "a", lambda: work("a"))
+        return concurrent, later
+
+    concurrent, later = asyncio.run(run())
+    assert concurrent == [("result a", False), ("result a", True), ("result a", True), ("result b", False)]
+    assert later == ("result a", False)  # nothing is cached once the call finished
+    assert calls == ["a", "b", "a"]
+    assert flight.coalesced == {"search": 2}
+
+
+def test_singleflight_shares_the_exception():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("provider down")
+
+    async def run():
+        return await asyncio.gather(*(flight.do("search", "a", work) for _ in range(2)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert [str(r) for r in results] == ["provider down"] * 2
+
+
+def test_singleflight_cancels_the_call_only_when_every_caller_is_gone():
+    flight = SingleFlight()
+    started = []
+
+    async def work():
+        started.append(asyncio.current_task())
+        await asyncio.sleep(10)
+
+    async def run():
+        first = asyncio.ensure_future(flight.do("search", "a", work))
+        second = asyncio.ensure_future(flight.do("search", "a", work))
+        await asyncio.sleep(0.01)
+        call = started[0]
+
+        first.cancel()
+        await asyncio.sleep(0.01)
+        still_running = not call.done()
+
+        second.cancel()
+        await asyncio.sleep(0.01)
+        return still_running, call.cancelled()
+
+    still_running, cancelled = asyncio.run(run())
+    assert still_running and cancelled
+
+
+def test_disabled_singleflight_runs_every_call():
+    flight = SingleFlight(enabled=False)
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def run():
+        return await asyncio.gather(*(flight.do("search", "a", work) for _ in range(3)))
+
+    assert asyncio.run(run()) == [("result", False)] * 3
+    assert len(calls) == 3
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("openai", failure_threshold=3, reset_seconds=30.0)
+    for outcome in (False, False, True, False, False):
+        breaker.before_call()
+        breaker.record(outcome)
+    # A success in between resets the count
+    assert breaker.state == "closed"
+
+    breaker.before_call()
+    breaker.record(False)
+    assert breaker.state == "open" and breaker.times_opened == 1
+
+    clock.now += 10
+    with pytest.raises(CircuitOpenError) as rejected:
+        breaker.before_call()
+    assert rejected.value.retry_after == pytest.approx(20.0)
+    assert breaker.rejected == 1
+
+
+def test_half_open_breaker_lets_one_trial_through(clock):
+    breaker = CircuitBreaker("openai", failure_threshold=1, reset_seconds=30.0)
+    breaker.record(False)
+    clock.now += 30
+    assert breaker.state == "half_open"
+
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # only one trial at a time
+
+    breaker.record(True)
+    assert breaker.state == "closed" and breaker.failures == 0
+    breaker.before_call()
+
+
+def test_failed_trial_opens_the_breaker_again(clock):
+    breaker = CircuitBreaker("openai", failure_threshold=1, reset_seconds=30.0)
+    breaker.record(False)
+    clock.now += 30
+
+    breaker.before_call()
+    breaker.record(False)
+    assert breaker.state == "open" and breaker.times_opened == 2
+
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    clock.now += 1
+    breaker.before_call()
+    assert breaker.state == "half_open"
+
+
+def test_guard_does_not_count_rate_limiting_as_failure(clock):
+    guard = ProviderGuard(failure_threshold=2, reset_seconds=30.0)
+    for _ in range(5):
+        with pytest.raises(RateLimited):
+            guard.call("openai", "embed_query", fail(RateLimited()))
+    assert guard.breaker("openai").state == "closed"
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            guard.call("openai", "embed_query", fail(RuntimeError("boom")))
+    with pytest.raises(CircuitOpenError):
+        guard.call("openai", "embed_query", lambda: "never called")
+    assert guard.stats()["breakers"]["openai"] == {"state": "open", "failures": 2, "times_opened": 1, "rejected": 1}
+
+
+def test_guard_breaker_opens_on_async_timeouts():
+    guard = ProviderGuard(failure_threshold=1, reset_seconds=30.0)
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(guard.acall("cohere", "rerank_cohere", slow, timeout=0.01))
+    assert guard.breaker("cohere").state == "open"
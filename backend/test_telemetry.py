@@ -0,0 +1,43 @@
+import os
+import sys
+import subprocess
+
+WORKER = """
+from rag_core import RAGEngine
+from telemetry import register_engine, span, sync_engine_metrics, shutdown_metrics
+
+engine = RAGEngine()
+register_engine(engine)
+for _ in range(3):
+    with span("test_stage"):
+        pass
+engine.answer_cache.get("question", [1.0] * 256, 0)
+sync_engine_metrics()
+shutdown_metrics()
+"""
+
+SCRAPE = """
+from telemetry import metrics_payload
+print(metrics_payload().decode())
+"""
+
+
+def run(code, env):
+    backend = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, "-c", code], cwd=backend, env=env, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def test_metrics_are_combined_across_worker_processes(offline_env, monkeypatch):
+    from telemetry import prepare_multiprocess_metrics
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(offline_env / "prometheus"))
+    prepare_multiprocess_metrics(2, str(offline_env / "unused"))
+    env = {**os.environ}
+
+    run(WORKER, env)
+    run(WORKER, env)
+    metrics = run(SCRAPE, env).splitlines()
+
+    assert 'rag_stage_seconds_count{stage="test_stage"} 6.0' in metrics
+    assert 'rag_cache_lookups_total{cache="answer",result="miss"} 2.0' in metrics
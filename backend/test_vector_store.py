@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from pinecone import FetchResponse, QueryResponse, ScoredVector, Vector
+from pinecone.models.vectors.responses import ListItem, ListResponse
+
+from vector_store import PineconeVectorStore
+
+
+class FakeIndex:
+    """Answers like the Pinecone SDK's index handle, with its response types."""
+
+    def __init__(self, ids, page_size=2, list_strings=False):
+        self.vectors = {vector_id: Vector(id=vector_id, values=[1.0, 0.0], metadata={"doc_id": "a"}) for vector_id in ids}
+        self.page_size = page_size
+        self.list_strings = list_strings
+        self.fetched = []
+
+    def list(self, prefix, namespace=""):
+        ids = [vector_id for vector_id in self.vectors if vector_id.startswith(prefix)]
+        for i in range(0, len(ids), self.page_size):
+            page = ids[i:i + self.page_size]
+            yield page if self.list_strings else ListResponse(vectors=[ListItem(id=vector_id) for vector_id in page]).vectors
+
+    def upsert(self, vectors, namespace=""):
+        for vector in vectors:
+            self.vectors[vector["id"]] = Vector(id=vector["id"], values=list(vector["values"]), metadata=vector["metadata"])
+
+    def query(self, vector, top_k, include_metadata, include_values, filter=None, namespace=""):
+        q = np.asarray(vector) / np.linalg.norm(vector)
+        scored = sorted(((float(np.dot(q, v.values) / np.linalg.norm(v.values)), v) for v in self.vectors.values()),
+                        key=lambda pair: -pair[0])[:top_k]
+        return QueryResponse(matches=[
+            ScoredVector(id=v.id, score=score, values=v.values if include_values else [],
+                         metadata=v.metadata if include_metadata else None)
+            for score, v in scored
+        ])
+
+    def fetch(self, ids, namespace=""):
+        self.fetched.append(list(ids))
+        return FetchResponse(vectors={vector_id: self.vectors[vector_id] for vector_id in ids if vector_id in self.vectors})
+
+
+def pinecone_store(index):
+    store = PineconeVectorStore(get_client=None, index_name="test", dimension=2)
+    store.index = index
+    return store
+
+
+def test_pinecone_list_ids_returns_id_strings():
+    ids = [f"a#{i}" for i in range(5)]
+    assert pinecone_store(FakeIndex(ids + ["b#0"])).list_ids("a#") == ids
+    # Older SDKs yield the ids themselves
+    assert pinecone_store(FakeIndex(ids, list_strings=True)).list_ids("a#") == ids
+
+
+def test_pinecone_fetch_is_batched():
+    ids = [f"a#{i}" for i in range(250)]
+    index = FakeIndex(ids)
+    found = pinecone_store(index).fetch(ids + ["missing"], include_values=True)
+
+    assert [len(batch) for batch in index.fetched] == [100, 100, 51]
+    assert sorted(found) == sorted(ids)
+    assert found["a#7"] == {"id": "a#7", "metadata": {"doc_id": "a"}, "values": [1.0, 0.0]}
+    assert pinecone_store(index).fetch([]) == {}
+
+
+def test_pinecone_query_returns_plain_dicts():
+    index = FakeIndex(["a#0"])
+    index.vectors["b#0"] = Vector(id="b#0", values=[0.0, 1.0], metadata={"doc_id": "b"})
+    store = pinecone_store(index)
+
+    assert store.query([1.0, 0.2], top_k=1) == {"matches": [{"id": "a#0", "score": pytest.approx(0.98, abs=0.01), "metadata": {"doc_id": "a"}}]}
+    match = store.query([0.0, 1.0], top_k=1, include_values=True)["matches"][0]
+    assert match["values"] == [0.0, 1.0] and {**match}["id"] == "b#0"
+
+
+def test_engine_searches_pinecone_without_hybrid_search(offline_env, monkeypatch):
+    monkeypatch.setenv("HYBRID_SEARCH", "0")
+    from rag_core import RAGEngine
+    engine = RAGEngine()
+    engine.vector_store = pinecone_store(FakeIndex([]))
+    engine.ingest_document("Apples ripen in autumn.", {"doc_id": "a", "title": "a", "source": "text_input", "timestamp": 100.0})
+
+    for reranker in ("none", "local"):
+        assert [r["text"] for r in engine.search("apples", reranker=reranker)] == ["Apples ripen in autumn."]
@@ -0,0 +1,658 @@
+import os
+import json
+import asyncio
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+import numpy as np
+
+from shared_state import file_lock
+
+QUANTIZATIONS = ("none", "int8")
+# Rows scored per step when int8 rows are widened to float32 for a query
+SCORE_BLOCK_ROWS = 65536
+# Metadata filters whose matching rows LocalVectorStore keeps (per namespace)
+FILTER_CACHE_SIZE = 64
+
+_COMPARISONS = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$gt": lambda value, operand: value > operand,
+    "$gte": lambda value, operand: value >= operand,
+    "$lt": lambda value, operand: value < operand,
+    "$lte": lambda value, operand: value <= operand,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+}
+
+
+def matches_filter(metadata: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+    """Evaluates a Pinecone metadata filter against one vector's metadata.
+
+    Supports {"field": value}, {"field": {"$eq" | "$ne" | "$gt" | "$gte" |
+    "$lt" | "$lte" | "$in" | "$nin" | "$exists": operand}} and "$and" /
+    "$or" lists; several conditions in one dict must all hold.
+    """
+    if not filter:
+        return True
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, part) for part in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches_filter(metadata, part) for part in condition):
+                return False
+            continue
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for operator, operand in condition.items():
+            if operator == "$exists":
+                if (key in metadata) != bool(operand):
+                    return False
+                continue
+            if operator not in _COMPARISONS:
+                raise ValueError(f"Unsupported filter operator '{operator}'.")
+            if key not in metadata:
+                # Like Pinecone: a missing field only satisfies negative conditions
+                if operator not in ("$ne", "$nin"):
+                    return False
+                continue
+            try:
+                if not _COMPARISONS[operator](metadata[key], operand):
+                    return False
+            except TypeError:
+                return False
+    return True
+
+
+class VectorStore:
+    """Interface RAGEngine uses to talk to a vector database.
+
+    Query results mirror the Pinecone response shape:
+    {"matches": [{"id": ..., "score": ..., "metadata": {...}}, ...]}
+
+    Every operation takes a namespace: a separate set of vectors (a
+    collection) within the same index, "" being the default one. Ids only
+    need to be unique within a namespace.
+    """
+
+    def ensure_ready(self):
+        """Prepares the underlying index (create / open / load)."""
+        pass
+
+    def upsert(self, vectors: List[Dict[str, Any]], namespace: str = ""):
+        """Inserts or replaces vectors given as {"id", "values", "metadata"} dicts."""
+        raise NotImplementedError
+
+    def query(self, vector: List[float], top_k: int = 20, include_metadata: bool = True,
+              filter: Optional[Dict[str, Any]] = None, namespace: str = "",
+              include_values: bool = False) -> Dict[str, Any]:
+        """Returns the top_k most similar vectors by cosine similarity, among
+        those whose metadata matches filter (see matches_filter); with
+        include_values each match also carries its stored vector."""
+        raise NotImplementedError
+
+    def fetch(self, ids: List[str], namespace: str = "", include_values: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Returns {id: {"id", "metadata"}} for the ids that exist, plus
+        "values" (the stored vector) with include_values."""
+        raise NotImplementedError
+
+    def list_ids(self, prefix: str, namespace: str = "") -> List[str]:
+        """Returns the ids of all vectors whose id starts with prefix."""
+        raise NotImplementedError
+
+    def delete(self, ids: List[str], namespace: str = ""):
+        """Removes vectors by id; unknown ids are ignored."""
+        raise NotImplementedError
+
+    # Async variants run the blocking call on a worker thread so the event
+    # loop stays free; backends with native async clients can override them.
+
+    async def aupsert(self, vectors: List[Dict[str, Any]], namespace: str = ""):
+        return await asyncio.to_thread(self.upsert, vectors, namespace)
+
+    async def aquery(self, vector: List[float], top_k: int = 20, include_metadata: bool = True,
+                     filter: Optional[Dict[str, Any]] = None, namespace: str = "",
+                     include_values: bool = False) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.query, vector, top_k, include_metadata, filter, namespace, include_values)
+
+    async def afetch(self, ids: List[str], namespace: str = "", include_values: bool = False) -> Dict[str, Dict[str, Any]]:
+        return await asyncio.to_thread(self.fetch, ids, namespace, include_values)
+
+    async def alist_ids(self, prefix: str, namespace: str = "") -> List[str]:
+        return await asyncio.to_thread(self.list_ids, prefix, namespace)
+
+    async def adelete(self, ids: List[str], namespace: str = ""):
+        return await asyncio.to_thread(self.delete, ids, namespace)
+
+
+def _is_not_found(exc: Exception) -> bool:
+    """True for Pinecone's 404 errors across client versions."""
+    if getattr(exc, "status", None) == 404 or getattr(exc, "status_code", None) == 404:
+        return True
+    return type(exc).__name__ in ("NotFoundException", "NotFoundError")
+
+
+class PineconeVectorStore(VectorStore):
+    """Pinecone serverless index.
+
+    The index handle (and its HTTP connection pool) is resolved once and
+    reused; it is only re-resolved when an operation reports the index as
+    not found, e.g. after it was deleted and needs recreating. get_client
+    returns the Pinecone client and is only called once the index is needed.
+    """
+
+    def __init__(self, get_client: Callable[[], Any], index_name: str, dimension: int):
+        self.get_client = get_client
+        self.index_name = index_name
+        self.dimension = dimension
+        self.index = None
+        self._lock = threading.Lock()
+
+    def ensure_ready(self):
+        if self.index is not None:
+            return
+        with self._lock:
+            if self.index is None:
+                self.index = self._resolve()
+
+    def _resolve(self):
+        """Creates the Pinecone index if it doesn't exist and returns a handle to it."""
+        from pinecone import ServerlessSpec
+
+        pc = self.get_client()
+        existing_indexes = [i.name for i in pc.list_indexes()]
+        if self.index_name not in existing_indexes:
+            # Create index
+            pc.create_index(
+                name=self.index_name,
+                dimension=self.dimension,
+                metric="cosine",
+                spec=ServerlessSpec(cloud="aws", region="us-east-1") # defaulting to common region
+            )
+            # Wait for eventual consistency
+            while not pc.describe_index(self.index_name).status['ready']:
+                time.sleep(1)
+
+        description = pc.describe_index(self.index_name)
+        if description.dimension != self.dimension:
+            raise ValueError(
+                f"Pinecone index '{self.index_name}' has dimension {description.dimension}, "
+                f"but embeddings have {self.dimension}; use another PINECONE_INDEX_NAME or EMBEDDING_DIM."
+            )
+        # Connecting by host skips the per-handle describe_index lookup
+        return pc.Index(host=description.host)
+
+    def _call(self, operation):
+        """Runs operation(index), re-resolving the handle once if the index has gone missing."""
+        self.ensure_ready()
+        index = self.index
+        try:
+            return operation(index)
+        except Exception as e:
+            if not _is_not_found(e):
+                raise
+            with self._lock:
+                if self.index is index:
+                    self.index = None
+            self.ensure_ready()
+            return operation(self.index)
+
+    def upsert(self, vectors: List[Dict[str, Any]], namespace: str = ""):
+        # Batch upsert (Pinecone limit is usually 100-200 vectors per request)
+        batch_size = 100
+        for i in range(0, len(vectors), batch_size):
+            batch = vectors[i:i+batch_size]
+            self._call(lambda index: index.upsert(vectors=batch, namespace=namespace))
+
+    def query(self, vector: List[float], top_k: int = 20, include_metadata: bool = True,
+              filter: Optional[Dict[str, Any]] = None, namespace: str = "",
+              include_values: bool = False) -> Dict[str, Any]:
+        # Filtering and namespaces are applied inside Pinecone, before the similarity search
+        response = self._call(lambda index: index.query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=include_metadata,
+            include_values=include_values,
+            filter=filter,
+            namespace=namespace
+        ))
+        # Plain dicts like the local store's, so callers can copy and extend them
+        matches = []
+        for scored in response.matches:
+            match = {"id": scored.id, "score": scored.score}
+            if include_metadata:
+                match["metadata"] = dict(scored.metadata or {})
+            if include_values:
+                match["values"] = list(scored.values)
+            matches.append(match)
+        return {"matches": matches}
+
+    def fetch(self, ids: List[str], namespace: str = "", include_values: bool = False) -> Dict[str, Dict[str, Any]]:
+        # fetch is a GET with every id in the query string; batch to keep URLs short
+        batch_size = 100
+        found = {}
+        for i in range(0, len(ids), batch_size):
+            batch = ids[i:i+batch_size]
+            response = self._call(lambda index: index.fetch(ids=batch, namespace=namespace))
+            # Pinecone always returns the values; they are only passed on when asked for
+            for vector_id, vector in response.vectors.items():
+                found[vector_id] = {"id": vector_id, "metadata": dict(vector.metadata or {})}
+                if include_values:
+                    found[vector_id]["values"] = list(vector.values)
+        return found
+
+    def list_ids(self, prefix: str, namespace: str = "") -> List[str]:
+        # index.list pages through ids (serverless indexes only); newer SDKs
+        # yield ListItem objects, older ones plain id strings
+        return self._call(lambda index: [getattr(item, "id", item) for page in index.list(prefix=prefix, namespace=namespace)
+                                         for item in page])
+
+    def delete(self, ids: List[str], namespace: str = ""):
+        # Pinecone accepts up to 1000 ids per delete request
+        batch_size = 1000
+        for i in range(0, len(ids), batch_size):
+            batch = ids[i:i+batch_size]
+            self._call(lambda index: index.delete(ids=batch, namespace=namespace))
+
+
+class LocalVectorStore(VectorStore):
+    """In-process index backed by a memory-mapped matrix of vectors.
+
+    On-disk layout (all append-only, row i of each file describes the same vector):
+      - store.json     {"dimension": d, "quantization": "none" | "int8"}
+      - vectors.f32    raw float32 rows, L2-normalised at write time, or with
+        quantization="int8", vectors.i8: per row a float32 scale followed by
+        d int8 values (value * scale ~ the normalised float), 4x smaller
+      - records.jsonl  one {"id": ..., "metadata": {...}} line per row
+
+    Re-upserting an id appends a new row; the latest row for an id wins and
+    older rows are masked out at load time, so the files never need rewriting.
+    Deleting appends a tombstone row (zero vector, "deleted": true record).
+
+    Several worker processes can share one directory: appends happen under
+    an exclusive file lock (store.lock), and every operation first picks up
+    rows other processes appended since (a size check on records.jsonl).
+
+    With path=None nothing is persisted and rows live in a growable
+    in-memory matrix (VECTOR_STORE=memory; tests and benchmarks).
+
+    Other namespaces are separate LocalVectorStores under
+    collections/<namespace>/, opened on first use, so a scoped query only
+    scores that namespace's rows. Filtered queries score just the rows whose
+    metadata matches; the matching rows of recent filters are cached and
+    extended as rows are appended.
+    """
+
+    def __init__(self, path: Optional[str], dimension: int, quantization: str = "none"):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization '{quantization}'. Use one of {', '.join(QUANTIZATIONS)}.")
+        self.path = path
+        self.dimension = dimension
+        self.quantization = quantization
+        # One structured record per row, so both layouts memory-map the same way
+        if quantization == "int8":
+            self._row_dtype = np.dtype([("scale", "<f4"), ("values", "i1", (dimension,))])
+        else:
+            self._row_dtype = np.dtype([("values", "<f4", (dimension,))])
+        if path is not None:
+            self.vectors_path = os.path.join(path, "vectors.i8" if quantization == "int8" else "vectors.f32")
+            self.records_path = os.path.join(path, "records.jsonl")
+            self.header_path = os.path.join(path, "store.json")
+            self.lock_path = os.path.join(path, "store.lock")
+
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._matrix = np.empty(0, dtype=self._row_dtype)
+        self._ids: List[str] = []
+        self._metadata: List[Dict[str, Any]] = []
+        self._live = np.zeros(0, dtype=bool)
+        self._row_of: Dict[str, int] = {}
+        self._live_count = 0
+        # Bytes of records.jsonl reflected in memory
+        self._records_offset = 0
+        # Backing rows of the in-memory mode; _matrix is a view of the filled part
+        self._buffer = np.empty(0, dtype=self._row_dtype)
+        # filter (as JSON) -> (rows evaluated, matching row numbers); least recently used first
+        self._filter_rows_cache: "OrderedDict[str, Tuple[int, np.ndarray]]" = OrderedDict()
+        self._namespaces: Dict[str, "LocalVectorStore"] = {}
+        self._namespaces_lock = threading.Lock()
+
+    def namespace(self, name: str) -> "LocalVectorStore":
+        """The store holding namespace name ("" is this one)."""
+        if not name:
+            return self
+        with self._namespaces_lock:
+            store = self._namespaces.get(name)
+            if store is None:
+                path = os.path.join(self.path, "collections", name) if self.path is not None else None
+                store = self._namespaces[name] = LocalVectorStore(path, self.dimension, self.quantization)
+            return store
+
+    def namespaces(self) -> List[str]:
+        """Names of the non-default namespaces that hold (or held) vectors."""
+        names = set(self._namespaces)
+        collections_path = os.path.join(self.path, "collections") if self.path is not None else None
+        if collections_path is not None and os.path.isdir(collections_path):
+            names.update(os.listdir(collections_path))
+        return sorted(names)
+
+    def ensure_ready(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if not self._loaded:
+                self._load()
+                self._loaded = True
+
+    def _load(self):
+        if self.path is None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        with file_lock(self.lock_path):
+            self._load_locked()
+
+    def _load_locked(self):
+        if os.path.exists(self.header_path):
+            with open(self.header_path) as f:
+                header = json.load(f)
+            if header["dimension"] != self.dimension:
+                raise ValueError(
+                    f"Local index at {self.path} has dimension {header['dimension']}, "
+                    f"but the embedding model produces {self.dimension}."
+                )
+            # Indexes written before quantization existed hold float32 rows
+            if header.get("quantization", "none") != self.quantization:
+                raise ValueError(
+                    f"Local index at {self.path} uses quantization '{header.get('quantization', 'none')}', "
+                    f"but '{self.quantization}' is configured; re-ingest into a new LOCAL_INDEX_PATH."
+                )
+        else:
+            with open(self.header_path, "w") as f:
+                json.dump({"dimension": self.dimension, "quantization": self.quantization}, f)
+
+        records, offset = self._read_records(0)
+
+        row_bytes = self._row_dtype.itemsize
+        vector_rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        rows = min(len(records), vector_rows)
+
+        # Drop any partially written tail so both files line up again
+        if rows < len(records) or rows < vector_rows or offset < self._records_size():
+            records = records[:rows]
+            self._truncate(rows, [r[0] for r in records], [r[1] for r in records])
+            offset = self._records_size()
+
+        self._apply(records)
+        self._records_offset = offset
+
+    def _records_size(self) -> int:
+        return os.path.getsize(self.records_path) if os.path.exists(self.records_path) else 0
+
+    def _read_records(self, offset: int):
+        """Parses the complete records.jsonl lines after byte offset; returns
+        ([(id, metadata or None)], offset after the last complete line)."""
+        if not os.path.exists(self.records_path):
+            return [], offset
+        with open(self.records_path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1  # anything after it is a torn write from an interrupted append
+        records = []
+        for line in data[:end].splitlines():
+            record = json.loads(line)
+            records.append((record["id"], None if record.get("deleted") else record.get("metadata", {})))
+        return records, offset + end
+
+    def _apply(self, records: List[Tuple[str, Optional[Dict[str, Any]]]]):
+        """Adds rows that are already written (metadata None = tombstone) to the
+        in-memory bookkeeping; callers hold the lock."""
+        start = len(self._ids)
+        # New arrays, so query snapshots taken earlier stay consistent
+        live = np.concatenate([self._live, np.zeros(len(records), dtype=bool)])
+        for row, (vector_id, metadata) in enumerate(records, start=start):
+            previous = self._row_of.pop(vector_id, None)
+            if previous is not None:
+                live[previous] = False
+                self._live_count -= 1
+            if metadata is not None:
+                self._row_of[vector_id] = row
+                live[row] = True
+                self._live_count += 1
+            self._ids.append(vector_id)
+            self._metadata.append(metadata)
+        self._live = live
+        self._remap()
+
+    def _refresh(self):
+        """Picks up rows other processes appended; callers hold the lock."""
+        if self.path is None or self._records_size() == self._records_offset:
+            return
+        with file_lock(self.lock_path, shared=True):
+            self._refresh_locked()
+
+    def _truncate(self, rows: int, ids: List[str], metadata: List[Dict[str, Any]]):
+        if os.path.exists(self.vectors_path):
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(rows * self._row_dtype.itemsize)
+        with open(self.records_path, "w", encoding="utf-8") as f:
+            for vector_id, meta in zip(ids, metadata):
+                f.write(json.dumps(self._record(vector_id, meta)) + "\n")
+
+    @staticmethod
+    def _record(vector_id: str, metadata) -> Dict[str, Any]:
+        if metadata is None:
+            return {"id": vector_id, "deleted": True}
+        return {"id": vector_id, "metadata": metadata}
+
+    def _remap(self):
+        rows = len(self._ids)
+        if self.path is None:
+            self._matrix = self._buffer[:rows]
+        elif rows == 0:
+            self._matrix = np.empty(0, dtype=self._row_dtype)
+        else:
+            self._matrix = np.memmap(self.vectors_path, dtype=self._row_dtype, mode="r", shape=(rows,))
+
+    def _append(self, packed: np.ndarray, records: List[Tuple[str, Optional[Dict[str, Any]]]]):
+        """Writes packed rows (see _encode) after the current ones and applies
+        them; callers hold the lock."""
+        if self.path is None:
+            rows = len(self._ids)
+            needed = rows + len(packed)
+            if self._buffer.shape[0] < needed:
+                # Rows already handed out as query snapshots stay valid in the old buffer
+                grown = np.empty(max(needed, 2 * self._buffer.shape[0], 1024), dtype=self._row_dtype)
+                grown[:rows] = self._buffer[:rows]
+                self._buffer = grown
+            self._buffer[rows:needed] = packed
+            self._apply(records)
+            return
+
+        with file_lock(self.lock_path):
+            # Row numbers must line up with what other processes already appended
+            self._refresh_locked()
+            with open(self.vectors_path, "ab") as f:
+                # Drop vector bytes a crashed writer left without records
+                f.truncate(len(self._ids) * self._row_dtype.itemsize)
+                f.write(packed.tobytes())
+            with open(self.records_path, "ab") as f:
+                f.truncate(self._records_offset)
+                f.write("".join(json.dumps(self._record(*record)) + "\n" for record in records).encode("utf-8"))
+                self._records_offset = f.tell()
+            self._apply(records)
+
+    def _refresh_locked(self):
+        records, self._records_offset = self._read_records(self._records_offset)
+        if records:
+            self._apply(records)
+
+    def upsert(self, vectors: List[Dict[str, Any]], namespace: str = ""):
+        if namespace:
+            return self.namespace(namespace).upsert(vectors)
+        if not vectors:
+            return
+        self.ensure_ready()
+
+        values = np.asarray([v["values"] for v in vectors], dtype=np.float32)
+        if values.ndim != 2 or values.shape[1] != self.dimension:
+            raise ValueError(f"Expected vectors of dimension {self.dimension}, got {values.shape}.")
+        norms = np.linalg.norm(values, axis=1, keepdims=True)
+        values = values / np.maximum(norms, 1e-12)
+
+        with self._lock:
+            self._append(self._encode(values), [(v["id"], v.get("metadata", {})) for v in vectors])
+
+    def _encode(self, values: np.ndarray) -> np.ndarray:
+        """Packs normalised float32 vectors into rows of the store's layout."""
+        rows = np.empty(len(values), dtype=self._row_dtype)
+        if self.quantization == "int8":
+            # Symmetric per-row scale: the largest component maps to +-127
+            scale = np.abs(values).max(axis=1) / 127
+            scale[scale == 0] = 1.0
+            rows["scale"] = scale
+            rows["values"] = np.round(values / scale[:, None]).astype(np.int8)
+        else:
+            rows["values"] = values
+        return rows
+
+    def _scores(self, matrix: np.ndarray, q: np.ndarray) -> np.ndarray:
+        """Cosine similarity of q (normalised) with every row."""
+        if self.quantization != "int8":
+            return matrix["values"] @ q
+        # numpy has no fast int8 matmul: widen one block at a time to bound memory
+        scores = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), SCORE_BLOCK_ROWS):
+            block = matrix[start:start + SCORE_BLOCK_ROWS]
+            scores[start:start + len(block)] = (block["values"].astype(np.float32) @ q) * block["scale"]
+        return scores
+
+    def _decode(self, rows: np.ndarray) -> np.ndarray:
+        """The (normalised, for int8 approximate) float32 vectors of packed rows."""
+        if self.quantization == "int8":
+            return rows["values"].astype(np.float32) * rows["scale"][:, None]
+        return np.asarray(rows["values"], dtype=np.float32)
+
+    def nbytes(self) -> int:
+        """Bytes taken by the vector rows (live and superseded)."""
+        return len(self._ids) * self._row_dtype.itemsize
+
+    def query(self, vector: List[float], top_k: int = 20, include_metadata: bool = True,
+              filter: Optional[Dict[str, Any]] = None, namespace: str = "",
+              include_values: bool = False) -> Dict[str, Any]:
+        if namespace:
+            return self.namespace(namespace).query(vector, top_k, include_metadata, filter, include_values=include_values)
+        self.ensure_ready()
+
+        # Snapshot so a concurrent upsert can't change shapes mid-query
+        with self._lock:
+            self._refresh()
+            matrix, live, ids, metadata = self._matrix, self._live, self._ids, self._metadata
+            candidates = self._filter_rows(filter, len(ids)) if filter else None
+
+        q = np.asarray(vector, dtype=np.float32)
+        q = q / max(float(np.linalg.norm(q)), 1e-12)
+
+        if candidates is None:
+            count = int(live.sum())
+            if count == 0:
+                return {"matches": []}
+            scores = self._scores(matrix, q)
+            scores[~live] = -np.inf
+        else:
+            # Only the matching rows are read and scored
+            candidates = candidates[live[candidates]]
+            count = len(candidates)
+            if count == 0:
+                return {"matches": []}
+            scores = self._scores(matrix[candidates], q)
+
+        k = min(top_k, count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        rows = top if candidates is None else candidates[top]
+        matches = []
+        for i, row in zip(top, rows):
+            match = {"id": ids[row], "score": float(scores[i])}
+            if include_metadata:
+                match["metadata"] = metadata[row]
+            matches.append(match)
+        if include_values:
+            for match, vector in zip(matches, self._decode(matrix[rows])):
+                match["values"] = vector.tolist()
+        return {"matches": matches}
+
+    def _filter_rows(self, filter: Dict[str, Any], rows: int) -> np.ndarray:
+        """Row numbers below rows whose metadata matches filter (live or not);
+        callers hold the lock. Rows are only ever appended, so a cached result
+        is extended by evaluating just the new rows."""
+        key = json.dumps(filter, sort_keys=True)
+        evaluated, matched = self._filter_rows_cache.pop(key, (0, np.empty(0, dtype=np.int64)))
+        if evaluated > rows:
+            # Rows dropped at load time (a torn tail); start over
+            evaluated, matched = 0, np.empty(0, dtype=np.int64)
+        if evaluated < rows:
+            new = [row for row in range(evaluated, rows)
+                   if self._metadata[row] is not None and matches_filter(self._metadata[row], filter)]
+            matched = np.concatenate([matched, np.asarray(new, dtype=np.int64)])
+        self._filter_rows_cache[key] = (rows, matched)
+        if len(self._filter_rows_cache) > FILTER_CACHE_SIZE:
+            self._filter_rows_cache.popitem(last=False)
+        return matched
+
+    def fetch(self, ids: List[str], namespace: str = "", include_values: bool = False) -> Dict[str, Dict[str, Any]]:
+        if namespace:
+            return self.namespace(namespace).fetch(ids, include_values=include_values)
+        self.ensure_ready()
+        found = {}
+        with self._lock:
+            self._refresh()
+            rows = {vector_id: self._row_of[vector_id] for vector_id in ids if vector_id in self._row_of}
+            matrix = self._matrix
+            for vector_id, row in rows.items():
+                found[vector_id] = {"id": vector_id, "metadata": self._metadata[row]}
+        if include_values and rows:
+            values = self._decode(matrix[list(rows.values())])
+            for vector_id, vector in zip(rows, values):
+                found[vector_id]["values"] = vector.tolist()
+        return found
+
+    def list_ids(self, prefix: str, namespace: str = "") -> List[str]:
+        if namespace:
+            return self.namespace(namespace).list_ids(prefix)
+        self.ensure_ready()
+        with self._lock:
+            self._refresh()
+            return [vector_id for vector_id in self._row_of if vector_id.startswith(prefix)]
+
+    def delete(self, ids: List[str], namespace: str = ""):
+        if namespace:
+            return self.namespace(namespace).delete(ids)
+        self.ensure_ready()
+        with self._lock:
+            self._refresh()
+            ids = [vector_id for vector_id in dict.fromkeys(ids) if vector_id in self._row_of]
+            if not ids:
+                return
+            self._append(self._encode(np.zeros((len(ids), self.dimension), dtype=np.float32)),
+                         [(vector_id, None) for vector_id in ids])
+
+    def live_count(self) -> int:
+        """Live vectors in this store and the namespaces this process has opened,
+        as of their last operation; unlike len() it never reads from disk."""
+        with self._namespaces_lock:
+            namespaces = list(self._namespaces.values())
+        return self._live_count + sum(store._live_count for store in namespaces)
+
+    def __len__(self):
+        """Live vectors in all namespaces."""
+        count = int(self._live.sum())
+        for name in self.namespaces():
+            store = self.namespace(name)
+            store.ensure_ready()
+            count += int(store._live.sum())
+        return count
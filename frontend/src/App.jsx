@@ -34,18 +34,31 @@ function App() {
     setQuery('');
     setIsTyping(true);
 
+    // Index of the AI message being streamed into, once it exists
+    let aiIndex = null;
+    const updateAiMsg = (update) => {
+      setHistory(prev => prev.map((msg, idx) => (idx === aiIndex ? { ...msg, ...update(msg) } : msg)));
+    };
+
     try {
-      const res = await api.query(userMsg.content);
-      const aiMsg = {
-        role: 'ai',
-        content: res.answer,
-        citations: res.citations || [],
-        timing: res.timing
-      };
-      setHistory(prev => [...prev, aiMsg]);
+      await api.queryStream(userMsg.content, {
+        onCitations: ({ citations }) => {
+          setHistory(prev => {
+            aiIndex = prev.length;
+            return [...prev, { role: 'ai', content: '', citations: citations || [] }];
+          });
+        },
+        onToken: (text) => {
+          setIsTyping(false);
+          updateAiMsg(msg => ({ content: msg.content + text }));
+        },
+        onDone: ({ timings }) => {
+          updateAiMsg(() => ({ timing: timings.total }));
+        },
+      });
     } catch (err) {
       console.error(err);
-      const errorMessage = err.response?.data?.detail || "Failed to get an answer. Please check if the backend is running.";
+      const errorMessage = err.message || "Failed to get an answer. Please check if the backend is running.";
       setHistory(prev => [...prev, { role: 'error', content: errorMessage }]);
     } finally {
       setIsTyping(false);
@@ -22,5 +22,50 @@ export const api = {
   query: async (query) => {
     const response = await axios.post(`${API_URL}/query`, { query });
     return response.data;
+  },
+
+  // Consumes the Server-Sent Events from /query/stream. EventSource only
+  // supports GET, so the POST body is sent with fetch and the stream parsed here.
+  queryStream: async (query, { onCitations, onToken, onDone } = {}) => {
+    const response = await fetch(`${API_URL}/query/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ query }),
+    });
+    if (!response.ok) {
+      throw new Error(`Query failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    const handleFrame = (frame) => {
+      let event = 'message';
+      let data = '';
+      for (const line of frame.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      }
+      if (!data) return;
+      const payload = JSON.parse(data);
+
+      if (event === 'citations') onCitations?.(payload);
+      else if (event === 'token') onToken?.(payload.text);
+      else if (event === 'done') onDone?.(payload);
+      else if (event === 'error') throw new Error(payload.detail);
+    };
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        handleFrame(buffer.slice(0, boundary));
+        buffer = buffer.slice(boundary + 2);
+      }
+    }
   }
 };